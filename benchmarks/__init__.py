@@ -0,0 +1,3 @@
+"""
+Офлайн-бенчмарки: синтетические данные, локальный HTTP-сервер и замеры стадий.
+"""
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Офлайн-бенчмарк конвейера: генерирует синтетические данные, отдаёт их
+локальным HTTP-сервером и замеряет время и память каждой стадии.
+
+Пример запуска из корня проекта:
+    python -m benchmarks.run_benchmarks --report bench_report.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.server import SourceServer
+from benchmarks.synthetic import generate_dataset
+from fetchers import (
+    antifilter_fetcher,
+    bgp_fetcher,
+    github_fetcher,
+    tor_fetcher,
+    twitter_fetcher,
+)
+from fetchers.base import get_cached_prefixes
+from fetchers.registry import DEFAULT_SOURCES, KIND_ROUTES, set_sources, source_configs
+from network.budget import limit_routes
+from network.emitters import EMITTERS, write_emitted
+from network.exclude_index import load_exclude_index, save_exclude_index
+from network.prefix_array import DualPrefixArray, PrefixArrayType
+from network.processor import (
+    apply_excludes,
+    compile_excludes,
+    read_prefixes_from_list,
+    summarize_prefixes,
+)
+from network.writer import write_bird_routes
+
+# Путь на тестовом сервере для каждого источника
+SOURCE_PATHS = {
+    "aslist": "/aslist.txt",
+    "exclude": "/exclude.lst",
+    "bgptools": "/table.jsonl",
+    "tor": "/torlist/",
+    "manual": "/ext-manual.lst",
+    "antifilter_ipsum": "/ipsum.lst",
+    "antifilter_subnet": "/subnet.lst",
+    "twitter": "/twitter_ip_list.lst",
+}
+
+
+def point_fetchers_at(server: SourceServer):
+    """Перенаправляет все источники на локальный сервер."""
+    set_sources(
+        [
+            dict(source, url=server.url(SOURCE_PATHS[source["cache_key"]]))
+            for source in DEFAULT_SOURCES
+        ]
+    )
+
+
+class StageRecorder:
+    """Замеряет стадии и накапливает результаты для отчёта."""
+
+    def __init__(
+        self, trace_memory: bool, verbose: bool, server: Optional[SourceServer] = None
+    ):
+        self.trace_memory = trace_memory
+        self.verbose = verbose
+        self.server = server
+        self.stages = []  # type: List[Dict[str, Any]]
+
+    def run(self, name: str, func: Callable[[], Any], repeatable: bool = True) -> Any:
+        """
+        Выполняет стадию и записывает время и пиковую память. Повторяемые стадии
+        запускаются дважды: под tracemalloc для памяти и без него для времени.
+        """
+        peak = None
+        if self.trace_memory and repeatable:
+            gc.collect()
+            tracemalloc.start()
+            self._call(func)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        gc.collect()
+        sent_before = self.server.bytes_sent if self.server else 0
+        if self.trace_memory and not repeatable:
+            tracemalloc.start()
+        started = time.perf_counter()
+        result = self._call(func)
+        seconds = time.perf_counter() - started
+        if self.trace_memory and not repeatable:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        stage = {"stage": name, "seconds": round(seconds, 4)}
+        if peak is not None:
+            stage["peak_mb"] = round(peak / 2**20, 2)
+        if hasattr(result, "__len__"):
+            stage["items"] = len(result)
+        if self.server and self.server.bytes_sent != sent_before:
+            stage["bytes_downloaded"] = self.server.bytes_sent - sent_before
+        self.stages.append(stage)
+        print(
+            f"{name:<28} {seconds:9.3f}s"
+            + (f" {stage['peak_mb']:9.1f} MB" if peak is not None else "")
+            + (f" {stage['items']:>10} items" if "items" in stage else "")
+            + (
+                f" {stage['bytes_downloaded']:>10} bytes"
+                if "bytes_downloaded" in stage
+                else ""
+            )
+        )
+        return result
+
+    def _call(self, func: Callable[[], Any]) -> Any:
+        if self.verbose:
+            return func()
+        with contextlib.redirect_stdout(io.StringIO()):
+            return func()
+
+
+def fetch_all(as_list: Dict[int, str]) -> Dict[str, Callable[[], DualPrefixArray]]:
+    """Возвращает функции загрузки источников маршрутов по их именам."""
+    return {
+        "bgp.tools": lambda: bgp_fetcher.get_routes_from_bgptools(as_list),
+        "Tor": tor_fetcher.get_routes_from_tor,
+        "GitHub": github_fetcher.get_routes_from_github,
+        "antifilter": antifilter_fetcher.get_routes_from_antifilter,
+        "Twitter": twitter_fetcher.get_routes_from_twitter,
+    }
+
+
+def _write_fresh(prefixes: PrefixArrayType, output_file: str):
+    # Без прежнего файла запись не пропускается при повторном запуске стадии
+    if os.path.exists(output_file):
+        os.unlink(output_file)
+    write_bird_routes(prefixes, output_file)
+
+
+def _emit_fresh(emitter: str, prefixes: DualPrefixArray, output_file: str):
+    if os.path.exists(output_file):
+        os.unlink(output_file)
+    write_emitted(emitter, prefixes, output_file)
+
+
+def run_pipeline(args, recorder: StageRecorder, server: SourceServer):
+    """Выполняет все стадии конвейера на синтетических данных."""
+    sources = source_configs(KIND_ROUTES)
+    as_list = recorder.run(
+        "fetch:aslist", lambda: github_fetcher.get_as_list(None), repeatable=False
+    )
+
+    fetched = [
+        recorder.run(f"fetch:{name}", fetch, repeatable=False)
+        for name, fetch in fetch_all(as_list).items()
+    ]
+    excludes = recorder.run(
+        "fetch:exclude", lambda: github_fetcher.get_exclude_list(None), repeatable=False
+    )
+
+    # Повторная загрузка: все источники должны ответить 304 Not Modified
+    recorder.run(
+        "fetch:revalidate",
+        lambda: [fetch() for fetch in fetch_all(as_list).values()],
+        repeatable=False,
+    )
+
+    # Разбор текстовых списков, как при загрузке источника
+    lists = [
+        line
+        for key in ("manual", "antifilter_ipsum", "antifilter_subnet", "twitter")
+        for line in server.files[SOURCE_PATHS[key]].decode().splitlines()
+    ]
+    recorder.run("parse", lambda: read_prefixes_from_list(lists).unique())
+    # Чтение двоичного кэша всех источников маршрутов вместо разбора строк
+    recorder.run(
+        "cache:load",
+        lambda: [get_cached_prefixes(source["cache_key"]) for source in sources],
+    )
+    prefixes = recorder.run("merge", lambda: DualPrefixArray.merge(fetched))
+    exclude_index = recorder.run(
+        "parse:exclude", lambda: compile_excludes(excludes, "benchmark")
+    )
+    # Повторный запуск с тем же списком читает скомпилированный индекс
+    save_exclude_index(exclude_index)
+    recorder.run("cache:exclude", lambda: load_exclude_index("benchmark"))
+    routed = DualPrefixArray()
+    # Стадии обработки выполняются отдельно для каждого семейства адресов
+    for family, suffix, output_name in (
+        (prefixes.v4, "", "routes.txt"),
+        (prefixes.v6, ":v6", "routes6.txt"),
+    ):
+        exclude_ranges = exclude_index.family(family)
+        result = recorder.run(
+            f"exclude{suffix}",
+            lambda: apply_excludes(family, exclude_ranges, args.workers),
+        )
+        summarized = recorder.run(
+            f"summarize{suffix}", lambda: summarize_prefixes(result, args.workers)
+        )
+        if args.max_routes:
+            recorder.run(
+                f"budget{suffix}",
+                lambda: limit_routes(summarized, args.max_routes, exclude_ranges)[0],
+            )
+        output_file = os.path.join(args.workdir, output_name)
+        recorder.run(f"write{suffix}", lambda: _write_fresh(summarized, output_file))
+        routed.family(summarized).extend(summarized)
+
+    for emitter in sorted(EMITTERS):
+        output_file = os.path.join(args.workdir, f"routes.{emitter}")
+        recorder.run(
+            f"emit:{emitter}", lambda: _emit_fresh(emitter, routed, output_file)
+        )
+
+
+def compare_with_baseline(
+    stages: List[Dict[str, Any]], baseline_file: str, tolerance: float
+) -> bool:
+    """Сравнивает время стадий с базовым отчётом, возвращает False при регрессии."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+    ok = True
+    for stage in stages:
+        base = baseline.get(stage["stage"])
+        if not base or base["seconds"] <= 0:
+            continue
+        ratio = stage["seconds"] / base["seconds"]
+        if ratio > tolerance:
+            print(
+                f"Regression: {stage['stage']} took {stage['seconds']:.3f}s, "
+                f"baseline {base['seconds']:.3f}s (x{ratio:.2f})",
+                file=sys.stderr,
+            )
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк конвейера маршрутов.")
+    parser.add_argument("--table-prefixes", type=int, default=1000000)
+    parser.add_argument(
+        "--target-share",
+        type=float,
+        default=0.05,
+        help="Доля строк таблицы, принадлежащих AS из списка",
+    )
+    parser.add_argument("--antifilter-prefixes", type=int, default=150000)
+    parser.add_argument("--excludes", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Число процессов для исключений и суммаризации",
+    )
+    parser.add_argument(
+        "--max-routes",
+        type=int,
+        default=20000,
+        help="Ограничение числа маршрутов для стадии budget, 0 - не замерять",
+    )
+    parser.add_argument(
+        "--report", default="bench_report.json", help="Файл отчёта в формате JSON"
+    )
+    parser.add_argument("--baseline", help="Отчёт предыдущего запуска для сравнения")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.25,
+        help="Допустимое замедление стадии относительно базового отчёта",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Не замерять память (быстрее)"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Показывать вывод стадий"
+    )
+    parser.add_argument("--workdir", help="Рабочий каталог (по умолчанию: временный)")
+    args = parser.parse_args()
+
+    report_file = os.path.abspath(args.report)
+    baseline_file = os.path.abspath(args.baseline) if args.baseline else None
+    args.workdir = os.path.abspath(
+        args.workdir or tempfile.mkdtemp(prefix="antibl-bench-")
+    )
+    os.makedirs(args.workdir, exist_ok=True)
+
+    print("Generating synthetic data...")
+    started = time.perf_counter()
+    files = generate_dataset(
+        args.seed,
+        args.table_prefixes,
+        args.target_share,
+        args.antifilter_prefixes,
+        args.excludes,
+    )
+    size_mb = sum(map(len, files.values())) / 2**20
+    print(f"Generated {size_mb:.1f} MB in {time.perf_counter() - started:.1f}s")
+
+    server = SourceServer(files)
+    server.start()
+    point_fetchers_at(server)
+
+    # Кэш источников создаётся в рабочем каталоге, а не в каталоге проекта
+    cwd = os.getcwd()
+    os.chdir(args.workdir)
+    recorder = StageRecorder(not args.no_memory, args.verbose, server)
+    try:
+        run_pipeline(args, recorder, server)
+    finally:
+        os.chdir(cwd)
+        server.stop()
+
+    report = {
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "table_prefixes": args.table_prefixes,
+            "target_share": args.target_share,
+            "antifilter_prefixes": args.antifilter_prefixes,
+            "excludes": args.excludes,
+            "seed": args.seed,
+            "workers": args.workers,
+        },
+        "max_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "stages": recorder.stages,
+    }
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_file}")
+
+    if baseline_file and not compare_with_baseline(
+        recorder.stages, baseline_file, args.tolerance
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Модуль с локальным HTTP-сервером, заменяющим внешние источники в бенчмарках.
+"""
+
+import gzip
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+
+class SourceServer:
+    """
+    HTTP-сервер, отдающий заранее подготовленные файлы с поддержкой ETag
+    (ответ 304) и сжатия gzip. Считает число переданных байт.
+    """
+
+    def __init__(self, files: Dict[str, bytes]):
+        self.files = files
+        self.etags = {
+            path: f'"{hashlib.md5(body).hexdigest()}"' for path, body in files.items()
+        }
+        self._compressed = {}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def _gzipped(self, path: str) -> bytes:
+        with self._lock:
+            if path not in self._compressed:
+                self._compressed[path] = gzip.compress(self.files[path], 1)
+            return self._compressed[path]
+
+    def _make_handler(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path
+                if path not in owner.files:
+                    self.send_error(404)
+                    return
+                etag = owner.etags[path]
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                body = owner.files[path]
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = owner._gzipped(path)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with owner._lock:
+                    owner.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Запускает сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает сервер."""
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,168 @@
+"""
+Модуль для генерации синтетических входных данных в форматах источников.
+"""
+
+import json
+import random
+from typing import Dict, List, Tuple
+
+from network.intervals import Prefix
+from network.prefix_array import format_prefix, format_prefix6
+
+# Распределение длин префиксов, близкое к полной таблице BGP
+PREFIX_LENGTHS = [(24, 0.58), (23, 0.09), (22, 0.12), (21, 0.05), (20, 0.05)] + [
+    (length, 0.11 / 12) for length in range(8, 20)
+]
+
+# Распределение длин префиксов IPv6 в таблице BGP
+PREFIX_LENGTHS6 = [(48, 0.55), (32, 0.1), (44, 0.1), (40, 0.1), (36, 0.05)] + [
+    (length, 0.1 / 8) for length in range(29, 64, 5)
+]
+
+# ASN, маршруты которых попадают в выборку (как в aslist.txt)
+TARGET_ASNS = [8075, 13335, 14618, 15169, 16509, 32934, 62041]
+
+
+def random_prefix(rng: random.Random, prefixlen: int) -> Prefix:
+    """Возвращает случайный публичный префикс заданной длины."""
+    while True:
+        first_octet = rng.randint(1, 223)
+        if first_octet not in (10, 127):
+            break
+    addr = (first_octet << 24) | rng.getrandbits(24)
+    return addr & ~((1 << (32 - prefixlen)) - 1), prefixlen
+
+
+def random_prefix6(rng: random.Random, prefixlen: int) -> Prefix:
+    """Возвращает случайный префикс IPv6 заданной длины из блока 2000::/3."""
+    addr = (0x2 << 124) | rng.getrandbits(124)
+    return addr & ~((1 << (128 - prefixlen)) - 1), prefixlen
+
+
+def random_prefixes(rng: random.Random, count: int) -> List[Prefix]:
+    """Возвращает префиксы с распределением длин, как в таблице BGP."""
+    lengths = rng.choices(
+        [length for length, _ in PREFIX_LENGTHS],
+        weights=[weight for _, weight in PREFIX_LENGTHS],
+        k=count,
+    )
+    return [random_prefix(rng, length) for length in lengths]
+
+
+def generate_table(
+    rng: random.Random, count: int, target_share: float, v6_share: float = 0.1
+) -> Tuple[bytes, List[Prefix], List[Prefix]]:
+    """
+    Генерирует table.jsonl в формате bgp.tools. Доля target_share строк
+    принадлежит TARGET_ASNS, доля v6_share строк - префиксы IPv6.
+    Возвращает данные и IPv4- и IPv6-префиксы целевых AS.
+    """
+    lines = []
+    selected = []  # type: List[Prefix]
+    selected6 = []  # type: List[Prefix]
+    lengths6 = [length for length, _ in PREFIX_LENGTHS6]
+    weights6 = [weight for _, weight in PREFIX_LENGTHS6]
+    for addr, prefixlen in random_prefixes(rng, count):
+        is_v6 = rng.random() < v6_share
+        if is_v6:
+            addr, prefixlen = random_prefix6(
+                rng, rng.choices(lengths6, weights=weights6)[0]
+            )
+            cidr = format_prefix6(addr, prefixlen)
+        else:
+            cidr = format_prefix(addr, prefixlen)
+        if rng.random() < target_share:
+            asn = rng.choice(TARGET_ASNS)
+            (selected6 if is_v6 else selected).append((addr, prefixlen))
+        else:
+            asn = rng.randint(1, 400000)
+            while asn in TARGET_ASNS:
+                asn = rng.randint(1, 400000)
+        lines.append(
+            json.dumps({"CIDR": cidr, "ASN": asn, "Hits": rng.randint(1, 900)})
+        )
+    return "\n".join(lines).encode(), selected, selected6
+
+
+def generate_list(
+    prefixes: List[Prefix], bare_hosts: bool = False, prefixes6: List[Prefix] = ()
+) -> bytes:
+    """Формирует текстовый список подсетей (или адресов без /32 и /128)."""
+    lines = []
+    for addr, prefixlen in prefixes:
+        cidr = format_prefix(addr, prefixlen)
+        lines.append(cidr[:-3] if bare_hosts and prefixlen == 32 else cidr)
+    for addr, prefixlen in prefixes6:
+        cidr = format_prefix6(addr, prefixlen)
+        lines.append(cidr[:-4] if bare_hosts and prefixlen == 128 else cidr)
+    return ("\n".join(lines) + "\n").encode()
+
+
+def generate_excludes(
+    rng: random.Random, routes: List[Prefix], count: int
+) -> List[Prefix]:
+    """
+    Генерирует исключения: большая часть вложена в существующие маршруты,
+    остальные - случайные подсети.
+    """
+    excludes = []
+    for _ in range(count):
+        if routes and rng.random() < 0.8:
+            addr, prefixlen = rng.choice(routes)
+            sub_len = min(32, prefixlen + rng.randint(0, 8))
+            offset = rng.getrandbits(32 - prefixlen) if prefixlen < 32 else 0
+            addr = (addr | offset) & ~((1 << (32 - sub_len)) - 1)
+            excludes.append((addr, sub_len))
+        else:
+            excludes.append(random_prefix(rng, rng.randint(20, 32)))
+    return excludes
+
+
+def generate_excludes6(
+    rng: random.Random, routes: List[Prefix], count: int
+) -> List[Prefix]:
+    """То же, что generate_excludes, для префиксов IPv6."""
+    excludes = []
+    for _ in range(count):
+        if routes and rng.random() < 0.8:
+            addr, prefixlen = rng.choice(routes)
+            sub_len = min(128, prefixlen + rng.randint(0, 16))
+            offset = rng.getrandbits(128 - prefixlen) if prefixlen < 128 else 0
+            addr = (addr | offset) & ~((1 << (128 - sub_len)) - 1)
+            excludes.append((addr, sub_len))
+        else:
+            excludes.append(random_prefix6(rng, rng.randint(32, 64)))
+    return excludes
+
+
+def generate_dataset(
+    seed: int = 1,
+    table_prefixes: int = 1000000,
+    target_share: float = 0.05,
+    antifilter_prefixes: int = 150000,
+    exclude_count: int = 5000,
+) -> Dict[str, bytes]:
+    """Генерирует содержимое всех источников, ключ - путь на тестовом сервере."""
+    rng = random.Random(seed)
+    table, selected, selected6 = generate_table(rng, table_prefixes, target_share)
+
+    ipsum = [random_prefix(rng, 32) for _ in range(antifilter_prefixes * 9 // 10)]
+    subnets = random_prefixes(rng, antifilter_prefixes // 10)
+    tor = [random_prefix(rng, 32) for _ in range(8000)]
+    tor6 = [random_prefix6(rng, 128) for _ in range(2000)]
+    manual = random_prefixes(rng, 300)
+    twitter = random_prefixes(rng, 500)
+    excludes = generate_excludes(rng, selected + subnets + manual, exclude_count)
+    excludes6 = generate_excludes6(rng, selected6, exclude_count // 10)
+
+    as_list = "".join(f"{asn} # synthetic\n" for asn in TARGET_ASNS)
+    return {
+        "/table.jsonl": table,
+        "/ipsum.lst": generate_list(ipsum),
+        "/subnet.lst": generate_list(subnets),
+        "/torlist/": generate_list(tor, bare_hosts=True, prefixes6=tor6),
+        "/ext-manual.lst": generate_list(manual),
+        "/twitter_ip_list.lst": generate_list(twitter),
+        "/exclude.lst": generate_list(excludes, prefixes6=excludes6),
+        "/aslist.txt": as_list.encode(),
+    }
@@ -0,0 +1,129 @@
+"""
+Модуль для работы с BIRD через управляющий UNIX-сокет.
+"""
+
+import re
+import socket
+from collections import namedtuple
+from typing import Optional
+
+DEFAULT_SOCKET = "/run/bird/bird.ctl"
+
+# Коды ответов BIRD (doc/reply_codes в исходниках BIRD)
+CODE_WELCOME = 1
+CODE_RECONFIGURED = 3
+CODE_RECONFIG_IN_PROGRESS = 4
+CODE_RECONFIG_QUEUED = 5
+
+# Коды, означающие успешный запуск переконфигурации
+CONFIGURE_SUCCESS_CODES = {
+    CODE_RECONFIGURED,
+    CODE_RECONFIG_IN_PROGRESS,
+    CODE_RECONFIG_QUEUED,
+}
+
+BirdReply = namedtuple("BirdReply", ["code", "lines"])
+
+_LINE_PATTERN = re.compile(r"^(\d{4})([ -])(.*)$")
+
+
+class BirdError(Exception):
+    """Ошибка, которую вернул BIRD (коды 8000-9999) или нарушение протокола."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"BIRD error {code:04d}: {message}")
+        self.code = code
+        self.message = message
+
+
+class BirdClient:
+    """Клиент управляющего протокола BIRD."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: float = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def connect(self):
+        """Подключается к сокету и читает приветствие BIRD."""
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(self.timeout)
+        try:
+            self._sock.connect(self.socket_path)
+            self._reader = self._sock.makefile("rb")
+            welcome = self._read_reply()
+        except BaseException:
+            self.close()
+            raise
+        if welcome.code != CODE_WELCOME:
+            self.close()
+            raise BirdError(welcome.code, "unexpected greeting")
+
+    def close(self):
+        """Закрывает соединение."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _read_reply(self) -> BirdReply:
+        """Читает ответ до завершающей строки вида 'DDDD текст'."""
+        lines = []
+        code = None
+        while True:
+            raw = self._reader.readline()
+            if not raw:
+                raise BirdError(code or 0, "connection closed by BIRD")
+            line = raw.decode("utf-8", errors="replace").rstrip("\n")
+            if line.startswith("+"):
+                # Асинхронные уведомления не относятся к ответу на команду
+                continue
+            if line.startswith(" "):
+                # Продолжение предыдущей строки с тем же кодом
+                lines.append(line[1:])
+                continue
+            match = _LINE_PATTERN.match(line)
+            if not match:
+                raise BirdError(code or 0, f"malformed reply line: {line!r}")
+            code = int(match.group(1))
+            lines.append(match.group(3))
+            if match.group(2) == " ":
+                return BirdReply(code, lines)
+
+    def command(self, command: str) -> BirdReply:
+        """Отправляет команду и возвращает ответ. Коды ошибок вызывают BirdError."""
+        if self._sock is None:
+            self.connect()
+        self._sock.sendall(f"{command}\n".encode("utf-8"))
+        reply = self._read_reply()
+        if reply.code >= 8000:
+            raise BirdError(reply.code, "\n".join(reply.lines))
+        return reply
+
+    def configure(self, check_only: bool = False) -> BirdReply:
+        """Перечитывает конфигурацию BIRD ('configure' или 'configure check')."""
+        return self.command("configure check" if check_only else "configure")
+
+    def route_count(self, table: Optional[str] = None) -> int:
+        """Возвращает число маршрутов (во всех таблицах или в указанной)."""
+        command = "show route count"
+        if table:
+            command += f" table {table}"
+        reply = self.command(command)
+        return sum(_parse_route_count(line) for line in reply.lines)
+
+
+def _parse_route_count(line: str) -> int:
+    """Извлекает число маршрутов из строки '12 of 12 routes for 12 networks ...'."""
+    match = re.match(r"\s*(\d+) of \d+ routes", line)
+    return int(match.group(1)) if match else 0
@@ -2,32 +2,110 @@
 Модуль для управления BIRD.
 """
 
-import subprocess
+import os
 import sys
+import time
+from typing import Optional
 
+from core.bird_client import (
+    CONFIGURE_SUCCESS_CODES,
+    DEFAULT_SOCKET,
+    BirdClient,
+    BirdError,
+)
+from utils.cache import ensure_cache_dir
+from utils.file_utils import get_file_hash, write_file_atomic
+from utils.metrics import set_metric
 
-def apply_bird_configuration():
-    """Применяет изменения в конфигурации BIRD."""
+# Хеш файла маршрутов, который был успешно применён в BIRD последним
+APPLIED_HASH_FILE = os.path.join(".cache", "bird_applied.md5")
+
+
+def get_applied_hash() -> str:
+    """Возвращает хеш файла маршрутов, применённого в BIRD последним."""
+    if not os.path.exists(APPLIED_HASH_FILE):
+        return ""
+    try:
+        with open(APPLIED_HASH_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except (IOError, OSError) as e:
+        print(f"Warning: Could not read {APPLIED_HASH_FILE}: {e}", file=sys.stderr)
+        return ""
+
+
+def save_applied_hash(file_hash: str):
+    """Запоминает хеш файла маршрутов, успешно применённого в BIRD."""
+    ensure_cache_dir()
+    try:
+        write_file_atomic(APPLIED_HASH_FILE, [f"{file_hash}\n"])
+    except (IOError, OSError) as e:
+        print(f"Warning: Could not write {APPLIED_HASH_FILE}: {e}", file=sys.stderr)
+
+
+def apply_bird_configuration(socket_path: str = DEFAULT_SOCKET) -> bool:
+    """Применяет изменения в конфигурации BIRD через управляющий сокет."""
+    started = time.monotonic()
+    success = _apply_bird_configuration(socket_path)
+    set_metric("antibl_bird_apply_success", int(success))
+    set_metric("antibl_bird_apply_duration_seconds", time.monotonic() - started)
+    return success
+
+
+def _apply_bird_configuration(socket_path: str) -> bool:
     print("Applying changes to BIRD configuration...")
     try:
-        # Проверяем, существует ли команда birdc
-        result = subprocess.run(["which", "birdc"], capture_output=True, text=True)
-        if result.returncode != 0:
-            print(
-                "Warning: birdc command not found. Skipping BIRD configuration reload.",
-                file=sys.stderr,
-            )
-            return False
-
-        subprocess.run(["birdc", "configure"], check=True)
-        print("Successfully reloaded BIRD configuration.")
-        return True
-    except subprocess.CalledProcessError as e:
+        with BirdClient(socket_path) as client:
+            reply = client.configure()
+            message = reply.lines[-1] if reply.lines else ""
+            if reply.code not in CONFIGURE_SUCCESS_CODES:
+                print(
+                    f"Error reloading BIRD configuration: {reply.code:04d} {message}",
+                    file=sys.stderr,
+                )
+                return False
+            print(f"Successfully reloaded BIRD configuration: {message}")
+
+            # Проверяем число маршрутов после применения
+            try:
+                route_count = client.route_count()
+                set_metric("antibl_bird_routes", route_count)
+                print(f"BIRD now has {route_count} routes.")
+            except BirdError as e:
+                print(f"Warning: Could not query route count: {e}", file=sys.stderr)
+            return True
+    except BirdError as e:
         print(f"Error reloading BIRD configuration: {e}", file=sys.stderr)
         return False
     except FileNotFoundError:
         print(
-            "Error: birdc command not found. Please install BIRD routing daemon.",
+            f"Error: BIRD control socket {socket_path} not found. "
+            "Is the BIRD routing daemon running?",
             file=sys.stderr,
         )
         return False
+    except OSError as e:
+        print(f"Error talking to BIRD at {socket_path}: {e}", file=sys.stderr)
+        return False
+
+
+def apply_routes_file(
+    routes_file: str,
+    socket_path: str = DEFAULT_SOCKET,
+    routes6_file: Optional[str] = None,
+) -> bool:
+    """
+    Применяет файл маршрутов в BIRD, если он (или файл маршрутов IPv6)
+    изменился с последнего применения. Возвращает False только при ошибке
+    применения.
+    """
+    routes_hash = get_file_hash(routes_file)
+    if routes6_file:
+        routes_hash = f"{routes_hash},{get_file_hash(routes6_file)}"
+    if routes_hash and routes_hash == get_applied_hash():
+        print("Routes unchanged since last apply, skipping BIRD reconfiguration.")
+        set_metric("antibl_bird_apply_skipped", 1)
+        return True
+    if not apply_bird_configuration(socket_path):
+        return False
+    save_applied_hash(routes_hash)
+    return True
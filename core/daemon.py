@@ -0,0 +1,333 @@
+"""
+Модуль фонового режима: источники обновляются по собственным расписаниям,
+а итоговый список пересобирается только при изменении какого-либо источника.
+"""
+
+import signal
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from core.bird_client import DEFAULT_SOCKET
+from core.bird_manager import apply_routes_file
+from core.route_collector import (
+    FETCH_DEADLINE,
+    SOURCE_TIMEOUT,
+    fetch_sources,
+    get_sources,
+    save_index,
+    write_emitters,
+    write_routes,
+)
+from fetchers.github_fetcher import get_as_list, get_exclude_index
+from fetchers.registry import KIND_AS_LIST, KIND_EXCLUDE, source_configs
+from network.emitters import DEFAULT_SET_NAME
+from network.history import DEFAULT_HISTORY_SIZE
+from network.intervals import Range
+from network.prefix_array import DualPrefixArray
+from network.route_index import RouteIndex
+from network.processor import (
+    apply_excludes,
+    apply_route_budget,
+    stage_name,
+    summarize_prefixes,
+)
+from network.writer import DEFAULT_ROUTE_ACTION
+from utils.metrics import set_metric, stage_timer, write_metrics
+
+# Пауза перед повтором неудавшегося применения маршрутов в BIRD, в секундах
+APPLY_RETRY_INTERVAL = 30.0
+
+
+def default_intervals() -> Dict[str, float]:
+    """Интервалы обновления из описаний источников: ключ кэша -> секунды."""
+    return {source["cache_key"]: source["interval"] for source in source_configs()}
+
+
+class RouteDaemon:
+    """
+    Держит в памяти разобранные маршруты каждого источника и их часть,
+    оставшуюся после исключений. Изменившийся источник пересчитывается
+    отдельно, после чего итоговый список перезаписывается и BIRD перечитывает
+    конфигурацию.
+    """
+
+    def __init__(
+        self,
+        output_file: str,
+        as_list_file: Optional[str] = None,
+        exclude_file: Optional[str] = None,
+        summarize: bool = False,
+        apply: bool = False,
+        bird_socket: str = DEFAULT_SOCKET,
+        intervals: Optional[Dict[str, float]] = None,
+        source_timeout: float = SOURCE_TIMEOUT,
+        deadline: float = FETCH_DEADLINE,
+        metrics_textfile: Optional[str] = None,
+        metrics_json: Optional[str] = None,
+        route_action: str = DEFAULT_ROUTE_ACTION,
+        route_comments: bool = False,
+        output6_file: Optional[str] = None,
+        index_file: Optional[str] = None,
+        history_size: int = DEFAULT_HISTORY_SIZE,
+        workers: int = 1,
+        emit: Optional[Dict[str, str]] = None,
+        set_name: str = DEFAULT_SET_NAME,
+        max_routes: int = 0,
+    ):
+        self.output_file = output_file
+        self.output6_file = output6_file
+        self.index_file = index_file
+        self.history_size = history_size
+        self.workers = workers
+        self.emit = emit or {}
+        self.set_name = set_name
+        self.max_routes = max_routes
+        self.as_list_file = as_list_file
+        self.exclude_file = exclude_file
+        self.summarize = summarize
+        self.apply = apply
+        self.bird_socket = bird_socket
+        self.intervals = default_intervals()
+        self.intervals.update(intervals or {})
+        self._as_list_keys = {s["cache_key"] for s in source_configs(KIND_AS_LIST)}
+        self._exclude_keys = {s["cache_key"] for s in source_configs(KIND_EXCLUDE)}
+        self.source_timeout = source_timeout
+        self.deadline = deadline
+        self.metrics_textfile = metrics_textfile
+        self.metrics_json = metrics_json
+        self.route_action = route_action
+        self.route_comments = route_comments
+
+        self._as_list = {}  # type: Dict[int, str]
+        # Диапазоны исключений IPv4 и IPv6
+        self._exclude_ranges = ([], [])  # type: Tuple[List[Range], List[Range]]
+        # Ключ кэша источника -> разобранные префиксы и префиксы после исключений
+        self._parsed = {}  # type: Dict[str, DualPrefixArray]
+        self._contrib = {}  # type: Dict[str, DualPrefixArray]
+        # Последний сохранённый индекс маршрутов для журнала изменений
+        self._route_index = None  # type: Optional[RouteIndex]
+        self._next_refresh = {key: 0.0 for key in self.intervals}
+        # Время повтора применения маршрутов в BIRD после ошибки
+        self._apply_retry_at = None  # type: Optional[float]
+        self._wake = threading.Event()
+        self._stopping = False
+
+    def refresh_all(self):
+        """Запрашивает обновление всех источников при следующей проверке."""
+        for key in self._next_refresh:
+            self._next_refresh[key] = 0.0
+        self._wake.set()
+
+    def stop(self):
+        """Останавливает цикл обновления."""
+        self._stopping = True
+        self._wake.set()
+
+    def _refresh_as_list(self) -> bool:
+        as_list = get_as_list(self.as_list_file)
+        if not as_list:
+            print("Warning: Empty AS list, keeping the previous one", file=sys.stderr)
+            return False
+        if set(as_list) == set(self._as_list):
+            return False
+        self._as_list = as_list
+        return True
+
+    def _refresh_excludes(self) -> bool:
+        ranges = get_exclude_index(self.exclude_file).ranges
+        if not any(ranges) and any(self._exclude_ranges):
+            print(
+                "Warning: Empty exclude list, keeping the previous one",
+                file=sys.stderr,
+            )
+            return False
+        if ranges == self._exclude_ranges:
+            return False
+        self._exclude_ranges = ranges
+        return True
+
+    def _exclude(self, prefixes: DualPrefixArray) -> DualPrefixArray:
+        return DualPrefixArray(
+            *(
+                apply_excludes(family, ranges, self.workers)
+                for family, ranges in zip(prefixes, self._exclude_ranges)
+            )
+        )
+
+    def _update_source(self, key: str, prefixes: DualPrefixArray) -> bool:
+        """Пересчитывает вклад источника, если его данные изменились."""
+        if not prefixes and self._parsed.get(key):
+            print(
+                f"Warning: {key} returned no routes, keeping the previous data",
+                file=sys.stderr,
+            )
+            return False
+        if key in self._parsed and prefixes == self._parsed[key]:
+            return False
+        self._parsed[key] = prefixes
+        self._contrib[key] = self._exclude(self._parsed[key])
+        print(f"Source {key} changed: {len(self._contrib[key])} prefixes.")
+        return True
+
+    def cycle(self) -> bool:
+        """
+        Обновляет источники, срок обновления которых наступил.
+        Возвращает True, если итоговый список был пересобран.
+        """
+        now = time.monotonic()
+        due = {key for key, at in self._next_refresh.items() if at <= now}
+        if not due:
+            self._retry_apply()
+            return False
+        for key in due:
+            self._next_refresh[key] = now + self.intervals[key]
+
+        # Маршруты bgp.tools зависят от списка AS. При его изменении маршруты
+        # выбираются из индекса таблицы, а сама таблица запрашивается только
+        # по своему расписанию
+        scheduled = set(due)
+        if due & self._as_list_keys and self._refresh_as_list():
+            due.update(
+                source["cache_key"]
+                for source in source_configs()
+                if source["parser"] == "bgptools"
+            )
+        excludes_changed = bool(due & self._exclude_keys) and self._refresh_excludes()
+
+        sources = [src for src in get_sources(self._as_list) if src[1] in scheduled]
+        unscheduled = due - scheduled
+        if unscheduled:
+            # Индекс таблицы не старше интервала её обновления
+            max_age = max(self.intervals[key] for key in unscheduled)
+            sources += [
+                src
+                for src in get_sources(self._as_list, max_age)
+                if src[1] in unscheduled
+            ]
+        keys = {name: key for name, key, _ in sources}
+        updated = set()
+        if sources:
+            with stage_timer("fetch"):
+                fetched = fetch_sources(sources, self.source_timeout, self.deadline)
+            for name, routes in fetched:
+                if self._update_source(keys[name], routes):
+                    updated.add(keys[name])
+
+        # Обновлённые источники уже посчитаны с новым списком исключений
+        stale = set(self._parsed) - updated if excludes_changed else set()
+        if stale:
+            print("Exclude list changed, recomputing other sources...")
+            with stage_timer("exclude"):
+                for key in stale:
+                    self._contrib[key] = self._exclude(self._parsed[key])
+
+        changed = bool(updated or stale)
+        if changed:
+            self._publish()
+        else:
+            self._retry_apply()
+        return changed
+
+    def _publish(self):
+        """
+        Объединяет вклады источников, записывает файлы и индекс маршрутов
+        и применяет их в BIRD.
+        """
+        result = DualPrefixArray.merge(self._contrib.values())
+        outputs = ((result.v4, self.output_file), (result.v6, self.output6_file))
+        commented = self._parsed if self.route_comments else None
+        written = False
+        routed = DualPrefixArray()
+        for (prefixes, output_file), exclude_ranges in zip(
+            outputs, self._exclude_ranges
+        ):
+            if not output_file:
+                continue
+            set_metric(
+                "antibl_routes_after_exclude", len(prefixes), family=prefixes.FAMILY
+            )
+            if self.summarize:
+                with stage_timer(stage_name("summarize", prefixes)):
+                    prefixes = summarize_prefixes(prefixes, self.workers)
+            if self.max_routes:
+                prefixes = apply_route_budget(prefixes, self.max_routes, exclude_ranges)
+            if not prefixes:
+                print(f"Warning: No routes to write to {output_file}", file=sys.stderr)
+                continue
+            write_routes(prefixes, output_file, self.route_action, commented)
+            routed.family(prefixes).extend(prefixes)
+            written = True
+
+        if self.emit and written:
+            write_emitters(routed, self.emit, self.set_name)
+        if self.index_file and written:
+            index = save_index(
+                routed,
+                self._parsed,
+                self.index_file,
+                self.history_size,
+                self._route_index,
+            )
+            self._route_index = index or self._route_index
+
+        if self.apply and written:
+            self._apply_routes()
+
+    def _apply_routes(self):
+        """
+        Применяет файлы маршрутов в BIRD. При ошибке назначает повтор, иначе
+        BIRD остался бы со старыми маршрутами до изменения какого-либо источника.
+        """
+        if apply_routes_file(self.output_file, self.bird_socket, self.output6_file):
+            self._apply_retry_at = None
+            return
+        self._apply_retry_at = time.monotonic() + APPLY_RETRY_INTERVAL
+        print(
+            f"Warning: Could not apply routes to BIRD, "
+            f"retrying in {APPLY_RETRY_INTERVAL:.0f}s",
+            file=sys.stderr,
+        )
+
+    def _retry_apply(self):
+        """Повторяет неудавшееся применение маршрутов, если подошёл срок."""
+        if (
+            self._apply_retry_at is not None
+            and self._apply_retry_at <= time.monotonic()
+        ):
+            print("Retrying BIRD reconfiguration...")
+            self._apply_routes()
+
+    def _next_wait(self) -> float:
+        wake_at = min(self._next_refresh.values())
+        if self._apply_retry_at is not None:
+            wake_at = min(wake_at, self._apply_retry_at)
+        return max(0.0, wake_at - time.monotonic())
+
+    def run_forever(self):
+        """Выполняет цикл обновления до сигнала SIGTERM или SIGINT."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+            signal.signal(signal.SIGINT, lambda *_: self.stop())
+            signal.signal(signal.SIGHUP, lambda *_: self.refresh_all())
+
+        print(f"Daemon started, writing routes to {self.output_file}.")
+        while not self._stopping:
+            started = time.time()
+            success = True
+            try:
+                changed = self.cycle()
+            except Exception as e:
+                print(f"Error during refresh: {e}", file=sys.stderr)
+                changed, success = True, False
+
+            if changed and (self.metrics_textfile or self.metrics_json):
+                set_metric("antibl_run_success", int(success))
+                set_metric("antibl_run_duration_seconds", time.time() - started)
+                set_metric("antibl_last_run_timestamp_seconds", int(started))
+                write_metrics(self.metrics_textfile, self.metrics_json)
+
+            self._wake.wait(self._next_wait())
+            self._wake.clear()
+        print("Daemon stopped.")
@@ -4,17 +4,108 @@
 
 import os
 import sys
+import threading
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from fetchers.bgp_fetcher import get_routes_from_bgptools
-from fetchers.tor_fetcher import get_routes_from_tor
-from fetchers.github_fetcher import (
-    get_routes_from_github,
-    get_exclude_list,
-    get_as_list,
+from fetchers.base import fetch_prefixes, get_cached_prefixes
+from fetchers.github_fetcher import get_exclude_index, get_as_list
+from fetchers.registry import KIND_ROUTES, source_configs
+from network.emitters import DEFAULT_SET_NAME, write_emitted
+from network.prefix_array import DualPrefixArray, PrefixArray6, PrefixArrayType
+from network.processor import process_dual_prefixes, stage_name
+from network.history import DEFAULT_HISTORY_SIZE, history_dir, write_changelog
+from network.route_index import (
+    RouteIndex,
+    build_route_index,
+    load_route_index,
+    save_route_index,
 )
-from fetchers.antifilter_fetcher import get_routes_from_antifilter
-from fetchers.twitter_fetcher import get_routes_from_twitter
-from network.processor import process_networks_in_memory
+from network.writer import DEFAULT_ROUTE_ACTION, write_bird_routes
+from utils.metrics import CACHE_FALLBACK, record_source, set_metric, stage_timer
+
+# Время ожидания одного источника и всей стадии загрузки, в секундах
+SOURCE_TIMEOUT = 30
+FETCH_DEADLINE = 60
+
+
+def fetch_sources(
+    sources: List[Tuple[str, str, Callable[[], DualPrefixArray]]],
+    source_timeout: float = SOURCE_TIMEOUT,
+    deadline: float = FETCH_DEADLINE,
+) -> List[Tuple[str, DualPrefixArray]]:
+    """
+    Загружает источники параллельно. Источник, не уложившийся в свой срок
+    или в общий срок загрузки, заменяется данными из кэша.
+    """
+    started = time.monotonic()
+    results = {}
+    timings = {}
+    done = {}
+
+    def run(name: str, fetch: Callable[[], DualPrefixArray]):
+        try:
+            results[name] = fetch()
+        except Exception as e:
+            print(f"Error fetching routes from {name}: {e}", file=sys.stderr)
+        finally:
+            timings[name] = time.monotonic() - started
+            done[name].set()
+
+    # Потоки-демоны не задерживают завершение программы после общего срока
+    for name, _, fetch in sources:
+        done[name] = threading.Event()
+        threading.Thread(target=run, args=(name, fetch), daemon=True).start()
+
+    collected = []
+    for name, cache_key, _ in sources:
+        remaining = started + min(source_timeout, deadline) - time.monotonic()
+        finished = done[name].wait(max(remaining, 0))
+        set_metric(
+            "antibl_source_duration_seconds",
+            timings[name] if finished else time.monotonic() - started,
+            source=cache_key,
+        )
+        if finished and name in results:
+            print(f"Fetched {name} in {timings[name]:.2f}s.")
+            collected.append((name, results[name]))
+            continue
+
+        if done[name].is_set():
+            print(
+                f"Warning: {name} failed after {timings[name]:.2f}s, using cache",
+                file=sys.stderr,
+            )
+        else:
+            print(
+                f"Warning: {name} did not respond within "
+                f"{time.monotonic() - started:.2f}s, using cache",
+                file=sys.stderr,
+            )
+        routes = get_cached_prefixes(cache_key)
+        print(f"Using cached data for {name}: {len(routes)} routes.")
+        record_source(cache_key, CACHE_FALLBACK, len(routes))
+        collected.append((name, routes))
+
+    print(f"Fetch stage completed in {time.monotonic() - started:.2f}s.")
+    return collected
+
+
+def get_sources(
+    as_list: Dict[int, str], max_age: float = 0
+) -> List[Tuple[str, str, Callable]]:
+    """
+    Возвращает источники маршрутов: (имя, ключ кэша, функция загрузки).
+    max_age - допустимый возраст индекса таблицы bgp.tools в секундах, при
+    котором таблица не запрашивается (по умолчанию 0: при каждом запуске
+    отправляется условный запрос).
+    """
+    context = {"as_list": as_list, "max_age": max_age}  # type: Dict[str, Any]
+    return [
+        (source["name"], source["cache_key"], partial(fetch_prefixes, source, context))
+        for source in source_configs(KIND_ROUTES)
+    ]
 
 
 def collect_routes(
@@ -22,31 +113,41 @@ def collect_routes(
     output_file: str,
     exclude_file: str = None,
     summarize: bool = False,
+    source_timeout: float = SOURCE_TIMEOUT,
+    deadline: float = FETCH_DEADLINE,
+    route_action: str = DEFAULT_ROUTE_ACTION,
+    route_comments: bool = False,
+    output6_file: Optional[str] = None,
+    index_file: Optional[str] = None,
+    history_size: int = DEFAULT_HISTORY_SIZE,
+    workers: int = 1,
+    emit: Optional[Dict[str, str]] = None,
+    set_name: str = DEFAULT_SET_NAME,
+    max_routes: int = 0,
 ):
-    """Собирает маршруты из разных источников и применяет фильтрацию."""
+    """
+    Собирает маршруты из разных источников и применяет фильтрацию.
+    route_comments добавляет к маршрутам комментарии с именами источников.
+    Маршруты IPv6 записываются в output6_file, если он указан.
+    Индекс для подкоманды lookup сохраняется в index_file, если он указан,
+    вместе с журналом изменений (не более history_size журналов).
+    workers - число процессов для исключений и суммаризации.
+    emit - дополнительные форматы вывода (nft, ipset) и их файлы,
+    set_name - имя наборов в этих форматах.
+    max_routes > 0 ограничивает число маршрутов каждого семейства.
+    """
     as_list = get_as_list(as_list_file)
 
-    all_routes = set()
-
-    routes = get_routes_from_bgptools(as_list)
-    all_routes.update(routes)
-    print(f"Added {len(routes)} routes from bgp.tools.")
-
-    routes = get_routes_from_tor()
-    all_routes.update(routes)
-    print(f"Added {len(routes)} routes from Tor.")
-
-    routes = get_routes_from_github()
-    all_routes.update(routes)
-    print(f"Added {len(routes)} routes from GitHub.")
-
-    routes = get_routes_from_antifilter()
-    all_routes.update(routes)
-    print(f"Added {len(routes)} routes from antifilter.")
-
-    routes = get_routes_from_twitter()
-    all_routes.update(routes)
-    print(f"Added {len(routes)} routes from Twitter.")
+    sources = get_sources(as_list)
+    keys = {name: key for name, key, _ in sources}
+    with stage_timer("fetch"):
+        fetched = fetch_sources(sources, source_timeout, deadline)
+    for name, routes in fetched:
+        print(f"Added {len(routes)} routes from {name}.")
+    # Маршруты источников уже отсортированы: слияние без общей копии
+    with stage_timer("merge"):
+        all_routes = DualPrefixArray.merge(routes for _, routes in fetched)
+    by_source = {keys[name]: routes for name, routes in fetched}
 
     print(f"Total routes collected: {len(all_routes)}")
 
@@ -54,28 +155,134 @@ def collect_routes(
         print("Warning: No routes collected from any source", file=sys.stderr)
         return
 
-    excludes = get_exclude_list(exclude_file)
+    with stage_timer("fetch_excludes"):
+        excludes = get_exclude_index(exclude_file)
 
     print("Applying exclusion filter...")
-    process_networks_in_memory(sorted(all_routes), excludes, output_file, summarize)
+    prefixes = process_dual_prefixes(
+        all_routes, excludes, summarize, workers, max_routes
+    )
     print("Successfully applied exclusion filter.")
 
-    print("Processing output file for BIRD configuration...")
+    commented = by_source if route_comments else None
+    if prefixes.v4:
+        write_routes(prefixes.v4, output_file, route_action, commented)
+    if output6_file:
+        if prefixes.v6:
+            write_routes(prefixes.v6, output6_file, route_action, commented)
+        else:
+            print(f"Warning: No IPv6 routes, keeping {output6_file}", file=sys.stderr)
+    routed = DualPrefixArray(prefixes.v4, prefixes.v6 if output6_file else None)
+    if emit:
+        write_emitters(routed, emit, set_name)
+    if index_file:
+        save_index(routed, by_source, index_file, history_size)
+
+
+def write_routes(
+    prefixes: PrefixArrayType,
+    output_file: str,
+    action: str = DEFAULT_ROUTE_ACTION,
+    sources: Optional[Dict[str, DualPrefixArray]] = None,
+) -> bool:
+    """
+    Записывает маршруты одного семейства для BIRD, если файл изменился.
+    sources - префиксы источников для комментариев к маршрутам.
+    Возвращает True, если файл был перезаписан.
+    """
+    label = "IPv6 " if isinstance(prefixes, PrefixArray6) else ""
+    if sources is not None:
+        sources = {key: routes.family(prefixes) for key, routes in sources.items()}
+    print(f"Writing {label}BIRD configuration...")
     try:
-        if not os.path.exists(output_file):
+        with stage_timer(stage_name("write", prefixes)):
+            diff = write_bird_routes(prefixes, output_file, action, sources)
+    except (IOError, OSError) as e:
+        print(f"Error writing output file {output_file}: {e}", file=sys.stderr)
+        raise
+    print(
+        f"Final number of {label}routes: {diff.total} "
+        f"(+{diff.added} -{diff.removed})"
+    )
+    family = prefixes.FAMILY
+    set_metric("antibl_routes_final", diff.total, family=family)
+    set_metric("antibl_routes_added", diff.added, family=family)
+    set_metric("antibl_routes_removed", diff.removed, family=family)
+
+    if diff.written:
+        print("Successfully wrote BIRD configuration.")
+    else:
+        print(f"Route set unchanged, keeping {output_file}.")
+    return diff.written
+
+
+def write_emitters(
+    prefixes: DualPrefixArray,
+    emit: Dict[str, str],
+    set_name: str = DEFAULT_SET_NAME,
+) -> bool:
+    """
+    Записывает итоговые маршруты в дополнительных форматах: emit - формат
+    вывода -> файл. Возвращает True, если какой-либо файл был перезаписан.
+    """
+    written = False
+    for emitter, output_file in sorted(emit.items()):
+        print(f"Writing {emitter} set to {output_file}...")
+        try:
+            with stage_timer(f"emit_{emitter}"):
+                changed = write_emitted(emitter, prefixes, output_file, set_name)
+        except (IOError, OSError) as e:
+            print(f"Error writing output file {output_file}: {e}", file=sys.stderr)
+            raise
+        if changed:
+            print(f"Successfully wrote {emitter} set.")
+        else:
+            print(f"Route set unchanged, keeping {output_file}.")
+        written = written or changed
+    return written
+
+
+def save_index(
+    prefixes: DualPrefixArray,
+    sources: Dict[str, DualPrefixArray],
+    index_file: str,
+    history_size: int = DEFAULT_HISTORY_SIZE,
+    previous: Optional[RouteIndex] = None,
+) -> Optional[RouteIndex]:
+    """
+    Сохраняет индекс итоговых маршрутов с источниками для подкоманды lookup
+    и записывает журнал изменений относительно предыдущего индекса (previous
+    или прежнего файла), храня не более history_size журналов.
+    Возвращает новый индекс или None при ошибке записи.
+    """
+    if previous is None and history_size > 0 and os.path.exists(index_file):
+        try:
+            previous = load_route_index(index_file)
+        except (IOError, OSError, ValueError) as e:
             print(
-                f"Warning: Output file {output_file} does not exist after processing",
+                f"Warning: Ignoring previous lookup index {index_file}: {e}",
                 file=sys.stderr,
             )
-            return
-
-        with open(output_file, "r", encoding="utf-8") as f:
-            routes = f.readlines()
-        with open(output_file, "w", encoding="utf-8") as f:
-            for route in routes:
-                f.write(f"route {route.strip()} reject;\n")
-        print("Successfully processed output file for BIRD configuration.")
-        print(f"Final number of routes: {len(routes)}")
+    try:
+        with stage_timer("index"):
+            index = build_route_index(prefixes, sources)
+            save_route_index(index, index_file)
     except (IOError, OSError) as e:
-        print(f"Error processing output file {output_file}: {e}", file=sys.stderr)
-        raise
+        print(
+            f"Warning: Could not write lookup index {index_file}: {e}", file=sys.stderr
+        )
+        return None
+    print(f"Saved lookup index of {len(prefixes)} routes to {index_file}.")
+
+    if history_size > 0 and previous is not None:
+        try:
+            with stage_timer("history"):
+                changelog = write_changelog(
+                    index, previous, history_dir(index_file), history_size
+                )
+        except (IOError, OSError) as e:
+            print(f"Warning: Could not write route changelog: {e}", file=sys.stderr)
+        else:
+            if changelog:
+                print(f"Route changes written to {changelog}.")
+    return index
@@ -2,39 +2,17 @@
 Модуль для получения данных от antifilter.
 """
 
-import requests
-import sys
-from typing import List
+from fetchers.base import fetch_prefixes
+from fetchers.registry import get_source_config
+from network.prefix_array import DualPrefixArray
 
-from utils.cache import ensure_cache_dir, get_cached_data, save_to_cache
+# Каждый список кэшируется отдельно, чтобы проверять его изменение независимо
+ANTIFILTER_SOURCES = ("antifilter_ipsum", "antifilter_subnet")
 
 
-def get_routes_from_antifilter() -> List[str]:
+def get_routes_from_antifilter() -> DualPrefixArray:
     """Получает списки ipsum.lst и subnet.lst с antifilter.download."""
-    ensure_cache_dir()
-    urls = [
-        "https://antifilter.download/list/ipsum.lst",
-        "https://antifilter.download/list/subnet.lst",
-    ]
-    routes = []
-    for url in urls:
-        try:
-            print(f"Fetching list from {url}...")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            url_routes = []
-            for line in response.text.splitlines():
-                if line.strip():
-                    url_routes.append(line.strip())
-            routes.extend(url_routes)
-            print(f"Successfully fetched {len(url_routes)} routes from {url}.")
-        except requests.RequestException as e:
-            print(f"Error fetching list from {url}: {e}", file=sys.stderr)
-    if routes:
-        save_to_cache("antifilter", routes)
-        return routes
-    cached_routes = get_cached_data("antifilter")
-    if cached_routes:
-        print(f"Using cached data for antifilter: {len(cached_routes)} routes.")
-        return cached_routes
-    return []
+    routes = DualPrefixArray()
+    for cache_key in ANTIFILTER_SOURCES:
+        routes.extend(fetch_prefixes(get_source_config(cache_key)))
+    return routes.unique()
@@ -0,0 +1,212 @@
+"""
+Модуль с индексом таблицы bgp.tools: префиксы всех AS таблицы, сгруппированные
+по номеру AS. Индекс сохраняется на диск, поэтому изменение списка AS
+разрешается локально, без повторной загрузки таблицы.
+"""
+
+import heapq
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from network.parser import parse_dual_prefixes
+from network.prefix_array import DualPrefixArray, PrefixArrayType
+from utils.array_file import load_array_file, save_array_file
+
+# Файл индекса (см. utils.array_file): время загрузки таблицы, HTTP-валидаторы
+# в метаданных и массивы в порядке _asn_index_arrays
+ASN_INDEX_MAGIC = b"ABLA"
+ASN_INDEX_VERSION = 1
+
+# Число строк таблицы, разбираемых и сортируемых за один раз
+ASN_INDEX_CHUNK = 1 << 16
+
+# Поля строки table.jsonl ищутся в сырых байтах, без разбора JSON
+_CIDR_FIELD = re.compile(rb'"CIDR":\s*"([^"]+)"').search
+_ASN_FIELD = re.compile(rb'"ASN":\s*([0-9]+)').search
+
+
+class AsnIndex:
+    """
+    Префиксы таблицы по номерам AS: отсортированные номера AS и для каждого
+    из них отрезок общих массивов IPv4- и IPv6-префиксов (offsets4[i],
+    offsets4[i + 1]) и так же для IPv6. Префиксы одной AS отсортированы.
+    """
+
+    __slots__ = ("asns", "offsets4", "offsets6", "prefixes", "fetched_at", "meta")
+
+    def __init__(self):
+        self.asns = array("I")
+        self.offsets4 = array("I", [0])
+        self.offsets6 = array("I", [0])
+        self.prefixes = DualPrefixArray()
+        # Время загрузки или подтверждения таблицы и её HTTP-валидаторы
+        self.fetched_at = 0
+        self.meta = {}  # type: Dict[str, str]
+
+    def __len__(self) -> int:
+        return len(self.prefixes)
+
+    def resolve(self, asns: Iterable[int]) -> DualPrefixArray:
+        """Возвращает отсортированные префиксы указанных AS без повторов."""
+        result = DualPrefixArray()
+        for asn in asns:
+            i = bisect_left(self.asns, asn)
+            if i == len(self.asns) or self.asns[i] != asn:
+                continue
+            result.v4.extend(
+                self.prefixes.v4.slice(self.offsets4[i], self.offsets4[i + 1])
+            )
+            result.v6.extend(
+                self.prefixes.v6.slice(self.offsets6[i], self.offsets6[i + 1])
+            )
+        return result.unique()
+
+
+def iter_bgptools_table(lines: Iterable[bytes]) -> Iterator[Tuple[int, str]]:
+    """Потоково перебирает пары (AS, CIDR) из строк table.jsonl."""
+    for line in lines:
+        cidr, asn = _CIDR_FIELD(line), _ASN_FIELD(line)
+        if cidr and asn:
+            yield int(asn.group(1)), cidr.group(1).decode("ascii", "replace")
+
+
+def _sorted_run(
+    asns: List[int], lines: List[str], family: int
+) -> Tuple[array, PrefixArrayType]:
+    """
+    Разбирает CIDR семейства family (0 - IPv4, 1 - IPv6) и возвращает
+    номера AS и префиксы, отсортированные по ключу (AS, адрес, длина)
+    без повторов.
+    """
+    parsed, issues = parse_dual_prefixes(lines)
+    if issues:
+        for issue in issues:
+            print(
+                f"Warning: Invalid prefix in bgp.tools table: {issue.line}",
+                file=sys.stderr,
+            )
+        # Неверные строки не попали в массив: убираем и их номера AS
+        invalid = {issue.line_num for issue in issues}
+        asns = [asn for line_num, asn in enumerate(asns, 1) if line_num not in invalid]
+    parsed = parsed.v6 if family else parsed.v4
+    shift = parsed.BITS + parsed._LEN_BITS
+    keys = sorted({(asn << shift) | key for asn, key in zip(asns, parsed._keys())})
+    mask = (1 << shift) - 1
+    return (
+        array("I", (key >> shift for key in keys)),
+        type(parsed)._from_keys(key & mask for key in keys),
+    )
+
+
+def build_asn_index(routes: Iterable[Tuple[int, str]]) -> AsnIndex:
+    """
+    Строит индекс по парам (AS, CIDR). Пары читаются блоками по
+    ASN_INDEX_CHUNK: каждый блок разбирается и сортируется в компактные
+    массивы, а в конце отсортированные блоки сливаются, поэтому строки
+    всей таблицы одновременно в памяти не хранятся.
+    """
+    runs = ([], [])  # type: Tuple[List[Tuple[array, Any]], List[Tuple[array, Any]]]
+    routes = iter(routes)
+    while True:
+        chunk = list(islice(routes, ASN_INDEX_CHUNK))
+        if not chunk:
+            break
+        asns = ([], [])  # type: Tuple[List[int], List[int]]
+        lines = ([], [])  # type: Tuple[List[str], List[str]]
+        for asn, cidr in chunk:
+            family = int(":" in cidr)
+            asns[family].append(asn)
+            lines[family].append(cidr)
+        del chunk
+        for family in (0, 1):
+            if lines[family]:
+                runs[family].append(_sorted_run(asns[family], lines[family], family))
+
+    index = AsnIndex()
+    key_asns = []  # type: List[array]
+    for family_runs, prefixes in zip(runs, index.prefixes):
+        family_asns = array("I")
+        append = prefixes.append
+        last = None
+        for item in heapq.merge(*(zip(*run) for run in family_runs)):
+            if item != last:
+                family_asns.append(item[0])
+                append(*item[1])
+                last = item
+        key_asns.append(family_asns)
+        del family_runs[:]
+
+    index.asns.extend(sorted(set(key_asns[0]) | set(key_asns[1])))
+    for offsets, family_asns in zip((index.offsets4, index.offsets6), key_asns):
+        del offsets[:]
+        offsets.extend(bisect_left(family_asns, asn) for asn in index.asns)
+        offsets.append(len(family_asns))
+    return index
+
+
+def _asn_index_file(source: str) -> str:
+    return os.path.join(".cache", f"{source}.asn.bin")
+
+
+def _asn_index_arrays(index: AsnIndex) -> List[array]:
+    v4, v6 = index.prefixes.v4, index.prefixes.v6
+    return [
+        v6.hi,
+        v6.lo,
+        index.asns,
+        index.offsets4,
+        index.offsets6,
+        v4.addrs,
+        v4.lens,
+        v6.lens,
+    ]
+
+
+def save_asn_index(source: str, index: AsnIndex):
+    """Атомарно записывает индекс таблицы источника в .cache."""
+    cache_file = _asn_index_file(source)
+    try:
+        save_array_file(
+            cache_file,
+            ASN_INDEX_MAGIC,
+            ASN_INDEX_VERSION,
+            index.fetched_at,
+            index.meta,
+            _asn_index_arrays(index),
+        )
+    except (IOError, OSError) as e:
+        print(f"Warning: Could not write cache file {cache_file}: {e}", file=sys.stderr)
+
+
+def load_asn_index(source: str) -> Optional[AsnIndex]:
+    """Загружает индекс таблицы источника или None, если его нет или он повреждён."""
+    cache_file = _asn_index_file(source)
+    if not os.path.exists(cache_file):
+        return None
+    index = AsnIndex()
+    # Массивы смещений в файле хранятся целиком, вместе с начальным нулём
+    del index.offsets4[:], index.offsets6[:]
+
+    def make_arrays(meta: Dict[str, Any]) -> List[array]:
+        return _asn_index_arrays(index)
+
+    try:
+        index.fetched_at, meta = load_array_file(
+            cache_file, ASN_INDEX_MAGIC, ASN_INDEX_VERSION, make_arrays
+        )
+    except (IOError, OSError, ValueError) as e:
+        print(
+            f"Warning: Ignoring invalid cache file {cache_file}: {e}", file=sys.stderr
+        )
+        return None
+    if len(index.offsets4) != len(index.asns) + 1:
+        print(f"Warning: Ignoring invalid cache file {cache_file}", file=sys.stderr)
+        return None
+    meta.pop("counts", None)
+    index.meta = meta
+    return index
@@ -0,0 +1,269 @@
+"""
+Модуль с общей логикой загрузки источников: один пул HTTP-соединений
+с повторами запросов и общий путь загрузка -> разбор -> кэш -> откат на кэш.
+Таблица bgp.tools кэшируется индексом по номерам AS (fetchers.asn_index).
+"""
+
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
+
+from fetchers.asn_index import AsnIndex, load_asn_index, save_asn_index
+from fetchers.parsers import PARSERS
+from network.prefix_array import DualPrefixArray
+from network.processor import read_dual_prefixes_from_list
+from utils.cache import (
+    conditional_headers,
+    ensure_cache_dir,
+    get_cached_data,
+    load_prefix_cache,
+    save_cache_validators,
+    save_prefix_cache,
+    save_to_cache,
+)
+from utils.metrics import CACHE_FALLBACK, FAILED, FETCHED, NOT_MODIFIED, record_source
+
+# Повторы при ошибках соединения и временных ошибках сервера
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Соединения к одному хосту, которые пул держит открытыми
+POOL_SIZE = 10
+
+_session = None  # type: Optional[requests.Session]
+_session_lock = threading.Lock()
+
+
+def _make_retry() -> Retry:
+    options = {
+        "total": RETRY_TOTAL,
+        "backoff_factor": RETRY_BACKOFF,
+        "status_forcelist": RETRY_STATUSES,
+        "raise_on_status": False,
+    }
+    try:
+        return Retry(allowed_methods=frozenset(["GET"]), **options)
+    except TypeError:
+        # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(["GET"]), **options)
+
+
+def get_session() -> requests.Session:
+    """
+    Возвращает общую сессию с пулом keep-alive соединений. Сжатие br
+    запрашивается, только если установлен модуль brotli.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=POOL_SIZE,
+                pool_maxsize=POOL_SIZE,
+                max_retries=_make_retry(),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            _session = session
+        return _session
+
+
+def _fetch(
+    source: Dict[str, Any],
+    context: Optional[Dict[str, Any]],
+    convert: Callable[[Iterable[str]], Any],
+    load_cache: Callable[[str], Any],
+    save_cache: Callable[[str, Any, Any], None],
+):
+    """
+    Общий путь загрузки: условный запрос, разбор, сохранение в кэш.
+    При ответе 304 возвращает кэш; при ошибке - кэш или пустой результат.
+    """
+    ensure_cache_dir()
+    context = context or {}
+    name, url, cache_key = source["name"], source["url"], source["cache_key"]
+    parser = PARSERS[source["parser"]]
+    headers = dict(source.get("headers") or {})
+    headers.update(conditional_headers(cache_key))
+    try:
+        print(f"Fetching {name} from {url}...")
+        with get_session().get(
+            url, headers=headers, timeout=source["timeout"], stream=True
+        ) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                data = load_cache(cache_key)
+                print(f"{name} not modified, using cache: {len(data)} entries.")
+                record_source(cache_key, NOT_MODIFIED, len(data))
+                return data
+            entries, counter = parser.parse(response, context)
+            # Записи разбираются в массив прямо из потока ответа
+            data = convert(entries)
+            # Объём, полученный по сети (до распаковки)
+            bytes_read = response.raw.tell() if response.raw is not None else 0
+        lines = counter[0]
+        print(f"Successfully fetched {len(data)} entries from {name}.")
+        save_cache(cache_key, data, response.headers)
+        record_source(cache_key, FETCHED, len(data), bytes_read, lines)
+        return data
+    except (requests.RequestException, ValueError) as e:
+        # ValueError - в том числе ошибки разбора JSON
+        print(f"Error fetching {name} from {url}: {e}", file=sys.stderr)
+        cached = load_cache(cache_key)
+        if cached:
+            print(f"Using cached data for {name}: {len(cached)} entries.")
+            record_source(cache_key, CACHE_FALLBACK, len(cached))
+        else:
+            record_source(cache_key, FAILED)
+        return cached
+
+
+def _save_text_cache(cache_key: str, entries: List[str], headers):
+    # Валидаторы без записанных данных дали бы 304 для устаревшего кэша
+    if save_to_cache(cache_key, entries):
+        save_cache_validators(cache_key, headers)
+
+
+def _save_binary_cache(cache_key: str, prefixes: DualPrefixArray, headers):
+    # Пустой результат не должен затирать последние полученные данные
+    if prefixes:
+        save_prefix_cache(cache_key, prefixes, headers)
+    else:
+        print(f"Warning: No data to cache for {cache_key}", file=sys.stderr)
+
+
+def fetch_source(
+    source: Dict[str, Any], context: Optional[Dict[str, Any]] = None
+) -> List[str]:
+    """
+    Загружает источник по его описанию (см. fetchers.registry) и возвращает
+    записи в виде строк. Кэш хранится в текстовом виде.
+    context передаётся разборщику (например, список AS для bgp.tools).
+    """
+    return _fetch(source, context, list, get_cached_data, _save_text_cache)
+
+
+def fetch_prefixes(
+    source: Dict[str, Any], context: Optional[Dict[str, Any]] = None
+) -> DualPrefixArray:
+    """
+    Загружает источник маршрутов и возвращает отсортированные префиксы без
+    повторов. Кэш хранится в двоичном виде и читается без разбора строк.
+    """
+    if PARSERS[source["parser"]].indexed:
+        return _fetch_indexed(source, context or {})
+    return _fetch(
+        source, context, _to_prefixes, get_cached_prefixes, _save_binary_cache
+    )
+
+
+def _fetch_indexed(source: Dict[str, Any], context: Dict[str, Any]) -> DualPrefixArray:
+    """
+    Загрузка источника с индексом всей таблицы (bgp.tools): маршруты AS из
+    context["as_list"] выбираются из индекса на диске. Таблица запрашивается
+    (условным запросом), только если индекс старше context["max_age"] секунд
+    (по умолчанию 0 - запрашивается всегда).
+    """
+    ensure_cache_dir()
+    name, url, cache_key = source["name"], source["url"], source["cache_key"]
+    as_list = context.get("as_list") or {}
+    max_age = context.get("max_age", 0)
+    index = load_asn_index(cache_key)
+    if index is not None and 0 <= time.time() - index.fetched_at < max_age:
+        routes = _resolve_index(cache_key, index, as_list)
+        print(
+            f"Using {name} index from {time.time() - index.fetched_at:.0f}s ago: "
+            f"{len(routes)} entries."
+        )
+        record_source(cache_key, NOT_MODIFIED, len(routes))
+        return routes
+
+    headers = dict(source.get("headers") or {})
+    if index is not None:
+        if index.meta.get("etag"):
+            headers["If-None-Match"] = index.meta["etag"]
+        if index.meta.get("last_modified"):
+            headers["If-Modified-Since"] = index.meta["last_modified"]
+    try:
+        print(f"Fetching {name} from {url}...")
+        with get_session().get(
+            url, headers=headers, timeout=source["timeout"], stream=True
+        ) as response:
+            response.raise_for_status()
+            if response.status_code == 304 and index is not None:
+                index.fetched_at = int(time.time())
+                save_asn_index(cache_key, index)
+                routes = _resolve_index(cache_key, index, as_list)
+                print(f"{name} not modified, using index: {len(routes)} entries.")
+                record_source(cache_key, NOT_MODIFIED, len(routes))
+                return routes
+            index, counter = PARSERS[source["parser"]].parse(response, context)
+            lines = counter[0]
+            bytes_read = response.raw.tell() if response.raw is not None else 0
+            index.fetched_at = int(time.time())
+            index.meta = {
+                "source": cache_key,
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+            }
+    except (requests.RequestException, ValueError) as e:
+        print(f"Error fetching {name} from {url}: {e}", file=sys.stderr)
+        if index is None:
+            cached = get_cached_prefixes(cache_key)
+            record_source(cache_key, CACHE_FALLBACK if cached else FAILED, len(cached))
+            return cached
+        routes = _resolve_index(cache_key, index, as_list)
+        print(f"Using cached index for {name}: {len(routes)} entries.")
+        record_source(cache_key, CACHE_FALLBACK, len(routes))
+        return routes
+
+    print(f"Indexed {len(index)} prefixes of {len(index.asns)} AS from {name}.")
+    # Пустая таблица не должна затирать последний полученный индекс
+    if index:
+        save_asn_index(cache_key, index)
+    else:
+        print(f"Warning: No data to cache for {cache_key}", file=sys.stderr)
+    routes = _resolve_index(cache_key, index, as_list)
+    print(f"Successfully fetched {len(routes)} entries from {name}.")
+    record_source(cache_key, FETCHED, len(routes), bytes_read, lines)
+    return routes
+
+
+def _resolve_index(
+    cache_key: str, index: AsnIndex, as_list: Dict[int, str]
+) -> DualPrefixArray:
+    """
+    Выбирает маршруты AS из индекса и сохраняет их в кэш префиксов источника,
+    из которого они берутся, если загрузка не уложилась в срок. Кэш
+    перезаписывается, только если набор маршрутов изменился (новая таблица
+    или другой список AS).
+    """
+    routes = index.resolve(as_list)
+    cached = load_prefix_cache(cache_key)
+    if cached is None or cached[0] != routes:
+        del cached
+        _save_binary_cache(cache_key, routes, {})
+    return routes
+
+
+def _to_prefixes(entries: Iterable[str]) -> DualPrefixArray:
+    return read_dual_prefixes_from_list(entries).unique()
+
+
+def get_cached_prefixes(source: str) -> DualPrefixArray:
+    """
+    Получает префиксы источника из двоичного кэша. Если его нет, читает
+    текстовый кэш прежнего формата.
+    """
+    cached = load_prefix_cache(source)
+    if cached is not None:
+        return cached[0]
+    return _to_prefixes(get_cached_data(source))
@@ -2,43 +2,36 @@
 Модуль для получения данных с GitHub.
 """
 
+import hashlib
 import os
-import requests
 import sys
 from typing import List, Dict
 
-from utils.cache import ensure_cache_dir, get_cached_data, save_to_cache
+from fetchers.base import fetch_prefixes, fetch_source
+from fetchers.registry import (
+    KIND_AS_LIST,
+    KIND_EXCLUDE,
+    get_source_config,
+    source_configs,
+)
+from network.exclude_index import (
+    ExcludeIndex,
+    load_exclude_index,
+    save_exclude_index,
+)
+from network.prefix_array import DualPrefixArray
+from network.processor import compile_excludes
+from utils.cache import ensure_cache_dir
+from utils.file_utils import get_file_hash
 
 
-def get_routes_from_github() -> List[str]:
+def get_routes_from_github() -> DualPrefixArray:
     """Получает список ext-manual.lst с GitHub."""
-    ensure_cache_dir()
-    url = (
-        "https://raw.githubusercontent.com/salsaly4/netfilter/"
-        "refs/heads/master/ext-manual.lst"
-    )
-    try:
-        print(f"Fetching manual routes from {url}...")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        routes = []
-        for line in response.text.splitlines():
-            if line.strip():
-                routes.append(line.strip())
-        print(f"Successfully fetched {len(routes)} manual routes from GitHub.")
-        save_to_cache("manual", routes)
-        return routes
-    except requests.RequestException as e:
-        print(f"Error fetching manual routes from {url}: {e}", file=sys.stderr)
-        cached_routes = get_cached_data("manual")
-        if cached_routes:
-            print(f"Using cached data for manual routes: {len(cached_routes)} routes.")
-            return cached_routes
-        return []
+    return fetch_prefixes(get_source_config("manual"))
 
 
 def get_exclude_list(exclude_file: str = None) -> List[str]:
-    """Получает список исключений из файла или GitHub."""
+    """Получает список исключений из файла или из источников исключений."""
     ensure_cache_dir()
     if exclude_file and exclude_file.strip() and os.path.exists(exclude_file):
         print(f"Reading exclude list from {exclude_file}...")
@@ -51,32 +44,54 @@ def get_exclude_list(exclude_file: str = None) -> List[str]:
         print(f"Successfully read {len(excludes)} exclude entries.")
         return excludes
 
-    url = (
-        "https://raw.githubusercontent.com/salsaly4/netfilter/"
-        "refs/heads/master/exclude.lst"
-    )
-    try:
-        print(f"Fetching exclude list from {url}...")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        excludes = []
-        for line in response.text.splitlines():
-            if line.strip():
-                excludes.append(line.strip())
-        print(f"Successfully fetched {len(excludes)} exclude entries.")
-        save_to_cache("exclude", excludes)
-        return excludes
-    except requests.RequestException as e:
-        print(f"Error fetching exclude list: {e}", file=sys.stderr)
-        cached_excludes = get_cached_data("exclude")
-        if cached_excludes:
-            print(f"Using cached exclude list: {len(cached_excludes)} entries.")
-            return cached_excludes
-        return []
+    # Исключения из всех источников этого вида объединяются
+    excludes = []
+    for source in source_configs(KIND_EXCLUDE):
+        excludes.extend(fetch_source(source))
+    return excludes
+
+
+def _exclude_sources_hash() -> str:
+    """Хеш текстового кэша всех источников исключений."""
+    digest = hashlib.md5()
+    for source in source_configs(KIND_EXCLUDE):
+        cache_file = os.path.join(".cache", f"{source['cache_key']}.txt")
+        digest.update(get_file_hash(cache_file).encode())
+    return digest.hexdigest()
+
+
+def get_exclude_index(exclude_file: str = None) -> ExcludeIndex:
+    """
+    Получает индекс исключений (см. network.exclude_index). Индекс,
+    скомпилированный из списка с тем же содержимым, читается из .cache
+    без разбора строк; иначе список разбирается и индекс сохраняется.
+    """
+    if exclude_file and exclude_file.strip() and os.path.exists(exclude_file):
+        # Хеш берётся до чтения: изменённый после этого файл даст другой хеш
+        # при следующем запуске, и индекс будет собран заново
+        digest = get_file_hash(exclude_file)
+        index = load_exclude_index(digest)
+        if index is not None:
+            print(f"Using compiled exclude index for {exclude_file}.")
+            return index
+        excludes = get_exclude_list(exclude_file)
+    else:
+        # Источники исключений загружаются условными запросами в любом случае
+        excludes = get_exclude_list(exclude_file)
+        digest = _exclude_sources_hash()
+        index = load_exclude_index(digest)
+        if index is not None:
+            print("Using compiled exclude index.")
+            return index
+    index = compile_excludes(excludes, digest)
+    # Пустой список может быть ошибкой чтения: такой индекс не сохраняется
+    if digest and excludes:
+        save_exclude_index(index)
+    return index
 
 
 def get_as_list(as_list_file: str = None) -> Dict[int, str]:
-    """Получает список AS из файла или GitHub, кэширует и использует кэш при ошибке."""
+    """Получает список AS из файла или из источников списка AS."""
     ensure_cache_dir()
     if as_list_file and as_list_file.strip() and os.path.exists(as_list_file):
         print(f"Reading AS list from {as_list_file}...")
@@ -102,32 +117,7 @@ def get_as_list(as_list_file: str = None) -> Dict[int, str]:
         print(f"Successfully read {len(as_list)} AS entries.")
         return as_list
 
-    url = "https://raw.githubusercontent.com/salsaly4/netfilter/refs/heads/master/aslist.txt"
-    try:
-        print(f"Downloading AS list from {url}...")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        as_list = {}
-        for line_num, line in enumerate(response.text.splitlines(), 1):
-            line = line.strip()
-            if line and not line.startswith("#"):
-                try:
-                    parts = line.split("#", 1)
-                    asn = int(parts[0].strip())
-                    comment = parts[1].strip() if len(parts) > 1 else ""
-                    as_list[asn] = comment
-                except (ValueError, IndexError) as e:
-                    print(
-                        f"Warning: Invalid ASN format on line {line_num}: {line.strip()}",
-                        file=sys.stderr,
-                    )
-        print(f"Successfully downloaded {len(as_list)} AS entries.")
-        save_to_cache("aslist", [str(asn) for asn in as_list.keys()])
-        return as_list
-    except requests.RequestException as e:
-        print(f"Failed to download AS list: {e}")
-        cached_as_list = get_cached_data("aslist")
-        if cached_as_list:
-            print(f"Using cached AS list: {len(cached_as_list)} entries.")
-            return {int(asn): "" for asn in cached_as_list if str(asn).isdigit()}
-        return {}
+    as_list = {}
+    for source in source_configs(KIND_AS_LIST):
+        as_list.update((int(asn), "") for asn in fetch_source(source) if asn.isdigit())
+    return as_list
@@ -0,0 +1,106 @@
+"""
+Модуль с разборщиками ответов источников. Разборщик выбирается по имени,
+указанному в описании источника (поле parser).
+"""
+
+import ipaddress
+import re
+import sys
+from collections import namedtuple
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from fetchers.asn_index import AsnIndex, build_asn_index, iter_bgptools_table
+
+# Размер блока при потоковом чтении больших ответов
+STREAM_CHUNK_SIZE = 1 << 16
+
+# parse(response, context) -> (записи, счётчик строк ответа). Записи могут
+# быть генератором, читающим ответ потоком: их нужно перебрать, пока ответ
+# открыт, а счётчик [число строк] заполняется по мере перебора;
+# indexed - parse возвращает индекс всей таблицы (AsnIndex), из которого
+# маршруты выбираются по списку AS без повторной загрузки
+Parser = namedtuple("Parser", ["parse", "indexed"], defaults=(False,))
+
+
+def _iter_text_lines(response, counter: List[int]) -> Iterator[str]:
+    """Потоково перебирает строки ответа как текст, считая их число."""
+    encoding = response.encoding or "utf-8"
+    lines = response.iter_lines(chunk_size=STREAM_CHUNK_SIZE)
+    for line in _count_lines(lines, counter):
+        yield line.decode(encoding, "replace")
+
+
+def parse_lines(response, context: Dict[str, Any]) -> Tuple[Iterator[str], List[int]]:
+    """Непустые строки ответа как есть (списки подсетей и адресов)."""
+    counter = [0]
+    lines = (line.strip() for line in _iter_text_lines(response, counter))
+    return (line for line in lines if line), counter
+
+
+def _iter_hosts(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        line = line.strip()
+        if re.match(r"\b([0-9]{1,3}\.){3}[0-9]{1,3}\b", line):
+            try:
+                # Проверяем, что это действительно валидный IP адрес
+                ipaddress.IPv4Address(line)
+                yield f"{line}/32"
+            except ipaddress.AddressValueError:
+                print(f"Warning: Invalid IP address: {line}", file=sys.stderr)
+        elif ":" in line:
+            try:
+                ipaddress.IPv6Address(line)
+                yield f"{line}/128"
+            except ipaddress.AddressValueError:
+                print(f"Warning: Invalid IP address: {line}", file=sys.stderr)
+
+
+def parse_hosts(response, context: Dict[str, Any]) -> Tuple[Iterator[str], List[int]]:
+    """
+    IP-адреса по одному в строке, преобразуются в маршруты /32 (IPv4)
+    и /128 (IPv6).
+    """
+    counter = [0]
+    return _iter_hosts(_iter_text_lines(response, counter)), counter
+
+
+def parse_asns(response, context: Dict[str, Any]) -> Tuple[List[str], List[int]]:
+    """Номера AS по одному в строке, комментарии после # отбрасываются."""
+    lines = response.text.splitlines()
+    asns = []
+    for line_num, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        if line.isdigit():
+            asns.append(line)
+        else:
+            print(
+                f"Warning: Invalid ASN format on line {line_num}: {line}",
+                file=sys.stderr,
+            )
+    return asns, [len(lines)]
+
+
+def _count_lines(lines: Iterable[bytes], counter: List[int]) -> Iterator[bytes]:
+    """Пропускает строки без изменений, считая их число."""
+    for line in lines:
+        counter[0] += 1
+        yield line
+
+
+def parse_bgptools(response, context: Dict[str, Any]) -> Tuple[AsnIndex, List[int]]:
+    """Индекс всей таблицы bgp.tools (JSON Lines) по номерам AS."""
+    counter = [0]
+    # Таблица читается потоком по частям, без загрузки целиком в память
+    lines = _count_lines(response.iter_lines(chunk_size=STREAM_CHUNK_SIZE), counter)
+    index = build_asn_index(iter_bgptools_table(lines))
+    return index, counter
+
+
+PARSERS = {
+    "lines": Parser(parse_lines),
+    "hosts": Parser(parse_hosts),
+    "asns": Parser(parse_asns),
+    "bgptools": Parser(parse_bgptools, indexed=True),
+}
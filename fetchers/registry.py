@@ -0,0 +1,155 @@
+"""
+Модуль с описаниями источников данных. Новый список блокировок добавляется
+записью в конфигурации, без нового модуля загрузки.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from fetchers.parsers import PARSERS
+
+GITHUB_BASE_URL = (
+    "https://raw.githubusercontent.com/salsaly4/netfilter/refs/heads/master"
+)
+
+# Назначение источника: маршруты, исключения или список AS для bgp.tools
+KIND_ROUTES = "routes"
+KIND_EXCLUDE = "exclude"
+KIND_AS_LIST = "aslist"
+KINDS = (KIND_ROUTES, KIND_EXCLUDE, KIND_AS_LIST)
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_INTERVAL = 3600
+
+# Поля: name, url, parser, cache_key; необязательные: kind, timeout (секунды
+# на запрос), interval (период обновления в фоновом режиме), headers
+DEFAULT_SOURCES = [
+    {
+        "name": "AS list",
+        "url": f"{GITHUB_BASE_URL}/aslist.txt",
+        "parser": "asns",
+        "cache_key": "aslist",
+        "kind": KIND_AS_LIST,
+        "interval": 86400,
+    },
+    {
+        "name": "exclude list",
+        "url": f"{GITHUB_BASE_URL}/exclude.lst",
+        "parser": "lines",
+        "cache_key": "exclude",
+        "kind": KIND_EXCLUDE,
+    },
+    {
+        "name": "bgp.tools",
+        "url": "https://bgp.tools/table.jsonl",
+        "parser": "bgptools",
+        "cache_key": "bgptools",
+        # bgp.tools требует контактные данные в User-Agent
+        "headers": {"User-Agent": "Alexander Bulanov bgp.tools - bgp@abulanov.com"},
+    },
+    {
+        "name": "Tor",
+        "url": "https://www.dan.me.uk/torlist/",
+        "parser": "hosts",
+        "cache_key": "tor",
+    },
+    {
+        "name": "GitHub",
+        "url": f"{GITHUB_BASE_URL}/ext-manual.lst",
+        "parser": "lines",
+        "cache_key": "manual",
+        "interval": 86400,
+    },
+    {
+        "name": "antifilter ipsum",
+        "url": "https://antifilter.download/list/ipsum.lst",
+        "parser": "lines",
+        "cache_key": "antifilter_ipsum",
+    },
+    {
+        "name": "antifilter subnet",
+        "url": "https://antifilter.download/list/subnet.lst",
+        "parser": "lines",
+        "cache_key": "antifilter_subnet",
+    },
+    {
+        "name": "Twitter",
+        "url": "https://raw.githubusercontent.com/SecOps-Institute/"
+        "TwitterIPLists/master/twitter_ip_list.lst",
+        "parser": "lines",
+        "cache_key": "twitter",
+        "interval": 86400,
+    },
+]
+
+_sources = []  # type: List[Dict[str, Any]]
+
+
+def validate_source(source: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверяет описание источника и дополняет его значениями по умолчанию."""
+    for field in ("name", "url", "parser", "cache_key"):
+        if not source.get(field):
+            raise ValueError(f"source {source!r} has no {field!r}")
+    if source["parser"] not in PARSERS:
+        raise ValueError(
+            f"source {source['name']!r} has unknown parser {source['parser']!r}"
+        )
+    result = {
+        "kind": KIND_ROUTES,
+        "timeout": DEFAULT_TIMEOUT,
+        "interval": DEFAULT_INTERVAL,
+        "headers": {},
+    }
+    result.update(source)
+    if result["kind"] not in KINDS:
+        raise ValueError(
+            f"source {source['name']!r} has unknown kind {result['kind']!r}"
+        )
+    return result
+
+
+def set_sources(sources: List[Dict[str, Any]]):
+    """Заменяет набор источников."""
+    validated = [validate_source(source) for source in sources]
+    for field in ("name", "cache_key"):
+        values = [source[field] for source in validated]
+        if len(set(values)) != len(values):
+            raise ValueError(f"{field} values of sources must be unique")
+    _sources[:] = validated
+
+
+def load_sources(filename: str):
+    """
+    Читает описания источников из JSON-файла (список объектов). Источник
+    с ключом кэша из набора по умолчанию заменяет его, остальные добавляются;
+    "enabled": false отключает источник.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, list):
+        raise ValueError(f"{filename}: expected a list of sources")
+
+    merged = {source["cache_key"]: dict(source) for source in DEFAULT_SOURCES}
+    for source in overrides:
+        key = source.get("cache_key")
+        if key in merged:
+            merged[key].update(source)
+        else:
+            merged[key] = dict(source)
+    set_sources([s for s in merged.values() if s.pop("enabled", True)])
+
+
+def source_configs(kind: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Возвращает описания источников, при необходимости только одного вида."""
+    return [source for source in _sources if kind is None or source["kind"] == kind]
+
+
+def get_source_config(cache_key: str) -> Dict[str, Any]:
+    """Возвращает описание источника по ключу кэша."""
+    for source in _sources:
+        if source["cache_key"] == cache_key:
+            return source
+    raise KeyError(f"Unknown source: {cache_key}")
+
+
+set_sources(DEFAULT_SOURCES)
@@ -2,35 +2,11 @@
 Модуль для получения данных Twitter.
 """
 
-import requests
-import sys
-from typing import List
+from fetchers.base import fetch_prefixes
+from fetchers.registry import get_source_config
+from network.prefix_array import DualPrefixArray
 
-from utils.cache import ensure_cache_dir, get_cached_data, save_to_cache
 
-
-def get_routes_from_twitter() -> List[str]:
+def get_routes_from_twitter() -> DualPrefixArray:
     """Получает список IP-адресов Twitter."""
-    ensure_cache_dir()
-    url = (
-        "https://raw.githubusercontent.com/SecOps-Institute/"
-        "TwitterIPLists/master/twitter_ip_list.lst"
-    )
-    try:
-        print("Fetching Twitter IP list...")
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        routes = []
-        for line in response.text.splitlines():
-            if line.strip():
-                routes.append(line.strip())
-        print(f"Successfully fetched {len(routes)} Twitter IPs.")
-        save_to_cache("twitter", routes)
-        return routes
-    except requests.RequestException as e:
-        print(f"Error fetching Twitter IP list: {e}", file=sys.stderr)
-        cached_routes = get_cached_data("twitter")
-        if cached_routes:
-            print(f"Using cached data for Twitter IPs: {len(cached_routes)} routes.")
-            return cached_routes
-        return []
+    return fetch_prefixes(get_source_config("twitter"))
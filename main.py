@@ -8,54 +8,359 @@
 import argparse
 import os
 import sys
+import time
+from typing import Dict, Iterable, List, Optional
 
-from core.route_collector import collect_routes
-from core.bird_manager import apply_bird_configuration
-from utils.file_utils import get_file_hash
+from core.route_collector import FETCH_DEADLINE, SOURCE_TIMEOUT, collect_routes
+from core.bird_client import DEFAULT_SOCKET
+from core.bird_manager import apply_routes_file
+from core.daemon import RouteDaemon, default_intervals
+from fetchers.registry import load_sources
+from network.emitters import DEFAULT_SET_NAME, EMITTERS
+from network.history import DEFAULT_HISTORY_SIZE
+from network.route_index import DEFAULT_INDEX_FILE, load_route_index
+from network.writer import DEFAULT_ROUTE_ACTION, ROUTE_ACTIONS
+from utils.metrics import set_metric, write_metrics
 
 
-def main():
+def _common_parser(suppress_defaults: bool = False) -> argparse.ArgumentParser:
     """
-    Основная функция программы.
-    Обрабатывает аргументы командной строки и выполняет соответствующие действия.
+    Общие параметры: доступны и без подкоманды, и в подкоманде daemon.
+    В копии для подкоманды значения по умолчанию не задаются, иначе они
+    затирали бы параметры, указанные перед именем подкоманды.
     """
-    parser = argparse.ArgumentParser(description="Сбор и фильтрация маршрутов.")
+
+    def default(value):
+        return argparse.SUPPRESS if suppress_defaults else value
+
+    parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument(
         "-a",
         "--as-list",
-        default="",
+        default=default(""),
         help="Файл со списком AS (по умолчанию: скачивается из GitHub)",
     )
     parser.add_argument(
         "-o",
         "--output",
-        default="routes.txt",
+        default=default("routes.txt"),
         help="Выходной файл (по умолчанию: routes.txt)",
     )
+    parser.add_argument(
+        "--output6",
+        default=default(None),
+        help="Выходной файл для маршрутов IPv6 (по умолчанию не записывается)",
+    )
     parser.add_argument(
         "-x",
         "--exclude",
-        default="",
+        default=default(""),
         help="Файл исключений (по умолчанию: скачивается из GitHub)",
     )
     parser.add_argument(
         "--apply",
         action="store_true",
+        default=default(False),
         help="Применить изменения в BIRD после обновления маршрутов",
     )
+    parser.add_argument(
+        "--bird-socket",
+        default=default(DEFAULT_SOCKET),
+        help=f"Управляющий сокет BIRD (по умолчанию: {DEFAULT_SOCKET})",
+    )
     parser.add_argument(
         "--summarize",
         action="store_true",
+        default=default(False),
         help="Рекурсивно суммаризовать маршруты для минимизации размера списка",
     )
+    parser.add_argument(
+        "--route-action",
+        choices=ROUTE_ACTIONS,
+        default=default(DEFAULT_ROUTE_ACTION),
+        help="Действие для маршрутов в BIRD (по умолчанию: " f"{DEFAULT_ROUTE_ACTION})",
+    )
+    parser.add_argument(
+        "--route-comments",
+        action="store_true",
+        default=default(False),
+        help="Добавлять к маршрутам комментарии с именами источников",
+    )
+    parser.add_argument(
+        "--max-routes",
+        type=int,
+        default=default(0),
+        metavar="N",
+        help="Не больше N маршрутов каждого семейства: соседние сети "
+        "объединяются в надсети с наименьшим лишним адресным пространством, "
+        "не задевая исключения (по умолчанию: без ограничения)",
+    )
+    parser.add_argument(
+        "--emit",
+        action="append",
+        default=default([]),
+        metavar="FORMAT=FILE",
+        help="Дополнительно записать итоговый набор в формате "
+        f"{' или '.join(sorted(EMITTERS))}, можно указать несколько раз",
+    )
+    parser.add_argument(
+        "--set-name",
+        default=default(DEFAULT_SET_NAME),
+        help="Имя таблицы nftables и основа имён наборов (<имя>4, <имя>6) "
+        f"для --emit (по умолчанию: {DEFAULT_SET_NAME})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default(1),
+        metavar="N",
+        help="Число процессов для исключений и суммаризации больших списков "
+        "(по умолчанию: 1)",
+    )
+    parser.add_argument(
+        "--source-timeout",
+        type=float,
+        default=default(SOURCE_TIMEOUT),
+        help="Срок загрузки одного источника в секундах "
+        f"(по умолчанию: {SOURCE_TIMEOUT})",
+    )
+    parser.add_argument(
+        "--fetch-deadline",
+        type=float,
+        default=default(FETCH_DEADLINE),
+        help="Общий срок загрузки всех источников в секундах "
+        f"(по умолчанию: {FETCH_DEADLINE})",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        default=default(None),
+        help="Файл метрик для textfile collector node-exporter (*.prom)",
+    )
+    parser.add_argument(
+        "--metrics-json", default=default(None), help="Файл метрик в формате JSON"
+    )
+    parser.add_argument(
+        "--index",
+        default=default(DEFAULT_INDEX_FILE),
+        help="Файл индекса маршрутов для подкоманды lookup "
+        f"(по умолчанию: {DEFAULT_INDEX_FILE})",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        default=default(DEFAULT_HISTORY_SIZE),
+        metavar="N",
+        help="Число хранимых журналов изменений маршрутов, 0 - не записывать "
+        f"(по умолчанию: {DEFAULT_HISTORY_SIZE})",
+    )
+    parser.add_argument(
+        "--sources",
+        default=default(None),
+        help="JSON-файл с описаниями источников (дополняет и заменяет встроенные)",
+    )
+    return parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Создаёт парсер аргументов: общий режим и подкоманды."""
+    parser = argparse.ArgumentParser(
+        description="Сбор и фильтрация маршрутов.", parents=[_common_parser()]
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    daemon = subparsers.add_parser(
+        "daemon",
+        parents=[_common_parser(suppress_defaults=True)],
+        help="Работать постоянно, обновляя источники по расписанию",
+        description="Фоновый режим: каждый источник обновляется по своему "
+        "расписанию, список пересобирается только при изменениях. "
+        "SIGHUP запускает обновление всех источников.",
+    )
+    daemon.add_argument(
+        "--interval",
+        action="append",
+        default=[],
+        metavar="SOURCE=SECONDS",
+        help="Интервал обновления источника (ключ кэша источника), "
+        "можно указать несколько раз",
+    )
+    lookup = subparsers.add_parser(
+        "lookup",
+        help="Найти маршруты, покрывающие IP-адреса",
+        description="Ищет адреса в индексе последней сборки по наибольшему "
+        "совпадению префикса и выводит префикс и источники. Без адресов "
+        "и файла адреса читаются из стандартного ввода.",
+    )
+    lookup.add_argument("addresses", nargs="*", metavar="ip", help="IP-адреса")
+    lookup.add_argument(
+        "-f", "--file", help="Файл с адресами по одному в строке (- для stdin)"
+    )
+    # Без значения по умолчанию: иначе --index перед lookup был бы затёрт
+    lookup.add_argument(
+        "--index",
+        default=argparse.SUPPRESS,
+        help=f"Файл индекса маршрутов (по умолчанию: {DEFAULT_INDEX_FILE})",
+    )
+    return parser
+
+
+def parse_intervals(values: List[str]) -> Dict[str, float]:
+    """Разбирает значения вида источник=секунды."""
+    intervals = {}
+    known = default_intervals()
+    for value in values:
+        source, _, seconds = value.partition("=")
+        if source not in known:
+            raise ValueError(f"unknown source {source!r}")
+        try:
+            intervals[source] = float(seconds)
+        except ValueError:
+            raise ValueError(f"invalid interval {value!r}")
+        if intervals[source] <= 0:
+            raise ValueError(f"interval must be positive: {value!r}")
+    return intervals
+
+
+def parse_emitters(values: List[str]) -> Dict[str, str]:
+    """Разбирает значения вида формат=файл."""
+    emit = {}
+    for value in values:
+        emitter, _, filename = value.partition("=")
+        if emitter not in EMITTERS:
+            raise ValueError(f"unknown format {emitter!r}")
+        if not filename.strip():
+            raise ValueError(f"output file not specified: {value!r}")
+        emit[emitter] = filename
+    return emit
+
+
+def main():
+    """
+    Основная функция программы.
+    Обрабатывает аргументы командной строки и выполняет соответствующие действия.
+    """
+    parser = build_parser()
     args = parser.parse_args()
 
-    if not args.output or not args.output.strip():
+    if args.command == "lookup":
+        sys.exit(lookup(args))
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.max_routes < 0:
+        parser.error("--max-routes must not be negative")
+    try:
+        emit = parse_emitters(args.emit)
+    except ValueError as e:
+        parser.error(f"--emit: {e}")
+    for output in emit.values():
+        prepare_output(output)
+
+    if args.sources:
+        try:
+            load_sources(args.sources)
+        except (IOError, OSError, ValueError) as e:
+            print(
+                f"Error: Could not load sources from {args.sources}: {e}",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    if args.command == "daemon":
+        try:
+            intervals = parse_intervals(args.interval)
+        except ValueError as e:
+            parser.error(f"--interval: {e}")
+        prepare_output(args.output)
+        if args.output6:
+            prepare_output(args.output6)
+        RouteDaemon(
+            args.output,
+            as_list_file=args.as_list.strip() or None,
+            exclude_file=args.exclude.strip() or None,
+            summarize=args.summarize,
+            apply=args.apply,
+            bird_socket=args.bird_socket,
+            intervals=intervals,
+            source_timeout=args.source_timeout,
+            deadline=args.fetch_deadline,
+            metrics_textfile=args.metrics_textfile,
+            metrics_json=args.metrics_json,
+            route_action=args.route_action,
+            route_comments=args.route_comments,
+            output6_file=args.output6,
+            index_file=args.index,
+            history_size=args.history,
+            workers=args.workers,
+            emit=emit,
+            set_name=args.set_name,
+            max_routes=args.max_routes,
+        ).run_forever()
+        return
+
+    started = time.time()
+    success = False
+    try:
+        success = run(args, emit)
+    finally:
+        if args.metrics_textfile or args.metrics_json:
+            set_metric("antibl_run_success", int(success))
+            set_metric("antibl_run_duration_seconds", time.time() - started)
+            set_metric("antibl_last_run_timestamp_seconds", int(started))
+            write_metrics(args.metrics_textfile, args.metrics_json)
+
+
+def _lookup_queries(args) -> Iterable[str]:
+    if args.addresses:
+        yield from args.addresses
+    if args.file and args.file != "-":
+        with open(args.file, "r", encoding="utf-8") as f:
+            yield from f
+    elif args.file or not args.addresses:
+        yield from sys.stdin
+
+
+def lookup(args) -> int:
+    """
+    Отвечает на запросы подкоманды lookup. Возвращает код завершения:
+    0 - хотя бы один адрес найден, 1 - ни одного, 2 - ошибка.
+    """
+    try:
+        index = load_route_index(args.index)
+    except (IOError, OSError, ValueError) as e:
+        print(f"Error: Could not load lookup index {args.index}: {e}", file=sys.stderr)
+        return 2
+
+    found = False
+    out = sys.stdout
+    try:
+        for query in _lookup_queries(args):
+            query = query.strip()
+            if not query or query.startswith("#"):
+                continue
+            try:
+                match = index.lookup(query)
+            except ValueError as e:
+                print(f"Warning: {e}", file=sys.stderr)
+                continue
+            if match is None:
+                out.write(f"{query} -\n")
+                continue
+            prefix, sources = match
+            out.write(f"{query} {prefix} {','.join(sources) or '-'}\n")
+            found = True
+    except (IOError, OSError) as e:
+        print(f"Error: Could not read addresses: {e}", file=sys.stderr)
+        return 2
+    return 0 if found else 1
+
+
+def prepare_output(output: str):
+    """Проверяет выходной файл и создаёт его директорию; при ошибке завершает работу."""
+    if not output or not output.strip():
         print("Error: Output file not specified", file=sys.stderr)
         sys.exit(1)
 
     # Проверяем, что директория для выходного файла существует
-    output_dir = os.path.dirname(args.output)
+    output_dir = os.path.dirname(output)
     if output_dir and not os.path.exists(output_dir):
         try:
             os.makedirs(output_dir)
@@ -66,6 +371,16 @@ def main():
             )
             sys.exit(1)
 
+
+def run(args, emit: Optional[Dict[str, str]] = None) -> bool:
+    """
+    Собирает маршруты и при необходимости применяет их в BIRD.
+    emit - дополнительные форматы вывода и их файлы.
+    """
+    prepare_output(args.output)
+    if args.output6:
+        prepare_output(args.output6)
+
     try:
         print(f"Collecting routes and writing to {args.output}...")
         # Подготавливаем аргументы для collect_routes
@@ -77,6 +392,17 @@ def main():
             args.output,
             exclude_arg,
             args.summarize,
+            args.source_timeout,
+            args.fetch_deadline,
+            args.route_action,
+            args.route_comments,
+            args.output6,
+            args.index,
+            args.history,
+            args.workers,
+            emit,
+            args.set_name,
+            args.max_routes,
         )
         print("Routes collection completed successfully.")
     except KeyboardInterrupt:
@@ -90,10 +416,12 @@ def main():
     if os.path.exists(args.output) and os.path.getsize(args.output) > 0:
         print(f"Output file {args.output} created successfully.")
 
-        # Применяем BIRD конфигурацию, если запрошено
-        if args.apply:
-            if not apply_bird_configuration():
-                sys.exit(1)
+        # Применяем BIRD конфигурацию, если запрошено и маршруты изменились
+        if args.apply and not apply_routes_file(
+            args.output, args.bird_socket, args.output6
+        ):
+            sys.exit(1)
+        return True
     else:
         print(
             f"Warning: Output file {args.output} is empty or was not created",
@@ -104,6 +432,7 @@ def main():
                 "Cannot apply BIRD configuration - output file is invalid",
                 file=sys.stderr,
             )
+        return False
 
 
 if __name__ == "__main__":
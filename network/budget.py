@@ -0,0 +1,153 @@
+"""
+Модуль ограничения числа маршрутов (--max-routes): соседние префиксы жадно
+объединяются в надсети, начиная с тех, что добавляют меньше всего лишнего
+адресного пространства. Надсеть, задевающая исключения, не создаётся.
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import List, Tuple
+
+from network.intervals import Range, aggregate_sorted, prefix_to_range
+from network.prefix_array import PrefixArrayType
+
+
+class _Fenwick:
+    """Дерево Фенвика: изменение элемента и сумма отрезка за O(log n)."""
+
+    __slots__ = ("tree",)
+
+    def __init__(self, size: int):
+        self.tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int):
+        tree = self.tree
+        size = len(tree)
+        index += 1
+        while index < size:
+            tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, stop: int) -> int:
+        """Сумма элементов [0, stop)."""
+        tree = self.tree
+        total = 0
+        while stop > 0:
+            total += tree[stop]
+            stop -= stop & -stop
+        return total
+
+
+def _supernet(start: int, end: int, bits: int) -> Tuple[int, int]:
+    """Наименьший префикс, содержащий диапазон [start, end]."""
+    length = bits - (start ^ end).bit_length()
+    host_bits = bits - length
+    return start >> host_bits << host_bits, length
+
+
+def limit_routes(
+    prefixes: PrefixArrayType, max_routes: int, exclude_ranges: List[Range]
+) -> Tuple[PrefixArrayType, int]:
+    """
+    Сокращает отсортированные префиксы одного семейства до max_routes,
+    объединяя соседей в надсети. exclude_ranges - объединённые диапазоны
+    исключений, которые надсети не должны задевать. Возвращает префиксы
+    и число добавленных адресов. Если без исключений сократить список
+    до max_routes нельзя, возвращает наименьший достижимый.
+    """
+    if len(prefixes) <= max_routes:
+        return prefixes, 0
+    bits = prefixes.BITS
+    array_type = type(prefixes)
+    items = aggregate_sorted(prefixes, bits)
+    count = len(items)
+    if count <= max_routes:
+        return array_type.from_prefixes(items), 0
+
+    # Исходные префиксы не пересекаются: текущий элемент списка - надсеть
+    # подряд идущих исходных, он хранится в позиции первого из них
+    ranges = [prefix_to_range(addr, length, bits) for addr, length in items]
+    first_starts = [start for start, _ in ranges]
+    covered = [0]  # type: List[int]
+    for start, end in ranges:
+        covered.append(covered[-1] + end - start + 1)
+    ex_starts = [start for start, _ in exclude_ranges]
+    ex_ends = [end for _, end in exclude_ranges]
+
+    starts = first_starts[:]
+    ends = [end for _, end in ranges]
+    lengths = [length for _, length in items]
+    prev = list(range(-1, count - 1))
+    nxt = list(range(1, count + 1))
+    nxt[-1] = -1
+    alive = [True] * count
+    # Лишнее адресное пространство каждого текущего элемента
+    item_waste = [0] * count
+    waste = _Fenwick(count)
+
+    def merge_cost(start: int, end: int) -> Tuple[int, int, int]:
+        """Позиции исходных префиксов надсети и добавляемые ею адреса."""
+        lo = bisect_left(first_starts, start)
+        hi = bisect_right(first_starts, end)
+        inside = covered[hi] - covered[lo] + waste.prefix_sum(hi)
+        inside -= waste.prefix_sum(lo)
+        return lo, hi, end - start + 1 - inside
+
+    # Кандидаты: (добавляемые адреса, начало надсети, длина, левый, правый)
+    heap = []  # type: List[Tuple[int, int, int, int, int]]
+
+    def push(left: int):
+        right = nxt[left] if left >= 0 else -1
+        if right < 0:
+            return
+        addr, length = _supernet(starts[left], ends[right], bits)
+        start, end = prefix_to_range(addr, length, bits)
+        # Исключения не пересекаются: достаточно проверить последнее,
+        # начинающееся не позже конца надсети
+        i = bisect_right(ex_starts, end) - 1
+        if i >= 0 and ex_ends[i] >= start:
+            return
+        extra = merge_cost(start, end)[2]
+        heapq.heappush(heap, (extra, start, length, left, right))
+
+    for position in range(count - 1):
+        push(position)
+
+    added = 0
+    while count > max_routes and heap:
+        extra, start, length, left, right = heapq.heappop(heap)
+        if not alive[left] or nxt[left] != right:
+            continue
+        end = prefix_to_range(start, length, bits)[1]
+        lo, hi, current = merge_cost(start, end)
+        # Объединения внутри надсети уменьшают её цену: пересчитываем
+        if current != extra:
+            heapq.heappush(heap, (current, start, length, left, right))
+            continue
+
+        # Элементы внутри надсети идут подряд, первый хранится в позиции lo
+        position = lo
+        while position >= 0 and position < hi:
+            if item_waste[position]:
+                waste.add(position, -item_waste[position])
+                item_waste[position] = 0
+            if position != lo:
+                alive[position] = False
+                count -= 1
+            position = nxt[position]
+        item_waste[lo] = end - start + 1 - (covered[hi] - covered[lo])
+        waste.add(lo, item_waste[lo])
+        starts[lo], ends[lo], lengths[lo] = start, end, length
+        nxt[lo] = position
+        if position >= 0:
+            prev[position] = lo
+        added += current
+        push(prev[lo])
+        push(lo)
+
+    result = array_type()
+    position = 0
+    while position >= 0:
+        result.append(starts[position], lengths[position])
+        position = nxt[position]
+    return result, added
@@ -0,0 +1,166 @@
+"""
+Модуль вывода итогового набора маршрутов для других потребителей: наборы
+nftables (файл для nft -f) и ipset (сценарий для ipset restore). Оба формата
+строятся за один проход по отсортированным префиксам, объединённым
+в непересекающиеся диапазоны.
+"""
+
+import socket
+from typing import Callable, Dict, Iterator
+
+from network.intervals import Range, prefix_to_range, range_to_prefixes
+from network.prefix_array import DualPrefixArray, PrefixArrayType
+from network.writer import WRITE_BUFFER_SIZE, same_content
+from utils.file_utils import write_file_atomic
+
+# Имя таблицы nftables и основа имён наборов (<имя>4 и <имя>6)
+DEFAULT_SET_NAME = "antibl"
+
+# Число элементов в одной команде add element файла nftables
+NFT_ELEMENTS_PER_LINE = 1024
+
+# Значение maxelem наборов ipset. Оно одинаково во всех запусках: create -exist
+# для существующего набора с другим maxelem завершается ошибкой. Память
+# выделяется по числу элементов, а не по maxelem. Размер хеш-таблицы
+# (hashsize) при сравнении наборов не учитывается и подбирается по числу
+# префиксов
+IPSET_MAXELEM = 1 << 24
+
+# Наименьший размер хеш-таблицы набора ipset
+IPSET_MIN_HASHSIZE = 1024
+
+_SET_SUFFIXES = {32: "4", 128: "6"}
+_NFT_TYPES = {32: "ipv4_addr", 128: "ipv6_addr"}
+_IPSET_FAMILIES = {32: "inet", 128: "inet6"}
+
+
+def _set_name(name: str, prefixes: PrefixArrayType) -> str:
+    return f"{name}{_SET_SUFFIXES[prefixes.BITS]}"
+
+
+def _format_address(addr: int, bits: int) -> str:
+    if bits == 32:
+        return socket.inet_ntoa(addr.to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, addr.to_bytes(16, "big"))
+
+
+def iter_merged_ranges(prefixes: PrefixArrayType) -> Iterator[Range]:
+    """
+    Перебирает объединённые пересекающиеся и смежные диапазоны
+    отсортированных префиксов без построения промежуточного списка.
+    """
+    bits = prefixes.BITS
+    current = None
+    for addr, length in prefixes:
+        start, end = prefix_to_range(addr, length, bits)
+        if current is not None and start <= current[1] + 1:
+            if end > current[1]:
+                current = (current[0], end)
+            continue
+        if current is not None:
+            yield current
+        current = (start, end)
+    if current is not None:
+        yield current
+
+
+def _nft_elements(prefixes: PrefixArrayType) -> Iterator[str]:
+    bits = prefixes.BITS
+    for start, end in iter_merged_ranges(prefixes):
+        blocks = range_to_prefixes(start, end, bits)
+        if len(blocks) == 1:
+            yield prefixes.format(*blocks[0])
+        else:
+            yield f"{_format_address(start, bits)}-{_format_address(end, bits)}"
+
+
+def render_nft(
+    prefixes: DualPrefixArray, name: str = DEFAULT_SET_NAME
+) -> Iterator[str]:
+    """
+    Перебирает строки файла для nft -f: таблица inet с наборами <имя>4
+    и <имя>6 (flags interval, auto-merge), которые очищаются и заполняются
+    заново. nft применяет файл одной транзакцией.
+    """
+    yield "# Generated by antibl, load with: nft -f <file>\n"
+    yield f"add table inet {name}\n"
+    for family in prefixes:
+        yield (
+            f"add set inet {name} {_set_name(name, family)} "
+            f"{{ type {_NFT_TYPES[family.BITS]}; flags interval; auto-merge; }}\n"
+        )
+    for family in prefixes:
+        set_name = _set_name(name, family)
+        yield f"flush set inet {name} {set_name}\n"
+        chunk = []
+        for element in _nft_elements(family):
+            chunk.append(element)
+            if len(chunk) == NFT_ELEMENTS_PER_LINE:
+                yield f"add element inet {name} {set_name} {{ {', '.join(chunk)} }}\n"
+                chunk = []
+        if chunk:
+            yield f"add element inet {name} {set_name} {{ {', '.join(chunk)} }}\n"
+
+
+def _ipset_hashsize(count: int) -> int:
+    # Число непересекающихся префиксов объединения не больше числа исходных
+    hashsize = IPSET_MIN_HASHSIZE
+    while hashsize < count >> 2:
+        hashsize <<= 1
+    return hashsize
+
+
+def render_ipset(
+    prefixes: DualPrefixArray, name: str = DEFAULT_SET_NAME
+) -> Iterator[str]:
+    """
+    Перебирает строки сценария для ipset restore: наборы hash:net <имя>4
+    и <имя>6 заполняются через временные наборы и подменяются командой swap.
+    Рабочий набор создаётся, только если его ещё нет; размер хеш-таблицы
+    задаётся лишь временному набору.
+    """
+    yield "# Generated by antibl, load with: ipset restore < <file>\n"
+    for family in prefixes:
+        set_name = _set_name(name, family)
+        new_name = f"{set_name}-new"
+        options = (
+            f"hash:net family {_IPSET_FAMILIES[family.BITS]} maxelem {IPSET_MAXELEM}"
+        )
+        yield f"create {set_name} {options} -exist\n"
+        yield (
+            f"create {new_name} {options} "
+            f"hashsize {_ipset_hashsize(len(family))} -exist\n"
+        )
+        yield f"flush {new_name}\n"
+        bits = family.BITS
+        fmt = family.format
+        for start, end in iter_merged_ranges(family):
+            for addr, length in range_to_prefixes(start, end, bits):
+                yield f"add {new_name} {fmt(addr, length)}\n"
+        yield f"swap {new_name} {set_name}\n"
+        yield f"destroy {new_name}\n"
+
+
+# Форматы вывода: имя -> функция, перебирающая строки файла
+EMITTERS = {
+    "nft": render_nft,
+    "ipset": render_ipset,
+}  # type: Dict[str, Callable[[DualPrefixArray, str], Iterator[str]]]
+
+
+def write_emitted(
+    emitter: str,
+    prefixes: DualPrefixArray,
+    output_file: str,
+    name: str = DEFAULT_SET_NAME,
+) -> bool:
+    """
+    Записывает итоговые префиксы в формате emitter за один буферизованный
+    проход. Файл с тем же содержимым не перезаписывается.
+    Возвращает True, если файл был перезаписан.
+    """
+    render = EMITTERS[emitter]
+    if same_content(output_file, render(prefixes, name)):
+        return False
+    write_file_atomic(output_file, render(prefixes, name), WRITE_BUFFER_SIZE)
+    return True
@@ -0,0 +1,133 @@
+"""
+Модуль со скомпилированным индексом исключений: объединённые непересекающиеся
+диапазоны адресов каждого семейства, отсортированные по началу. Индекс
+сохраняется в .cache вместе с хешем содержимого списка исключений и
+используется повторно, пока список не изменится.
+"""
+
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from network.intervals import Range
+from network.prefix_array import PrefixArrayType
+from utils.array_file import load_array_file, save_array_file
+
+# Файл индекса (см. utils.array_file): хеш списка исключений в метаданных
+# и массивы в порядке _exclude_index_arrays
+EXCLUDE_INDEX_MAGIC = b"ABLX"
+EXCLUDE_INDEX_VERSION = 1
+EXCLUDE_INDEX_FILE = os.path.join(".cache", "excludes.ranges.bin")
+
+_MASK64 = (1 << 64) - 1
+
+
+class ExcludeIndex:
+    """
+    Диапазоны исключений IPv4 и IPv6 (ranges[0] и ranges[1]) и хеш
+    содержимого списка, из которого они получены.
+    """
+
+    __slots__ = ("ranges", "digest")
+
+    def __init__(
+        self,
+        ranges4: Optional[List[Range]] = None,
+        ranges6: Optional[List[Range]] = None,
+        digest: str = "",
+    ):
+        self.ranges = (
+            ranges4 or [],
+            ranges6 or [],
+        )  # type: Tuple[List[Range], List[Range]]
+        self.digest = digest
+
+    def __len__(self) -> int:
+        return len(self.ranges[0]) + len(self.ranges[1])
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ExcludeIndex) and self.ranges == other.ranges
+
+    def family(self, prefixes: PrefixArrayType) -> List[Range]:
+        """Диапазоны исключений того же семейства, что и prefixes."""
+        return self.ranges[prefixes.BITS == 128]
+
+    def overlaps(self, start: int, end: int, bits: int = 32) -> bool:
+        """Задевает ли диапазон [start, end] хотя бы одно исключение."""
+        ranges = self.ranges[bits == 128]
+        # Последнее исключение, начинающееся не позже конца диапазона
+        i = bisect_left(ranges, (end + 1,)) - 1
+        return i >= 0 and ranges[i][1] >= start
+
+
+def _split64(values: List[int]) -> Tuple[array, array]:
+    return array("Q", (value >> 64 for value in values)), array(
+        "Q", (value & _MASK64 for value in values)
+    )
+
+
+def _exclude_index_arrays(index: ExcludeIndex) -> List[array]:
+    ranges4, ranges6 = index.ranges
+    starts6 = _split64([start for start, _ in ranges6])
+    ends6 = _split64([end for _, end in ranges6])
+    return [
+        starts6[0],
+        starts6[1],
+        ends6[0],
+        ends6[1],
+        array("I", (start for start, _ in ranges4)),
+        array("I", (end for _, end in ranges4)),
+    ]
+
+
+def save_exclude_index(index: ExcludeIndex, cache_file: str = EXCLUDE_INDEX_FILE):
+    """Атомарно записывает индекс исключений в .cache."""
+    try:
+        save_array_file(
+            cache_file,
+            EXCLUDE_INDEX_MAGIC,
+            EXCLUDE_INDEX_VERSION,
+            0,
+            {"digest": index.digest},
+            _exclude_index_arrays(index),
+        )
+    except (IOError, OSError) as e:
+        print(f"Warning: Could not write cache file {cache_file}: {e}", file=sys.stderr)
+
+
+def load_exclude_index(
+    digest: str, cache_file: str = EXCLUDE_INDEX_FILE
+) -> Optional[ExcludeIndex]:
+    """
+    Загружает индекс исключений, скомпилированный из списка с хешем digest.
+    Возвращает None, если индекса нет, он повреждён или список изменился.
+    """
+    if not digest or not os.path.exists(cache_file):
+        return None
+    arrays = [array("Q") for _ in range(4)] + [array("I"), array("I")]
+
+    def make_arrays(meta: Dict[str, Any]) -> List[array]:
+        return arrays
+
+    try:
+        _, meta = load_array_file(
+            cache_file, EXCLUDE_INDEX_MAGIC, EXCLUDE_INDEX_VERSION, make_arrays
+        )
+    except (IOError, OSError, ValueError) as e:
+        print(
+            f"Warning: Ignoring invalid cache file {cache_file}: {e}", file=sys.stderr
+        )
+        return None
+    if meta.get("digest") != digest:
+        return None
+    start_hi, start_lo, end_hi, end_lo, starts4, ends4 = arrays
+    if len(starts4) != len(ends4) or len(start_hi) != len(end_hi):
+        print(f"Warning: Ignoring invalid cache file {cache_file}", file=sys.stderr)
+        return None
+    ranges6 = [
+        ((shi << 64) | slo, (ehi << 64) | elo)
+        for shi, slo, ehi, elo in zip(start_hi, start_lo, end_hi, end_lo)
+    ]
+    return ExcludeIndex(list(zip(starts4, ends4)), ranges6, digest)
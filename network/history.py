@@ -0,0 +1,88 @@
+"""
+Модуль истории изменений маршрутов: различия между снимками итогового набора
+(индексами маршрутов) соседних запусков записываются в журналы изменений
+с источниками каждого префикса. Хранится ограниченное число журналов.
+"""
+
+import os
+import time
+from typing import Iterator, List, Optional
+
+from network.route_index import RouteIndex
+from network.writer import iter_prefix_diff
+from utils.file_utils import write_file_atomic
+
+# Число хранимых журналов изменений
+DEFAULT_HISTORY_SIZE = 30
+
+_CHANGELOG_PREFIX = "routes-"
+_CHANGELOG_SUFFIX = ".diff"
+
+
+def history_dir(index_file: str) -> str:
+    """Директория журналов изменений рядом с файлом индекса."""
+    return os.path.join(os.path.dirname(index_file), "history")
+
+
+def iter_route_changes(new: RouteIndex, old: RouteIndex) -> Iterator[str]:
+    """
+    Перебирает строки изменений вида "+ префикс источники" и
+    "- префикс источники" в порядке адресов, IPv4 перед IPv6.
+    """
+    for new_family, old_family in ((new.v4, old.v4), (new.v6, old.v6)):
+        for sign, position in iter_prefix_diff(
+            new_family.prefixes, old_family.prefixes
+        ):
+            index, family = (new, new_family) if sign > 0 else (old, old_family)
+            prefixes = family.prefixes
+            names = index.source_names(family.masks[position])
+            yield (
+                f"{'+' if sign > 0 else '-'} "
+                f"{prefixes.format(*prefixes._at(position))} "
+                f"{','.join(names) or '-'}\n"
+            )
+
+
+def _changelogs(directory: str) -> List[str]:
+    names = (
+        name
+        for name in os.listdir(directory)
+        if name.startswith(_CHANGELOG_PREFIX) and name.endswith(_CHANGELOG_SUFFIX)
+    )
+    # Имена содержат время записи, поэтому сортировка совпадает с порядком записи
+    return sorted(names)
+
+
+def write_changelog(
+    new: RouteIndex,
+    old: RouteIndex,
+    directory: str,
+    keep: int = DEFAULT_HISTORY_SIZE,
+) -> Optional[str]:
+    """
+    Записывает журнал изменений между снимками и удаляет самые старые журналы
+    сверх keep. Возвращает имя файла или None, если набор не изменился.
+    """
+    changes = list(iter_route_changes(new, old))
+    if not changes:
+        return None
+    added = sum(1 for line in changes if line[0] == "+")
+    stamp = time.gmtime(new.built_at)
+    header = (
+        f"# {time.strftime('%Y-%m-%d %H:%M:%S', stamp)} UTC: "
+        f"+{added} -{len(changes) - added}\n"
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    base = f"{_CHANGELOG_PREFIX}{time.strftime('%Y%m%d-%H%M%S', stamp)}"
+    # Журналы, записанные в ту же секунду, нумеруются по порядку записи
+    same_second = [name for name in _changelogs(directory) if name.startswith(base)]
+    if same_second:
+        last = same_second[-1][len(base) : -len(_CHANGELOG_SUFFIX)]
+        base += f"_{int(last.lstrip('_') or 0) + 1:02d}"
+    filename = os.path.join(directory, base + _CHANGELOG_SUFFIX)
+    write_file_atomic(filename, [header] + changes)
+
+    for name in _changelogs(directory)[:-keep]:
+        os.unlink(os.path.join(directory, name))
+    return filename
@@ -0,0 +1,184 @@
+"""
+Модуль для работы с сетями как с целочисленными диапазонами адресов.
+"""
+
+import heapq
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+Prefix = Tuple[int, int]
+Range = Tuple[int, int]
+
+
+def prefix_to_range(addr: int, prefixlen: int, bits: int = 32) -> Range:
+    """Преобразует префикс (адрес, длина) в диапазон [начало, конец]."""
+    return addr, addr | ((1 << (bits - prefixlen)) - 1)
+
+
+def merge_ranges(ranges: Iterable[Range]) -> List[Range]:
+    """Сортирует диапазоны и объединяет пересекающиеся и смежные."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def range_to_prefixes(start: int, end: int, bits: int = 32) -> List[Prefix]:
+    """Разбивает диапазон [начало, конец] на минимальный набор префиксов."""
+    result = []
+    while start <= end:
+        # Размер блока ограничен выравниванием начала и длиной остатка
+        align = (start & -start).bit_length() - 1 if start else bits
+        span = (end - start + 1).bit_length() - 1
+        size = min(align, span)
+        result.append((start, bits - size))
+        start += 1 << size
+    return result
+
+
+def _iter_route_parts(
+    prefixes: Iterable[Prefix], ex_ranges: List[Range], bits: int
+) -> Iterator[Tuple[Prefix, Optional[List[Prefix]]]]:
+    """
+    Перебирает маршруты с частями, оставшимися после исключений: (маршрут,
+    None), если исключения его не задевают, иначе (маршрут, список частей).
+    """
+    # Исключения не пересекаются и отсортированы, поэтому указатель на первое
+    # исключение, заканчивающееся не раньше начала маршрута, только растёт
+    i = 0
+    for addr, prefixlen in prefixes:
+        start, end = prefix_to_range(addr, prefixlen, bits)
+        if i < len(ex_ranges) and ex_ranges[i][1] < start:
+            # Пропущенные исключения находятся двоичным поиском, поэтому
+            # длинный список исключений между маршрутами не просматривается
+            i = bisect_left(ex_ranges, (start,), i)
+            if ex_ranges[i - 1][1] >= start:
+                i -= 1
+        if i == len(ex_ranges) or ex_ranges[i][0] > end:
+            # Ни одно исключение не пересекается с маршрутом
+            yield (addr, prefixlen), None
+            continue
+
+        parts = []
+        j = i
+        current = start
+        while j < len(ex_ranges) and ex_ranges[j][0] <= end:
+            ex_start, ex_end = ex_ranges[j]
+            if ex_start > current:
+                parts.extend(range_to_prefixes(current, ex_start - 1, bits))
+            current = ex_end + 1
+            j += 1
+        if current <= end:
+            parts.extend(range_to_prefixes(current, end, bits))
+        yield (addr, prefixlen), parts
+
+
+def iter_excluded(
+    prefixes: Iterable[Prefix], ex_ranges: List[Range], bits: int = 32
+) -> Iterator[Prefix]:
+    """
+    Исключает объединённые диапазоны ex_ranges из каждого префикса за один
+    проход. Префиксы должны быть отсортированы по (адрес, длина); части
+    вложенных маршрутов могут выдаваться не по порядку и с повторами.
+    """
+    for route, parts in _iter_route_parts(prefixes, ex_ranges, bits):
+        if parts is None:
+            yield route
+        else:
+            yield from parts
+
+
+def iter_excluded_sorted(
+    prefixes: Iterable[Prefix], ex_ranges: List[Range], bits: int = 32
+) -> Iterator[Prefix]:
+    """
+    То же, что iter_excluded, но части выдаются отсортированными и без
+    повторов. Части маршрута ждут в куче, пока следующие маршруты могут
+    дать меньшие части; куча ограничена частями вложенных маршрутов.
+    """
+    pending = []  # type: List[Prefix]
+    last = None
+    for route, parts in _iter_route_parts(prefixes, ex_ranges, bits):
+        # Части следующих маршрутов не меньше самих маршрутов
+        while pending and pending[0] < route:
+            prefix = heapq.heappop(pending)
+            if prefix != last:
+                yield prefix
+                last = prefix
+        if parts is None:
+            if route != last:
+                yield route
+                last = route
+            continue
+        for prefix in parts:
+            heapq.heappush(pending, prefix)
+    while pending:
+        prefix = heapq.heappop(pending)
+        if prefix != last:
+            yield prefix
+            last = prefix
+
+
+def exclude_prefixes(
+    prefixes: Iterable[Prefix], excludes: Iterable[Prefix], bits: int = 32
+) -> List[Prefix]:
+    """
+    Исключает адресное пространство excludes из каждого префикса за один проход.
+    Возвращает отсортированный список уникальных префиксов.
+    """
+    ex_ranges = merge_ranges(prefix_to_range(a, p, bits) for a, p in excludes)
+    return sorted(set(iter_excluded(sorted(set(prefixes)), ex_ranges, bits)))
+
+
+def aggregate_prefixes(prefixes: Iterable[Prefix], bits: int = 32) -> List[Prefix]:
+    """
+    Агрегирует префиксы за один проход по отсортированному списку:
+    отбрасывает покрытые префиксы и объединяет соседние пары в надсети.
+    """
+    return aggregate_sorted(sorted(prefixes), bits)
+
+
+class _PrefixStack(list):
+    """Список префиксов с тем же append(адрес, длина), что у массивов префиксов."""
+
+    def append(self, addr: int, prefixlen: int):
+        super().append((addr, prefixlen))
+
+
+def aggregate_sorted(
+    prefixes: Iterable[Prefix], bits: int = 32, stack=None
+) -> List[Prefix]:
+    """
+    То же, что aggregate_prefixes, для уже отсортированных префиксов.
+    stack - пустой массив префиксов (см. network.prefix_array), в который
+    собирается результат вместо списка кортежей; он же и возвращается.
+    """
+    if stack is None:
+        stack = _PrefixStack()
+    top = None  # type: Optional[Prefix]
+    for addr, prefixlen in prefixes:
+        # Сохранённые префиксы не пересекаются: покрыть может только последний
+        if top is not None and prefix_to_range(top[0], top[1], bits)[1] >= addr:
+            continue
+
+        # Объединяем префикс с последним сохранённым соседом, пока это возможно
+        while top is not None:
+            top_addr, top_len = top
+            size = 1 << (bits - top_len)
+            if (
+                top_len != prefixlen
+                or top_len == 0
+                or top_addr & size
+                or addr != top_addr + size
+            ):
+                break
+            stack.pop()
+            addr, prefixlen = top_addr, top_len - 1
+            top = stack[-1] if stack else None
+        stack.append(addr, prefixlen)
+        top = (addr, prefixlen)
+    return stack
@@ -0,0 +1,277 @@
+"""
+Модуль для быстрого разбора списков IPv4- и IPv6-адресов и подсетей.
+"""
+
+import ipaddress
+import operator
+import socket
+import sys
+from array import array
+from collections import namedtuple
+from functools import partial
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from network.prefix_array import DualPrefixArray, PrefixArray, PrefixArray6
+
+ParseIssue = namedtuple("ParseIssue", ["line_num", "line", "reason"])
+
+INVALID = "invalid"
+NON_CANONICAL = "non-canonical"
+
+# Маски битов хоста для каждой длины префикса
+_HOST_MASKS = [(1 << (32 - length)) - 1 for length in range(33)]
+
+# Маски битов хоста IPv6 для старших и младших 64 бит адреса
+_HOST_MASKS6_HI = [
+    (1 << (64 - length)) - 1 if length < 64 else 0 for length in range(129)
+]
+_HOST_MASKS6_LO = [
+    (1 << 64) - 1 if length < 64 else (1 << (128 - length)) - 1 for length in range(129)
+]
+
+# Допустимые записи длины префикса
+_PREFIX_LENGTHS = {str(length): length for length in range(33)}
+_PREFIX_LENGTHS6 = {str(length): length for length in range(129)}
+
+# Размер блока разбора: в символах для текста и в строках для списка строк
+CHUNK_CHARS = 1 << 20
+CHUNK_LINES = 1 << 16
+
+_inet_pton4 = partial(socket.inet_pton, socket.AF_INET)
+_inet_pton6 = partial(socket.inet_pton, socket.AF_INET6)
+
+
+def _parse_clean(text: str) -> Optional[PrefixArray]:
+    """
+    Разбирает список без комментариев, пробелов и пустых строк целиком,
+    без цикла по строкам на Python. Возвращает None, если в тексте есть
+    хоть одна строка, требующая построчной проверки.
+    """
+    body = text.strip()
+    if not body:
+        return PrefixArray()
+    try:
+        raw = body.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+
+    # Без цифр и точек от корректного списка остаются только разделители:
+    # ровно один "/" в каждой строке либо ни одного во всех строках
+    skeleton = raw.translate(None, b"0123456789.")
+    line_count = skeleton.count(b"\n") + 1
+    if skeleton == b"/\n" * (line_count - 1) + b"/":
+        parts = body.replace("/", "\n").split("\n")
+        addr_strs, len_strs = parts[0::2], parts[1::2]
+    elif skeleton == b"\n" * (line_count - 1):
+        addr_strs, len_strs = body.split("\n"), None
+    else:
+        return None
+
+    result = PrefixArray()
+    try:
+        result.addrs.frombytes(b"".join(map(_inet_pton4, addr_strs)))
+        if len_strs is None:
+            result.lens.frombytes(bytes([32]) * len(addr_strs))
+        else:
+            result.lens.frombytes(bytes(map(_PREFIX_LENGTHS.__getitem__, len_strs)))
+    except (OSError, KeyError):
+        return None
+    if sys.byteorder == "little":
+        result.addrs.byteswap()
+
+    host_bits = map(
+        operator.and_, result.addrs, map(_HOST_MASKS.__getitem__, result.lens)
+    )
+    if any(host_bits):
+        return None
+    return result
+
+
+def _parse_clean6(text: str) -> Optional[PrefixArray6]:
+    """То же, что _parse_clean, для списка IPv6-префиксов."""
+    body = text.strip()
+    try:
+        raw = body.encode("ascii")
+    except UnicodeEncodeError:
+        return None
+
+    skeleton = raw.translate(None, b"0123456789abcdefABCDEF.:")
+    line_count = skeleton.count(b"\n") + 1
+    if skeleton == b"/\n" * (line_count - 1) + b"/":
+        parts = body.replace("/", "\n").split("\n")
+        addr_strs, len_strs = parts[0::2], parts[1::2]
+    elif skeleton == b"\n" * (line_count - 1):
+        addr_strs, len_strs = body.split("\n"), None
+    else:
+        return None
+
+    # Адрес занимает два соседних uint64: старшую и младшую половины
+    words = array("Q")
+    result = PrefixArray6()
+    try:
+        words.frombytes(b"".join(map(_inet_pton6, addr_strs)))
+        if len_strs is None:
+            result.lens.frombytes(bytes([128]) * len(addr_strs))
+        else:
+            result.lens.frombytes(bytes(map(_PREFIX_LENGTHS6.__getitem__, len_strs)))
+    except (OSError, KeyError):
+        return None
+    if sys.byteorder == "little":
+        words.byteswap()
+    result.hi, result.lo = words[0::2], words[1::2]
+
+    lens = result.lens
+    host_bits = map(
+        operator.or_,
+        map(operator.and_, result.hi, map(_HOST_MASKS6_HI.__getitem__, lens)),
+        map(operator.and_, result.lo, map(_HOST_MASKS6_LO.__getitem__, lens)),
+    )
+    if any(host_bits):
+        return None
+    return result
+
+
+def _iter_chunks(data: Union[str, bytes, Iterable[str]]) -> Iterator[Tuple[int, str]]:
+    """Делит входные данные на блоки целых строк: (номер первой строки, текст)."""
+    if isinstance(data, bytes):
+        data = data.decode("utf-8", errors="replace")
+    if isinstance(data, str):
+        pos = 0
+        line_num = 1
+        while pos < len(data):
+            end = data.find("\n", pos + CHUNK_CHARS)
+            end = len(data) if end < 0 else end + 1
+            chunk = data[pos:end]
+            yield line_num, chunk
+            line_num += chunk.count("\n")
+            pos = end
+        return
+
+    lines = iter(data)
+    line_num = 1
+    while True:
+        batch = list(islice(lines, CHUNK_LINES))
+        if not batch:
+            return
+        yield line_num, "\n".join(batch)
+        line_num += len(batch)
+
+
+def _parse_lines(
+    text: str,
+    first_line: int,
+    result: PrefixArray,
+    issues: List[ParseIssue],
+    fix_host_bits: bool,
+    result6: Optional[PrefixArray6] = None,
+):
+    """
+    Построчно разбирает блок, собирая проблемы с номерами строк.
+    IPv6-префиксы попадают в result6, а без него считаются неверными.
+    """
+    inet_pton = socket.inet_pton
+    af_inet = socket.AF_INET
+    from_bytes = int.from_bytes
+
+    for line_num, raw in enumerate(text.split("\n"), first_line):
+        line = raw.split("#", 1)[0].strip() if "#" in raw else raw.strip()
+        if not line:
+            continue
+
+        addr_str, slash, len_str = line.partition("/")
+        if result6 is not None and ":" in addr_str:
+            _parse_line6(line, line_num, result6, issues, fix_host_bits)
+            continue
+        try:
+            addr = from_bytes(inet_pton(af_inet, addr_str), "big")
+            if not slash:
+                prefixlen = 32
+            elif len_str in _PREFIX_LENGTHS:
+                prefixlen = _PREFIX_LENGTHS[len_str]
+            else:
+                # Редкие формы записи (например, маска) разбирает ipaddress
+                prefixlen = ipaddress.IPv4Network(f"0.0.0.0/{len_str}").prefixlen
+        except (OSError, ValueError):
+            issues.append(ParseIssue(line_num, line, INVALID))
+            continue
+        hostmask = _HOST_MASKS[prefixlen]
+        if addr & hostmask:
+            issues.append(ParseIssue(line_num, line, NON_CANONICAL))
+            if not fix_host_bits:
+                continue
+            addr &= ~hostmask
+
+        result.append(addr, prefixlen)
+
+
+def _parse_line6(
+    line: str,
+    line_num: int,
+    result: PrefixArray6,
+    issues: List[ParseIssue],
+    fix_host_bits: bool,
+):
+    addr_str, slash, len_str = line.partition("/")
+    try:
+        addr = int.from_bytes(_inet_pton6(addr_str), "big")
+        prefixlen = _PREFIX_LENGTHS6[len_str] if slash else 128
+    except (OSError, KeyError):
+        issues.append(ParseIssue(line_num, line, INVALID))
+        return
+    hostmask = (1 << (128 - prefixlen)) - 1
+    if addr & hostmask:
+        issues.append(ParseIssue(line_num, line, NON_CANONICAL))
+        if not fix_host_bits:
+            return
+        addr &= ~hostmask
+    result.append(addr, prefixlen)
+
+
+def _parse(
+    data: Union[str, bytes, Iterable[str]],
+    fix_host_bits: bool,
+    result: PrefixArray,
+    result6: Optional[PrefixArray6],
+) -> List[ParseIssue]:
+    issues = []
+    # Данные обрабатываются блоками, чтобы ограничить объём временных строк.
+    # Чистые блоки (самый частый случай) разбираются целиком, остальные - построчно
+    for first_line, chunk in _iter_chunks(data):
+        parsed = _parse_clean(chunk)
+        if parsed is not None:
+            result.extend(parsed)
+            continue
+        if result6 is not None:
+            parsed6 = _parse_clean6(chunk)
+            if parsed6 is not None:
+                result6.extend(parsed6)
+                continue
+        _parse_lines(chunk, first_line, result, issues, fix_host_bits, result6)
+    return issues
+
+
+def parse_prefixes(
+    data: Union[str, bytes, Iterable[str]], fix_host_bits: bool = False
+) -> Tuple[PrefixArray, List[ParseIssue]]:
+    """
+    Разбирает строки вида a.b.c.d/n или a.b.c.d (как /32) в массив префиксов.
+    Пустые строки и комментарии после # пропускаются. Неверные строки и строки
+    с установленными битами хоста возвращаются в списке проблем с номерами строк;
+    последние при fix_host_bits=True обнуляют биты хоста и принимаются.
+    """
+    result = PrefixArray()
+    issues = _parse(data, fix_host_bits, result, None)
+    return result, issues
+
+
+def parse_dual_prefixes(
+    data: Union[str, bytes, Iterable[str]], fix_host_bits: bool = False
+) -> Tuple[DualPrefixArray, List[ParseIssue]]:
+    """
+    То же, что parse_prefixes, но IPv6-префиксы (x:y::/n или адрес как /128)
+    разбираются в отдельный массив, а не считаются неверными.
+    """
+    result = DualPrefixArray()
+    issues = _parse(data, fix_host_bits, result.v4, result.v6)
+    return result, issues
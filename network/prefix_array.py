@@ -0,0 +1,366 @@
+"""
+Модуль с компактными массивами IPv4- и IPv6-префиксов.
+"""
+
+import heapq
+import mmap
+import socket
+import tempfile
+from abc import ABC, abstractmethod
+from array import array
+from contextlib import ExitStack, contextmanager
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from network.intervals import Prefix, Range, merge_ranges, prefix_to_range
+
+_MASK64 = (1 << 64) - 1
+
+# Большие массивы сортируются частями такого размера: отсортированные части
+# сбрасываются во временные файлы и сливаются за один проход, поэтому
+# в памяти одновременно не бывает множества всех префиксов
+UNIQUE_CHUNK = 1 << 18
+
+
+def format_prefix(addr: int, prefixlen: int) -> str:
+    """Преобразует префикс (адрес, длина) в строку вида a.b.c.d/n."""
+    return f"{socket.inet_ntoa(addr.to_bytes(4, 'big'))}/{prefixlen}"
+
+
+def format_prefix6(addr: int, prefixlen: int) -> str:
+    """Преобразует IPv6-префикс (адрес, длина) в строку вида x:y::/n."""
+    return f"{socket.inet_ntop(socket.AF_INET6, addr.to_bytes(16, 'big'))}/{prefixlen}"
+
+
+class WideKeys:
+    """Последовательность 128-битных чисел из двух массивов uint64 (для bisect)."""
+
+    __slots__ = ("hi", "lo")
+
+    def __init__(self, hi: array, lo: array):
+        self.hi = hi
+        self.lo = lo
+
+    def __len__(self) -> int:
+        return len(self.hi)
+
+    def __getitem__(self, index: int) -> int:
+        return (self.hi[index] << 64) | self.lo[index]
+
+
+class _PrefixArrayBase(ABC):
+    """Общие операции массивов префиксов, не зависящие от размера адреса."""
+
+    __slots__ = ()
+
+    # Размер адреса в битах, метка семейства в метриках и число младших бит
+    # ключа сортировки, занятых длиной префикса
+    BITS = 0
+    FAMILY = ""
+    _LEN_BITS = 0
+
+    @classmethod
+    def from_prefixes(cls, prefixes: Iterable[Prefix]):
+        """Создаёт массив из пар (адрес, длина)."""
+        result = cls()
+        result.extend(prefixes)
+        return result
+
+    @abstractmethod
+    def _arrays(self) -> Tuple[array, ...]:
+        """Параллельные массивы, в которых хранятся префиксы."""
+
+    @abstractmethod
+    def append(self, addr: int, prefixlen: int):
+        """Добавляет префикс в конец массива."""
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[Prefix]:
+        """Перебирает префиксы в виде пар (адрес, длина)."""
+
+    @abstractmethod
+    def _at(self, index: int) -> Prefix:
+        """Префикс с номером index."""
+
+    @abstractmethod
+    def _put(self, index: int, addr: int, prefixlen: int):
+        """Заменяет префикс с номером index."""
+
+    @abstractmethod
+    def addresses(self) -> Sequence[int]:
+        """Возвращает адреса префиксов в виде последовательности чисел."""
+
+    @classmethod
+    @abstractmethod
+    def format(cls, addr: int, prefixlen: int) -> str:
+        """Преобразует префикс в строку."""
+
+    @classmethod
+    def _from_keys(cls, keys: Iterable[int]):
+        result = cls()
+        append = result.append
+        mask = (1 << cls._LEN_BITS) - 1
+        for key in keys:
+            append(key >> cls._LEN_BITS, key & mask)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.lens)
+
+    def pop(self) -> Prefix:
+        """Удаляет и возвращает последний префикс."""
+        prefix = self._at(-1)
+        for data in self._arrays():
+            data.pop()
+        return prefix
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._arrays() == other._arrays()
+
+    @property
+    def nbytes(self) -> int:
+        """Объём памяти, занятый данными массива, в байтах."""
+        return sum(len(data) * data.itemsize for data in self._arrays())
+
+    def slice(self, start: int, stop: int):
+        """Возвращает копию части массива [start, stop)."""
+        return type(self)(*(data[start:stop] for data in self._arrays()))
+
+    def extend(self, prefixes: Iterable[Prefix]):
+        """Добавляет префиксы в конец массива."""
+        if type(prefixes) is type(self):
+            for data, other in zip(self._arrays(), prefixes._arrays()):
+                data.extend(other)
+            return
+        append = self.append
+        for addr, prefixlen in prefixes:
+            append(addr, prefixlen)
+
+    def _keys(self) -> Iterator[int]:
+        shift = self._LEN_BITS
+        return ((addr << shift) | length for addr, length in self)
+
+    def sorted(self):
+        """Возвращает массив, отсортированный по (адрес, длина)."""
+        return self._from_keys(sorted(self._keys()))
+
+    def unique(self):
+        """Возвращает отсортированный массив без повторов."""
+        if len(self) <= UNIQUE_CHUNK:
+            return self._from_keys(sorted(set(self._keys())))
+        with ExitStack() as stack:
+            parts = [
+                stack.enter_context(
+                    _spilled(self.slice(start, start + UNIQUE_CHUNK).unique())
+                )
+                for start in range(0, len(self), UNIQUE_CHUNK)
+            ]
+            return self.merge(parts)
+
+    @classmethod
+    def merge(cls, arrays: Iterable["_PrefixArrayBase"]):
+        """
+        Сливает отсортированные массивы без повторов в один за один проход
+        с кучей по текущим префиксам каждого массива.
+        """
+        result = cls()
+        append = result.append
+        last = None
+        for prefix in heapq.merge(*arrays):
+            if prefix != last:
+                append(*prefix)
+                last = prefix
+        return result
+
+    def to_ranges(self) -> List[Range]:
+        """Возвращает объединённые непересекающиеся диапазоны адресов."""
+        bits = self.BITS
+        return merge_ranges(
+            prefix_to_range(addr, length, bits) for addr, length in self
+        )
+
+    def to_strings(self) -> Iterator[str]:
+        """Перебирает префиксы в виде строк."""
+        fmt = self.format
+        return (fmt(addr, length) for addr, length in self)
+
+
+@contextmanager
+def _spilled(prefixes: _PrefixArrayBase) -> Iterator[_PrefixArrayBase]:
+    """
+    Записывает массив во временный файл и возвращает массив того же типа,
+    читающий данные из отображения файла в память (только для чтения).
+    """
+    array_type = type(prefixes)
+    layout = [(data.typecode, len(data) * data.itemsize) for data in prefixes._arrays()]
+    with tempfile.TemporaryFile() as f:
+        for data in prefixes._arrays():
+            data.tofile(f)
+        f.flush()
+        del prefixes
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            views = []
+            offset = 0
+            with memoryview(mm) as view:
+                for typecode, size in layout:
+                    views.append(view[offset : offset + size].cast(typecode))
+                    offset += size
+                try:
+                    yield array_type(*views)
+                finally:
+                    for data in views:
+                        data.release()
+
+
+class PrefixArray(_PrefixArrayBase):
+    """
+    Массив IPv4-префиксов в двух параллельных массивах: адреса (uint32)
+    и длины префиксов (uint8), то есть 5 байт на префикс.
+    """
+
+    __slots__ = ("addrs", "lens")
+
+    BITS = 32
+    FAMILY = "ipv4"
+    _LEN_BITS = 6
+
+    def __init__(self, addrs: Optional[array] = None, lens: Optional[array] = None):
+        self.addrs = addrs if addrs is not None else array("I")
+        self.lens = lens if lens is not None else array("B")
+
+    def _arrays(self) -> Tuple[array, ...]:
+        return self.addrs, self.lens
+
+    def __iter__(self) -> Iterator[Prefix]:
+        return zip(self.addrs, self.lens)
+
+    def _at(self, index: int) -> Prefix:
+        return self.addrs[index], self.lens[index]
+
+    __getitem__ = _at
+
+    def _put(self, index: int, addr: int, prefixlen: int):
+        self.addrs[index] = addr
+        self.lens[index] = prefixlen
+
+    def addresses(self) -> Sequence[int]:
+        return self.addrs
+
+    format = staticmethod(format_prefix)
+
+    def append(self, addr: int, prefixlen: int):
+        """Добавляет префикс в конец массива."""
+        self.addrs.append(addr)
+        self.lens.append(prefixlen)
+
+
+class PrefixArray6(_PrefixArrayBase):
+    """
+    Массив IPv6-префиксов: старшие и младшие 64 бита адреса (uint64)
+    и длины префиксов (uint8), то есть 17 байт на префикс.
+    """
+
+    __slots__ = ("hi", "lo", "lens")
+
+    BITS = 128
+    FAMILY = "ipv6"
+    _LEN_BITS = 8
+
+    def __init__(
+        self,
+        hi: Optional[array] = None,
+        lo: Optional[array] = None,
+        lens: Optional[array] = None,
+    ):
+        self.hi = hi if hi is not None else array("Q")
+        self.lo = lo if lo is not None else array("Q")
+        self.lens = lens if lens is not None else array("B")
+
+    def _arrays(self) -> Tuple[array, ...]:
+        return self.hi, self.lo, self.lens
+
+    def __iter__(self) -> Iterator[Prefix]:
+        return (
+            ((hi << 64) | lo, length)
+            for hi, lo, length in zip(self.hi, self.lo, self.lens)
+        )
+
+    def _at(self, index: int) -> Prefix:
+        return (self.hi[index] << 64) | self.lo[index], self.lens[index]
+
+    __getitem__ = _at
+
+    def _put(self, index: int, addr: int, prefixlen: int):
+        self.hi[index] = addr >> 64
+        self.lo[index] = addr & _MASK64
+        self.lens[index] = prefixlen
+
+    def addresses(self) -> Sequence[int]:
+        return WideKeys(self.hi, self.lo)
+
+    format = staticmethod(format_prefix6)
+
+    def append(self, addr: int, prefixlen: int):
+        """Добавляет префикс в конец массива."""
+        self.hi.append(addr >> 64)
+        self.lo.append(addr & _MASK64)
+        self.lens.append(prefixlen)
+
+
+# Массив префиксов одного из семейств
+PrefixArrayType = Union[PrefixArray, PrefixArray6]
+
+
+class DualPrefixArray:
+    """Пара массивов префиксов обоих семейств (например, маршруты источника)."""
+
+    __slots__ = ("v4", "v6")
+
+    def __init__(
+        self, v4: Optional[PrefixArray] = None, v6: Optional[PrefixArray6] = None
+    ):
+        self.v4 = v4 if v4 is not None else PrefixArray()
+        self.v6 = v6 if v6 is not None else PrefixArray6()
+
+    def __len__(self) -> int:
+        return len(self.v4) + len(self.v6)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, DualPrefixArray):
+            return NotImplemented
+        return self.v4 == other.v4 and self.v6 == other.v6
+
+    def __iter__(self) -> Iterator[_PrefixArrayBase]:
+        """Перебирает массивы семейств: сначала IPv4, затем IPv6."""
+        return iter((self.v4, self.v6))
+
+    @property
+    def nbytes(self) -> int:
+        """Объём памяти, занятый данными массивов, в байтах."""
+        return self.v4.nbytes + self.v6.nbytes
+
+    def extend(self, other: "DualPrefixArray"):
+        """Добавляет префиксы другой пары в конец массивов."""
+        self.v4.extend(other.v4)
+        self.v6.extend(other.v6)
+
+    def unique(self) -> "DualPrefixArray":
+        """Возвращает отсортированные массивы без повторов."""
+        return DualPrefixArray(self.v4.unique(), self.v6.unique())
+
+    @staticmethod
+    def merge(pairs: Iterable["DualPrefixArray"]) -> "DualPrefixArray":
+        """
+        Сливает отсортированные пары без повторов (например, маршруты
+        источников) без общей копии всех префиксов.
+        """
+        pairs = list(pairs)
+        return DualPrefixArray(
+            PrefixArray.merge(pair.v4 for pair in pairs),
+            PrefixArray6.merge(pair.v6 for pair in pairs),
+        )
+
+    def family(self, prefixes: _PrefixArrayBase) -> _PrefixArrayBase:
+        """Возвращает массив того же семейства, что и prefixes."""
+        return self.v6 if isinstance(prefixes, PrefixArray6) else self.v4
@@ -0,0 +1,356 @@
+"""
+Модуль с множеством префиксов на основе сжатого двоичного дерева (Patricia).
+"""
+
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from network.intervals import Prefix, prefix_to_range, range_to_prefixes
+from network.prefix_array import PrefixArray, PrefixArray6, PrefixArrayType
+
+# Значение узла без префикса (промежуточного или удалённого)
+NO_OWNER = -1
+
+
+class PrefixTrie:
+    """
+    Множество префиксов одного семейства в виде сжатого двоичного дерева.
+    Узлы хранятся в параллельных массивах: префикс узла (массив префиксов
+    того же семейства), номера левого и правого потомков и значение узла,
+    то есть 17 байт на узел IPv4 и 29 байт на узел IPv6. Префиксов
+    в дереве не больше, чем узлов, а узлов - не больше двух на префикс.
+    Значение узла - произвольное неотрицательное число (например, номер
+    префикса в исходном массиве), NO_OWNER - у узлов без префикса.
+    Операции проходят не больше BITS уровней дерева.
+    """
+
+    __slots__ = ("nodes", "left", "right", "owners", "_free")
+
+    def __init__(
+        self,
+        nodes: PrefixArrayType,
+        left: array,
+        right: array,
+        owners: array,
+    ):
+        """
+        Создаёт дерево из готовых массивов узлов (см. empty и from_sorted).
+        Узел 0 - корень 0/0, поэтому номер 0 означает отсутствие потомка.
+        """
+        self.nodes = nodes
+        self.left = left
+        self.right = right
+        self.owners = owners
+        self._free = []  # type: List[int]
+
+    @classmethod
+    def empty(cls, bits: int = 32) -> "PrefixTrie":
+        """Создаёт пустое дерево для адресов длиной bits."""
+        nodes = PrefixArray6() if bits == 128 else PrefixArray()
+        nodes.append(0, 0)
+        return cls(nodes, array("I", [0]), array("I", [0]), array("i", [NO_OWNER]))
+
+    @classmethod
+    def from_sorted(cls, prefixes: PrefixArrayType) -> "PrefixTrie":
+        """
+        Строит дерево за один проход по отсортированным префиксам без повторов.
+        Значение каждого узла - номер префикса в prefixes.
+        """
+        trie = cls.empty(prefixes.BITS)
+        left, right, owners = trie.left, trie.right, trie.owners
+        bits = trie.bits
+        new_node = trie._new_node
+        # Правый путь дерева от корня (узел, адрес, длина): новые префиксы
+        # присоединяются к нему
+        path = [(0, 0, 0)]
+        for number, (addr, prefixlen) in enumerate(prefixes):
+            # Снимаем с пути узлы, не покрывающие префикс
+            last = last_addr = 0
+            while True:
+                top, top_addr, top_len = path[-1]
+                if top_len <= prefixlen and not (top_addr ^ addr) >> (bits - top_len):
+                    break
+                last, last_addr, _ = path.pop()
+            if top_len == prefixlen:
+                owners[top] = number
+                continue
+            children = right if (addr >> (bits - 1 - top_len)) & 1 else left
+            leaf = new_node(addr, prefixlen, number)
+            if last and children[top] == last:
+                # Префикс идёт после снятого поддерева: развилка на первом
+                # различающемся бите, снятое поддерево слева
+                common = bits - (last_addr ^ addr).bit_length()
+                fork_addr = addr & _mask(common, bits)
+                fork = new_node(fork_addr, common, NO_OWNER)
+                left[fork] = last
+                right[fork] = leaf
+                children[top] = fork
+                path.append((fork, fork_addr, common))
+            else:
+                children[top] = leaf
+            path.append((leaf, addr, prefixlen))
+        return trie
+
+    @property
+    def bits(self) -> int:
+        return self.nodes.BITS
+
+    def __len__(self) -> int:
+        return len(self.owners) - self.owners.count(NO_OWNER)
+
+    def __iter__(self) -> Iterator[Prefix]:
+        """Перебирает префиксы в порядке (адрес, длина)."""
+        return (self.nodes._at(node) for node in self._iter_nodes(True))
+
+    def __contains__(self, prefix: Prefix) -> bool:
+        addr, prefixlen = prefix
+        node = self._find(addr, prefixlen)
+        return node is not None and self.owners[node] != NO_OWNER
+
+    def _arrays(self) -> Tuple[array, ...]:
+        """Параллельные массивы, в которых хранятся узлы."""
+        return self.nodes._arrays() + (self.left, self.right, self.owners)
+
+    @property
+    def nbytes(self) -> int:
+        """Объём памяти, занятый узлами дерева, в байтах."""
+        return sum(len(data) * data.itemsize for data in self._arrays())
+
+    def _new_node(self, addr: int, prefixlen: int, owner: int) -> int:
+        if self._free:
+            node = self._free.pop()
+            self.nodes._put(node, addr, prefixlen)
+            self.left[node] = 0
+            self.right[node] = 0
+            self.owners[node] = owner
+            return node
+        self.nodes.append(addr, prefixlen)
+        self.left.append(0)
+        self.right.append(0)
+        self.owners.append(owner)
+        return len(self.owners) - 1
+
+    def _children(self, bit: int) -> array:
+        return self.right if bit else self.left
+
+    def _bit(self, addr: int, position: int) -> int:
+        """Бит адреса в позиции position (0 - старший бит)."""
+        return (addr >> (self.bits - 1 - position)) & 1
+
+    def _common_length(self, addr1: int, len1: int, addr2: int, len2: int) -> int:
+        """Длина общей части двух префиксов."""
+        return min(self.bits - (addr1 ^ addr2).bit_length(), len1, len2)
+
+    def add(self, addr: int, prefixlen: int, owner: int = 0):
+        """Добавляет префикс со значением owner (или заменяет значение)."""
+        bits = self.bits
+        addr &= _mask(prefixlen, bits)
+        nodes, owners = self.nodes, self.owners
+        node = 0
+        while True:
+            node_len = nodes._at(node)[1]
+            if node_len == prefixlen:
+                owners[node] = owner
+                return
+
+            children = self._children(self._bit(addr, node_len))
+            child = children[node]
+            if not child:
+                children[node] = self._new_node(addr, prefixlen, owner)
+                return
+
+            child_addr, child_len = nodes._at(child)
+            common = self._common_length(child_addr, child_len, addr, prefixlen)
+            if common == child_len:
+                node = child
+                continue
+
+            if common == prefixlen:
+                # Новый префикс становится родителем существующего узла
+                new = self._new_node(addr, prefixlen, owner)
+                self._children(self._bit(child_addr, prefixlen))[new] = child
+            else:
+                # Пути расходятся: создаём промежуточный узел
+                new = self._new_node(addr & _mask(common, bits), common, NO_OWNER)
+                leaf = self._new_node(addr, prefixlen, owner)
+                leaf_bit = self._bit(addr, common)
+                self._children(leaf_bit)[new] = leaf
+                self._children(1 - leaf_bit)[new] = child
+            children[node] = new
+            return
+
+    def update(self, prefixes: Iterable[Prefix]):
+        """Добавляет префиксы в множество."""
+        for addr, prefixlen in prefixes:
+            self.add(addr, prefixlen)
+
+    def _path(self, addr: int, prefixlen: int) -> Iterator[int]:
+        """Перебирает узлы дерева, покрывающие префикс, от корня вниз."""
+        nodes = self.nodes
+        node = 0
+        while True:
+            node_addr, node_len = nodes._at(node)
+            if node_len > prefixlen:
+                return
+            if self._common_length(node_addr, node_len, addr, prefixlen) < node_len:
+                return
+            yield node
+            if node_len == prefixlen:
+                return
+            node = self._children(self._bit(addr, node_len))[node]
+            if not node:
+                return
+
+    def _find(self, addr: int, prefixlen: int) -> Optional[int]:
+        for node in self._path(addr, prefixlen):
+            if self.nodes._at(node)[1] == prefixlen:
+                return node
+        return None
+
+    def covering(self, addr: int, prefixlen: int) -> Optional[Prefix]:
+        """Возвращает самый широкий префикс множества, покрывающий данный."""
+        for node in self._path(addr, prefixlen):
+            if self.owners[node] != NO_OWNER:
+                return self.nodes._at(node)
+        return None
+
+    def is_covered(self, addr: int, prefixlen: int) -> bool:
+        """Проверяет, покрыт ли префикс каким-либо префиксом множества."""
+        return self.covering(addr, prefixlen) is not None
+
+    def lookup(self, address: int) -> int:
+        """
+        Возвращает значение самого длинного префикса, содержащего адрес,
+        или NO_OWNER.
+        """
+        nodes, left, right, owners = self.nodes, self.left, self.right, self.owners
+        bits = self.bits
+        result = NO_OWNER
+        node = 0
+        while True:
+            node_addr, node_len = nodes._at(node)
+            if (node_addr ^ address) >> (bits - node_len):
+                return result
+            if owners[node] != NO_OWNER:
+                result = owners[node]
+            if node_len == bits:
+                return result
+            children = right if (address >> (bits - 1 - node_len)) & 1 else left
+            node = children[node]
+            if not node:
+                return result
+
+    def longest_match(self, address: int) -> Optional[Prefix]:
+        """Возвращает самый длинный префикс множества, содержащий адрес."""
+        result = None
+        for node in self._path(address, self.bits):
+            if self.owners[node] != NO_OWNER:
+                result = node
+        return None if result is None else self.nodes._at(result)
+
+    def exclude(self, addr: int, prefixlen: int):
+        """
+        Удаляет из множества адресное пространство префикса: вложенные префиксы
+        удаляются, покрывающие заменяются оставшимися после исключения частями
+        с тем же значением.
+        """
+        bits = self.bits
+        start, end = prefix_to_range(addr, prefixlen, bits)
+
+        # Покрывающие префиксы разбиваются на части вокруг исключения
+        pieces = []
+        for node in self._path(addr, prefixlen):
+            owner = self.owners[node]
+            if owner != NO_OWNER:
+                self.owners[node] = NO_OWNER
+                node_start, node_end = prefix_to_range(*self.nodes._at(node), bits)
+                if node_start < start:
+                    parts = range_to_prefixes(node_start, start - 1, bits)
+                    pieces.extend((part, owner) for part in parts)
+                if end < node_end:
+                    parts = range_to_prefixes(end + 1, node_end, bits)
+                    pieces.extend((part, owner) for part in parts)
+
+        self._cut(addr, prefixlen)
+        for (piece_addr, piece_len), owner in pieces:
+            self.add(piece_addr, piece_len, owner)
+
+    def _cut(self, addr: int, prefixlen: int):
+        """Отрезает поддерево, целиком лежащее внутри префикса."""
+        nodes = self.nodes
+        grandparent, parent, node = None, None, 0
+        while True:
+            node_addr, node_len = nodes._at(node)
+            common = self._common_length(node_addr, node_len, addr, prefixlen)
+            if node_len >= prefixlen:
+                if common < prefixlen:
+                    return
+                break
+            if common < node_len:
+                return
+            child = self._children(self._bit(addr, node_len))[node]
+            if not child:
+                return
+            grandparent, parent, node = parent, node, child
+
+        if parent is None:
+            # Исключение покрывает всё адресное пространство
+            self._release(self.left[0])
+            self._release(self.right[0])
+            self.left[0] = self.right[0] = 0
+            return
+
+        parent_len = nodes._at(parent)[1]
+        self._children(self._bit(addr, parent_len))[parent] = 0
+        self._release(node)
+
+        # Промежуточный узел с одним потомком больше не нужен
+        if grandparent is not None and self.owners[parent] == NO_OWNER:
+            remaining = self.left[parent] or self.right[parent]
+            grandparent_len = nodes._at(grandparent)[1]
+            parent_bit = self._bit(nodes._at(parent)[0], grandparent_len)
+            self._children(parent_bit)[grandparent] = remaining
+            self._release_node(parent)
+
+    def _release_node(self, node: int):
+        self.owners[node] = NO_OWNER
+        self.left[node] = self.right[node] = 0
+        self._free.append(node)
+
+    def _release(self, root: int):
+        """Освобождает узлы поддерева для повторного использования."""
+        stack = [root] if root else []
+        while stack:
+            node = stack.pop()
+            for child in (self.left[node], self.right[node]):
+                if child:
+                    stack.append(child)
+            self._release_node(node)
+
+    def _iter_nodes(self, descend_terminal: bool) -> Iterator[int]:
+        """Перебирает узлы с префиксами в порядке (адрес, длина)."""
+        left, right, owners = self.left, self.right, self.owners
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if owners[node] != NO_OWNER:
+                yield node
+                if not descend_terminal:
+                    continue
+            if right[node]:
+                stack.append(right[node])
+            if left[node]:
+                stack.append(left[node])
+
+    def iter_uncovered(self) -> Iterator[Prefix]:
+        """Перебирает префиксы, не покрытые другими префиксами множества."""
+        return (self.nodes._at(node) for node in self._iter_nodes(False))
+
+    def to_array(self) -> PrefixArrayType:
+        """Возвращает отсортированный массив префиксов."""
+        return type(self.nodes).from_prefixes(self)
+
+
+def _mask(prefixlen: int, bits: int) -> int:
+    """Маска сети длины prefixlen для адресов длиной bits."""
+    return ((1 << bits) - 1) ^ ((1 << (bits - prefixlen)) - 1)
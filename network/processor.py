@@ -2,199 +2,400 @@
 Модуль для обработки сетей и IP-адресов.
 """
 
-import ipaddress
+import multiprocessing
 import sys
-from typing import List
-
-
-def read_networks_from_list(networks: List[str]) -> List[ipaddress.IPv4Network]:
-    """Преобразует список строк в список сетей."""
-    result = []
-    for line in networks:
-        line = line.strip()
-        if line:
-            # Если есть комментарий, берём только часть до #
-            if "#" in line:
-                line = line.split("#")[0].strip()
-            if line:
-                try:
-                    result.append(ipaddress.IPv4Network(line))
-                except ValueError as e:
-                    print(
-                        f"Warning: Invalid network format: {line.strip()}",
-                        file=sys.stderr,
-                    )
-    return result
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Tuple, Union
 
+from network.budget import limit_routes
+from network.exclude_index import ExcludeIndex
+from network.intervals import (
+    Range,
+    aggregate_sorted,
+    iter_excluded_sorted,
+)
+from network.parser import ParseIssue, parse_dual_prefixes, parse_prefixes
+from network.prefix_array import (
+    DualPrefixArray,
+    PrefixArray,
+    PrefixArray6,
+    PrefixArrayType,
+)
+from utils.metrics import set_metric, stage_timer
 
-def exclude_subnets(network: ipaddress.IPv4Network, excludes: list) -> list:
-    """Рекурсивно исключает все подсети из excludes из network."""
-    if not isinstance(network, ipaddress.IPv4Network):
-        print(f"Warning: Invalid network type: {type(network)}", file=sys.stderr)
-        return [network]
+# Параллельная обработка (--workers): адресное пространство делится на блоки
+# по старшим битам адреса (IPv4 - /8, IPv6 - /16), а блоки - на части
+# с примерно равным числом префиксов. Префиксы короче блока обрабатываются
+# отдельно, и при суммаризации границы частей сводятся в конце
+SHARD_BITS = {32: 8, 128: 16}
+# Частей на процесс, чтобы выровнять нагрузку между процессами
+CHUNKS_PER_WORKER = 4
+# Меньшие массивы быстрее обработать в одном процессе
+MIN_SHARDED_PREFIXES = 50000
+
+# Префиксы и диапазоны исключений, доступные процессам пула
+_shared = None  # type: Optional[Tuple[PrefixArrayType, List[Range]]]
+
+
+def read_prefixes_from_list(
+    networks: Iterable[str], kind: str = "routes"
+) -> PrefixArray:
+    """
+    Преобразует список строк в компактный массив префиксов.
+    kind отличает списки (маршруты, исключения) в метриках.
+    """
+    prefixes, issues = parse_prefixes(networks)
+    _report_issues(issues, kind)
+    return prefixes
+
+
+def read_dual_prefixes_from_list(
+    networks: Iterable[str], kind: str = "routes"
+) -> DualPrefixArray:
+    """То же, что read_prefixes_from_list, с разбором и IPv6-префиксов."""
+    prefixes, issues = parse_dual_prefixes(networks)
+    _report_issues(issues, kind)
+    return prefixes
 
-    for ex in excludes:
-        if not isinstance(ex, ipaddress.IPv4Network):
-            print(f"Warning: Invalid exclude type: {type(ex)}", file=sys.stderr)
-            continue
 
-        # Если исключение полностью совпадает с сетью, исключаем её полностью
-        if ex == network:
-            return []
-
-        # Если исключение является подсетью сети
-        if ex.subnet_of(network):
-            result = []
-            try:
-                for sub in network.subnets(new_prefix=network.prefixlen + 1):
-                    if ex == sub:
-                        continue  # полностью совпадает — не добавляем!
-                    if ex.overlaps(sub):
-                        result.extend(exclude_subnets(sub, [ex]))
-                    else:
-                        result.append(sub)
-                return result
-            except ValueError as e:
-                print(
-                    f"Warning: Error processing subnet {network}: {e}", file=sys.stderr
-                )
-                return [network]
-
-        # Если исключение перекрывается с сетью, но не является подсетью
-        elif ex.overlaps(network):
-            # Исключаем перекрывающуюся часть
-            try:
-                # Создаем сеть, исключая перекрывающуюся часть
-                if ex.network_address > network.network_address:
-                    # Исключение начинается после начала сети
-                    if ex.broadcast_address < network.broadcast_address:
-                        # Исключение заканчивается до конца сети
-                        # Разбиваем на две части: до и после исключения
-                        before_ex = ipaddress.IPv4Network(
-                            (network.network_address, ex.network_address - 1),
-                            strict=False,
-                        )
-                        after_ex = ipaddress.IPv4Network(
-                            (ex.broadcast_address + 1, network.broadcast_address),
-                            strict=False,
-                        )
-                        return [before_ex, after_ex]
-                    else:
-                        # Исключение заканчивается после конца сети
-                        before_ex = ipaddress.IPv4Network(
-                            (network.network_address, ex.network_address - 1),
-                            strict=False,
-                        )
-                        return [before_ex]
-                else:
-                    # Исключение начинается до начала сети
-                    if ex.broadcast_address < network.broadcast_address:
-                        # Исключение заканчивается до конца сети
-                        after_ex = ipaddress.IPv4Network(
-                            (ex.broadcast_address + 1, network.broadcast_address),
-                            strict=False,
-                        )
-                        return [after_ex]
-                    else:
-                        # Исключение полностью покрывает сеть
-                        return []
-            except ValueError as e:
-                print(
-                    f"Warning: Error processing overlap for {network} with {ex}: {e}",
-                    file=sys.stderr,
-                )
-                return [network]
-
-    return [network]
-
-
-def summarize_networks(
-    networks: List[ipaddress.IPv4Network],
-) -> List[ipaddress.IPv4Network]:
+def _report_issues(issues: List[ParseIssue], kind: str):
+    set_metric("antibl_invalid_lines", len(issues), list=kind)
+    for issue in issues:
+        print(
+            f"Warning: Invalid network format on line {issue.line_num} "
+            f"({issue.reason}): {issue.line}",
+            file=sys.stderr,
+        )
+
+
+def compile_excludes(excludes: Iterable[str], digest: str = "") -> ExcludeIndex:
     """
-    Упрощенная суммаризация: удаляет сети, которые являются подсетями других сетей.
-    Это быстрее и эффективнее для больших объемов данных.
+    Разбирает список исключений в индекс объединённых диапазонов обоих
+    семейств. digest - хеш содержимого списка для повторного использования.
     """
-    if not networks:
-        return []
-
-    # Сортируем сети по префиксу (от меньшего к большему) и затем по адресу
-    sorted_networks = sorted(networks, key=lambda x: (x.prefixlen, x.network_address))
-
-    # Удаляем сети, которые являются подсетями других сетей
-    result = []
-    for i, net in enumerate(sorted_networks):
-        is_subnet = False
-        # Проверяем только сети с меньшим префиксом (более крупные)
-        for j in range(i):
-            if net.subnet_of(sorted_networks[j]):
-                is_subnet = True
-                break
-        if not is_subnet:
-            result.append(net)
+    with stage_timer("parse_excludes"):
+        parsed = read_dual_prefixes_from_list(excludes, "excludes")
+        return ExcludeIndex(parsed.v4.to_ranges(), parsed.v6.to_ranges(), digest)
+
 
+def process_dual_prefixes(
+    prefixes: DualPrefixArray,
+    excludes: Union[Iterable[str], ExcludeIndex],
+    summarize: bool = False,
+    workers: int = 1,
+    max_routes: int = 0,
+) -> DualPrefixArray:
+    """
+    Применяет исключения и суммаризацию к отсортированным префиксам обоих
+    семейств без повторов. Исключения (строки или скомпилированный индекс)
+    каждого семейства применяются к префиксам того же семейства. При
+    workers > 1 большие списки обрабатываются в пуле процессов, max_routes > 0
+    ограничивает число префиксов каждого семейства (см. apply_route_budget).
+    """
+    if not isinstance(excludes, ExcludeIndex):
+        excludes = compile_excludes(excludes)
+    return DualPrefixArray(
+        *(
+            _process_family(
+                family,
+                excludes.family(family),
+                summarize,
+                workers,
+                max_routes,
+            )
+            for family in prefixes
+        )
+    )
+
+
+def stage_name(stage: str, prefixes: PrefixArrayType) -> str:
+    """Имя стадии в метриках: стадии IPv6 получают суффикс _v6."""
+    return f"{stage}_v6" if isinstance(prefixes, PrefixArray6) else stage
+
+
+def apply_excludes(
+    prefixes: PrefixArrayType, exclude_ranges: List[Range], workers: int = 1
+) -> PrefixArrayType:
+    """
+    Исключает диапазоны из отсортированных префиксов одного семейства,
+    возвращает отсортированный массив без повторов.
+    """
+    if workers > 1 and len(prefixes) >= MIN_SHARDED_PREFIXES:
+        return process_sharded(prefixes, exclude_ranges, False, workers)[1]
+    excluded = iter_excluded_sorted(prefixes, exclude_ranges, prefixes.BITS)
+    return type(prefixes).from_prefixes(excluded)
+
+
+def summarize_prefixes(prefixes: PrefixArrayType, workers: int = 1) -> PrefixArrayType:
+    """Суммаризует отсортированные префиксы одного семейства без повторов."""
+    if workers > 1 and len(prefixes) >= MIN_SHARDED_PREFIXES:
+        return process_sharded(prefixes, [], True, workers)[1]
+    return aggregate_sorted(prefixes, prefixes.BITS, type(prefixes)())
+
+
+def apply_route_budget(
+    prefixes: PrefixArrayType, max_routes: int, exclude_ranges: List[Range]
+) -> PrefixArrayType:
+    """
+    Сокращает отсортированные префиксы одного семейства до max_routes,
+    объединяя соседей в надсети с наименьшим лишним адресным пространством
+    и не задевая диапазоны исключений. Выводит число добавленных адресов.
+    """
+    if len(prefixes) <= max_routes:
+        return prefixes
+    label = "IPv6 " if isinstance(prefixes, PrefixArray6) else ""
+    original_count = len(prefixes)
+    with stage_timer(stage_name("budget", prefixes)):
+        result, added = limit_routes(prefixes, max_routes, exclude_ranges)
+    set_metric("antibl_budget_extra_addresses", added, family=prefixes.FAMILY)
+    print(
+        f"Route budget reduced {label}networks from {original_count} to "
+        f"{len(result)}, covering {added} extra addresses"
+    )
+    if len(result) > max_routes:
+        print(
+            f"Warning: Could not fit {label}routes into {max_routes} "
+            "without covering excluded addresses",
+            file=sys.stderr,
+        )
     return result
 
 
-def process_networks_in_memory(
-    networks: List[str], excludes: List[str], output_file: str, summarize: bool = False
-):
-    """Обрабатывает списки сетей в памяти и создает результирующий файл."""
-    if not networks:
-        print("Warning: No networks to process", file=sys.stderr)
-        return
+def _init_shard_worker(prefixes: PrefixArrayType, exclude_ranges: List[Range]):
+    global _shared
+    _shared = (prefixes, exclude_ranges)
 
-    networks_list = read_networks_from_list(networks)
-    exclude_networks = read_networks_from_list(excludes)
 
-    if not networks_list:
-        print("Warning: No valid networks found after parsing", file=sys.stderr)
-        return
+def _process_shard(
+    task: Tuple[int, int, PrefixArrayType, int, int, bool],
+) -> Tuple[int, PrefixArrayType]:
+    start, stop, extra, ex_start, ex_stop, summarize = task
+    prefixes, exclude_ranges = _shared
+    chunk = prefixes.slice(start, stop)
+    if extra:
+        chunk.extend(extra)
+        chunk = chunk.sorted()
+    result = apply_excludes(chunk, exclude_ranges[ex_start:ex_stop])
+    count = len(result)
+    if summarize:
+        result = aggregate_sorted(result, result.BITS, type(result)())
+    return count, result
+
 
-    result_networks = set()
+def _short_positions(prefixes: PrefixArrayType, max_len: int) -> List[int]:
+    """Номера префиксов с длиной не больше max_len (поиск по байтам длин)."""
+    table = bytes(int(length <= max_len) for length in range(256))
+    marks = prefixes.lens.tobytes().translate(table)
+    positions = []
+    pos = marks.find(1)
+    while pos >= 0:
+        positions.append(pos)
+        pos = marks.find(1, pos + 1)
+    return positions
 
-    for net in networks_list:
-        # Находим все исключения, которые перекрываются с этой сетью
-        relevant_excludes = [ex for ex in exclude_networks if ex.overlaps(net)]
-        result_networks.update(exclude_subnets(net, relevant_excludes))
 
-    if not result_networks:
-        print("Warning: No networks after processing", file=sys.stderr)
-        return
+def _split_positions(
+    prefixes: PrefixArrayType, positions: List[int]
+) -> Tuple[PrefixArrayType, PrefixArrayType]:
+    """Делит массив на префиксы с номерами из positions и остальные."""
+    selected, rest = type(prefixes)(), type(prefixes)()
+    previous = 0
+    for pos in positions:
+        rest.extend(prefixes.slice(previous, pos))
+        selected.extend(prefixes.slice(pos, pos + 1))
+        previous = pos + 1
+    rest.extend(prefixes.slice(previous, len(prefixes)))
+    return selected, rest
+
+
+def _chunk_bounds(prefixes: PrefixArrayType, chunks: int, shift: int) -> List[int]:
+    """Границы частей: номера префиксов, с которых начинаются блоки адресов."""
+    addresses = prefixes.addresses()
+    count = len(prefixes)
+    if not count:
+        return [0, 0]
+    bounds = [0]
+    for k in range(1, chunks):
+        block = addresses[k * count // chunks] >> shift
+        bound = bisect_left(addresses, block << shift)
+        if bound > bounds[-1]:
+            bounds.append(bound)
+    bounds.append(count)
+    return bounds
+
+
+def _range_slice(ranges: List[Range], start: int, end: int) -> Tuple[int, int]:
+    """Номера диапазонов [первый, последний + 1), пересекающих [start, end]."""
+    limit = (1 << 128) + 1
+    first = bisect_right(ranges, (start, limit)) - 1
+    if first < 0 or ranges[first][1] < start:
+        first += 1
+    return first, max(first, bisect_right(ranges, (end, limit)))
+
+
+def process_sharded(
+    prefixes: PrefixArrayType,
+    exclude_ranges: List[Range],
+    summarize: bool,
+    workers: int,
+) -> Tuple[int, PrefixArrayType]:
+    """
+    Исключает диапазоны и при необходимости суммаризует отсортированные
+    префиксы одного семейства в пуле из workers процессов. Результат совпадает
+    с обработкой в одном процессе. Возвращает число префиксов после исключений
+    и итоговый массив.
+    """
+    array_type, bits = type(prefixes), prefixes.BITS
+    shard_bits = SHARD_BITS[bits]
+    shift = bits - shard_bits
+
+    # Префиксы короче блока пересекают несколько частей: исключения к ним
+    # применяются здесь, а части, попадающие в один блок, раздаются по частям
+    short, prefixes = _split_positions(
+        prefixes, _short_positions(prefixes, shard_bits - 1)
+    )
+    short = apply_excludes(short, exclude_ranges)
+    global_prefixes = array_type()
+    if summarize:
+        global_prefixes, short = _split_positions(
+            short, _short_positions(short, shard_bits - 1)
+        )
+
+    bounds = _chunk_bounds(prefixes, workers * CHUNKS_PER_WORKER, shift)
+    addresses = prefixes.addresses()
+    # Начала адресных интервалов частей; первая часть начинается с нуля
+    starts = [0] + [(addresses[b] >> shift) << shift for b in bounds[1:-1]]
+    extras = [array_type() for _ in starts]
+    for addr, length in short:
+        extras[bisect_right(starts, addr) - 1].append(addr, length)
+
+    tasks = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] - 1 if i + 1 < len(starts) else (1 << bits) - 1
+        ex_start, ex_stop = _range_slice(exclude_ranges, start, end)
+        tasks.append(
+            (bounds[i], bounds[i + 1], extras[i], ex_start, ex_stop, summarize)
+        )
+
+    methods = multiprocessing.get_all_start_methods()
+    # При fork процессы получают массивы без копирования и сериализации
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with context.Pool(
+        workers, initializer=_init_shard_worker, initargs=(prefixes, exclude_ranges)
+    ) as pool:
+        results = pool.map(_process_shard, tasks, chunksize=1)
+
+    count = sum(chunk_count for chunk_count, _ in results) + len(global_prefixes)
+    if not summarize:
+        merged = array_type()
+        for _, chunk in results:
+            merged.extend(chunk)
+        return count, merged
+    return count, _merge_summarized([chunk for _, chunk in results], global_prefixes)
+
+
+def _merge_summarized(
+    chunks: List[PrefixArrayType], global_prefixes: PrefixArrayType
+) -> PrefixArrayType:
+    """
+    Сводит суммаризованные части: префиксы не длиннее блока (в том числе
+    из разных частей) агрегируются вместе, а префиксы частей, покрытые
+    результатом, отбрасываются. Остальные префиксы частей не меняются.
+    """
+    array_type, bits = type(global_prefixes), global_prefixes.BITS
+    shard_bits = SHARD_BITS[bits]
+    blocks = array_type()
+    blocks.extend(global_prefixes)
+    for chunk in chunks:
+        for pos in _short_positions(chunk, shard_bits):
+            blocks.append(*chunk._at(pos))
+    blocks = aggregate_sorted(blocks.sorted(), bits, array_type())
+    # Агрегированные блоки покрывают целые блоки адресов, поэтому префиксы
+    # частей внутри них вырезаются срезами по адресам
+    block_ranges = blocks.to_ranges()
+
+    pieces = [
+        (addr, array_type.from_prefixes([(addr, length)])) for addr, length in blocks
+    ]
+    for chunk in chunks:
+        if not chunk:
+            continue
+        addresses = chunk.addresses()
+        pos = 0
+        first, stop = _range_slice(
+            block_ranges, addresses[0], addresses[len(chunk) - 1]
+        )
+        for start, end in block_ranges[first:stop]:
+            cut = bisect_left(addresses, start, pos)
+            if cut > pos:
+                pieces.append((addresses[pos], chunk.slice(pos, cut)))
+            pos = bisect_right(addresses, end, cut)
+        if pos < len(chunk):
+            pieces.append((addresses[pos], chunk.slice(pos, len(chunk))))
+
+    result = array_type()
+    for _, piece in sorted(pieces, key=lambda item: item[0]):
+        result.extend(piece)
+    return result
+
+
+def _process_family(
+    prefixes: PrefixArrayType,
+    exclude_ranges: List[Range],
+    summarize: bool,
+    workers: int = 1,
+    max_routes: int = 0,
+) -> PrefixArrayType:
+    array_type, family = type(prefixes), prefixes.FAMILY
+    # Список IPv6 может быть пуст, если источники не содержат таких маршрутов
+    is_v6 = array_type is PrefixArray6
+    label = "IPv6 " if is_v6 else ""
+    set_metric("antibl_parsed_prefixes", len(prefixes), family=family)
+    if not prefixes:
+        if not is_v6:
+            print("Warning: No valid networks found after parsing", file=sys.stderr)
+        return prefixes
+
+    if workers > 1 and len(prefixes) >= MIN_SHARDED_PREFIXES:
+        print(f"Processing {label}networks in {workers} processes...")
+        with stage_timer(stage_name("sharded", prefixes)):
+            excluded, result = process_sharded(
+                prefixes, exclude_ranges, summarize, workers
+            )
+        set_metric("antibl_excludes_applied", len(exclude_ranges), family=family)
+        set_metric("antibl_routes_after_exclude", excluded, family=family)
+        if summarize and result:
+            print(
+                f"Summarization reduced networks from {excluded} to {len(result)} "
+                f"(saved {excluded - len(result)} entries)"
+            )
+        elif not result:
+            print(f"Warning: No {label}networks after processing", file=sys.stderr)
+        if max_routes:
+            result = apply_route_budget(result, max_routes, exclude_ranges)
+        return result
+
+    with stage_timer(stage_name("exclude", prefixes)):
+        result = apply_excludes(prefixes, exclude_ranges)
+    del prefixes
+    set_metric("antibl_excludes_applied", len(exclude_ranges), family=family)
+    set_metric("antibl_routes_after_exclude", len(result), family=family)
+
+    if not result:
+        print(f"Warning: No {label}networks after processing", file=sys.stderr)
+        return result
 
     # Применяем суммаризацию, если запрошено
     if summarize:
-        print("Applying network summarization...")
-        original_count = len(result_networks)
-        result_networks = set(summarize_networks(list(result_networks)))
-        final_count = len(result_networks)
+        print(f"Applying {label}network summarization...")
+        original_count = len(result)
+        with stage_timer(stage_name("summarize", result)):
+            result = summarize_prefixes(result)
+        final_count = len(result)
         print(
             f"Summarization reduced networks from {original_count} to {final_count} (saved {original_count - final_count} entries)"
         )
 
-    # Сортируем сети по возрастанию
-    sorted_networks = sorted(
-        result_networks, key=lambda x: (x.network_address, x.prefixlen)
-    )
-
-    # Записываем результат, обеспечивая уникальность строк
-    seen_networks = set()
-    try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            unique_networks = []
-            for net in sorted_networks:
-                net_str = str(net)
-                if net_str not in seen_networks:
-                    unique_networks.append(net_str)
-                    seen_networks.add(net_str)
-
-            # Записываем все строки, кроме последней, с переносом строки
-            for net_str in unique_networks[:-1]:
-                f.write(f"{net_str}\n")
-
-            # Записываем последнюю строку без переноса строки
-            if unique_networks:
-                f.write(unique_networks[-1])
-    except (IOError, OSError) as e:
-        print(f"Error writing output file {output_file}: {e}", file=sys.stderr)
-        raise
+    if max_routes:
+        result = apply_route_budget(result, max_routes, exclude_ranges)
+    return result
@@ -0,0 +1,194 @@
+"""
+Модуль с индексом итоговых маршрутов для поиска по наибольшему совпадению
+префикса. Индекс сохраняется после каждой сборки и читается подкомандой lookup
+без загрузки и обработки источников.
+"""
+
+import os
+import socket
+import sys
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from network.prefix_array import (
+    DualPrefixArray,
+    PrefixArray,
+    PrefixArray6,
+    PrefixArrayType,
+)
+from network.prefix_trie import PrefixTrie
+from network.writer import source_attribution
+from utils.array_file import load_array_file, save_array_file
+
+DEFAULT_INDEX_FILE = os.path.join(".cache", "route_index.bin")
+
+# Файл индекса (см. utils.array_file): время построения, имена источников
+# в метаданных и массивы в порядке _index_arrays
+ROUTE_INDEX_MAGIC = b"ABLI"
+ROUTE_INDEX_VERSION = 2
+
+# Источники префикса хранятся битовой маской uint64
+MAX_INDEX_SOURCES = 64
+
+
+class FamilyIndex:
+    """
+    Индекс маршрутов одного семейства: префиксы с масками источников и
+    сжатое двоичное дерево префиксов, значения узлов которого - номера
+    префиксов, для поиска по наибольшему совпадению.
+    """
+
+    __slots__ = ("prefixes", "masks", "trie")
+
+    def __init__(self, prefixes: PrefixArrayType):
+        self.prefixes = prefixes
+        self.masks = array("Q")
+        self.trie = PrefixTrie(type(prefixes)(), array("I"), array("I"), array("i"))
+
+    def build(self):
+        """Строит дерево по отсортированным префиксам за один проход."""
+        self.trie = PrefixTrie.from_sorted(self.prefixes)
+
+    def lookup(self, address: int) -> int:
+        """Возвращает номер самого длинного префикса, содержащего адрес, или -1."""
+        return self.trie.lookup(address)
+
+
+class RouteIndex:
+    """Индекс маршрутов обоих семейств с именами источников."""
+
+    __slots__ = ("v4", "v6", "sources", "built_at")
+
+    def __init__(
+        self,
+        v4: FamilyIndex,
+        v6: FamilyIndex,
+        sources: List[str],
+        built_at: int = 0,
+    ):
+        self.v4 = v4
+        self.v6 = v6
+        self.sources = sources
+        self.built_at = built_at
+
+    def __len__(self) -> int:
+        return len(self.v4.prefixes) + len(self.v6.prefixes)
+
+    def lookup(self, address: str) -> Optional[Tuple[str, List[str]]]:
+        """
+        Ищет адрес по наибольшему совпадению префикса. Возвращает префикс
+        и имена источников либо None. Неверный адрес вызывает ValueError.
+        """
+        family, value = parse_address(address)
+        index = self.v6 if family == socket.AF_INET6 else self.v4
+        owner = index.lookup(value)
+        if owner < 0:
+            return None
+        prefixes = index.prefixes
+        return (
+            prefixes.format(*prefixes._at(owner)),
+            self.source_names(index.masks[owner]),
+        )
+
+    def source_names(self, mask: int) -> List[str]:
+        """Возвращает имена источников по битовой маске префикса."""
+        return [name for bit, name in enumerate(self.sources) if mask >> bit & 1]
+
+
+def parse_address(address: str) -> Tuple[int, int]:
+    """Разбирает IPv4- или IPv6-адрес в пару (семейство, число)."""
+    address = address.strip()
+    family = socket.AF_INET6 if ":" in address else socket.AF_INET
+    try:
+        packed = socket.inet_pton(family, address)
+    except (OSError, ValueError):
+        raise ValueError(f"invalid IP address {address!r}")
+    return family, int.from_bytes(packed, "big")
+
+
+def build_route_index(
+    prefixes: DualPrefixArray, sources: Optional[Dict[str, DualPrefixArray]] = None
+) -> RouteIndex:
+    """
+    Строит индекс по отсортированным итоговым префиксам. sources - префиксы
+    источников по ключам кэша для указания происхождения маршрутов.
+    """
+    names = sorted(sources or {})
+    if len(names) > MAX_INDEX_SOURCES:
+        print(
+            f"Warning: Route index keeps only {MAX_INDEX_SOURCES} of "
+            f"{len(names)} sources",
+            file=sys.stderr,
+        )
+        names = names[:MAX_INDEX_SOURCES]
+    bits = {name: 1 << bit for bit, name in enumerate(names)}
+    families = []
+    for family in prefixes:
+        index = FamilyIndex(family)
+        index.build()
+        if names:
+            by_name = {name: sources[name].family(family) for name in names}
+            for owners in source_attribution(family, by_name):
+                index.masks.append(sum(bits[name] for name in owners))
+        else:
+            index.masks.extend([0] * len(family))
+        families.append(index)
+    return RouteIndex(families[0], families[1], names, int(time.time()))
+
+
+def _index_arrays(index: RouteIndex) -> List[array]:
+    v4, v6 = index.v4, index.v6
+    trie4, trie6 = v4.trie, v6.trie
+    return [
+        v6.prefixes.hi,
+        v6.prefixes.lo,
+        trie6.nodes.hi,
+        trie6.nodes.lo,
+        v4.masks,
+        v6.masks,
+        v4.prefixes.addrs,
+        trie4.nodes.addrs,
+        trie4.left,
+        trie4.right,
+        trie4.owners,
+        trie6.left,
+        trie6.right,
+        trie6.owners,
+        v4.prefixes.lens,
+        v6.prefixes.lens,
+        trie4.nodes.lens,
+        trie6.nodes.lens,
+    ]
+
+
+def save_route_index(index: RouteIndex, filename: str = DEFAULT_INDEX_FILE):
+    """Атомарно записывает индекс маршрутов в двоичный файл."""
+    save_array_file(
+        filename,
+        ROUTE_INDEX_MAGIC,
+        ROUTE_INDEX_VERSION,
+        index.built_at,
+        {"sources": index.sources},
+        _index_arrays(index),
+    )
+
+
+def load_route_index(filename: str = DEFAULT_INDEX_FILE) -> RouteIndex:
+    """Читает индекс маршрутов. Повреждённый файл вызывает ValueError."""
+    index = RouteIndex(FamilyIndex(PrefixArray()), FamilyIndex(PrefixArray6()), [])
+
+    def make_arrays(meta: Dict[str, Any]) -> List[array]:
+        index.sources = meta["sources"]
+        return _index_arrays(index)
+
+    index.built_at, _ = load_array_file(
+        filename, ROUTE_INDEX_MAGIC, ROUTE_INDEX_VERSION, make_arrays
+    )
+    for family in (index.v4, index.v6):
+        sizes = {len(data) for data in family.trie._arrays()}
+        if len(sizes) != 1 or not family.trie.owners:
+            raise ValueError("invalid prefix tree")
+        if len(family.masks) != len(family.prefixes):
+            raise ValueError("invalid source masks")
+    return index
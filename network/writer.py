@@ -0,0 +1,153 @@
+"""
+Модуль для записи итоговых маршрутов в формате BIRD.
+"""
+
+import os
+import sys
+from collections import namedtuple
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from network.intervals import prefix_to_range
+from network.parser import parse_dual_prefixes
+from network.prefix_array import DualPrefixArray, PrefixArrayType
+from utils.file_utils import write_file_atomic
+
+# Действия для маршрута в BIRD: reject и unreachable отвечают ICMP,
+# blackhole молча отбрасывает пакеты
+ROUTE_ACTIONS = ("reject", "unreachable", "blackhole")
+DEFAULT_ROUTE_ACTION = "reject"
+
+# Буфер записи файла маршрутов
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Итог записи: число маршрутов, изменения относительно прежнего файла
+# и признак того, что файл был перезаписан
+RouteDiff = namedtuple("RouteDiff", ["total", "added", "removed", "written"])
+
+
+def source_attribution(
+    prefixes: PrefixArrayType, sources: Dict[str, PrefixArrayType]
+) -> Iterator[List[str]]:
+    """
+    Для каждого префикса (в порядке сортировки) перебирает имена источников,
+    префиксы которых с ним пересекаются. Один проход по диапазонам каждого
+    источника.
+    """
+    bits = prefixes.BITS
+    cursors = [(name, src.to_ranges(), [0]) for name, src in sorted(sources.items())]
+    for addr, length in prefixes:
+        start, end = prefix_to_range(addr, length, bits)
+        names = []
+        for name, ranges, pos in cursors:
+            # Начала префиксов не убывают, поэтому указатель только растёт
+            i = pos[0]
+            while i < len(ranges) and ranges[i][1] < start:
+                i += 1
+            pos[0] = i
+            if i < len(ranges) and ranges[i][0] <= end:
+                names.append(name)
+        yield names
+
+
+def render_routes(
+    prefixes: PrefixArrayType,
+    action: str = DEFAULT_ROUTE_ACTION,
+    sources: Optional[Dict[str, PrefixArrayType]] = None,
+) -> Iterator[str]:
+    """
+    Перебирает строки конфигурации BIRD. Если переданы префиксы источников,
+    к каждому маршруту добавляется комментарий с их именами.
+    """
+    if action not in ROUTE_ACTIONS:
+        raise ValueError(f"unknown route action {action!r}")
+    suffix = f" {action};\n"
+    if not sources:
+        return (f"route {net}{suffix}" for net in prefixes.to_strings())
+    return (
+        f"route {net} {action}; # {', '.join(names)}\n"
+        for net, names in zip(
+            prefixes.to_strings(), source_attribution(prefixes, sources)
+        )
+    )
+
+
+def read_route_prefixes(filename: str) -> DualPrefixArray:
+    """Читает префиксы из ранее записанного файла маршрутов."""
+    if not os.path.exists(filename):
+        return DualPrefixArray()
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            nets = (line.split()[1] for line in f if line.startswith("route "))
+            prefixes, _ = parse_dual_prefixes(nets)
+    except (IOError, OSError, IndexError) as e:
+        print(f"Warning: Could not read previous {filename}: {e}", file=sys.stderr)
+        return DualPrefixArray()
+    return prefixes.unique()
+
+
+def iter_prefix_diff(
+    new: PrefixArrayType, old: PrefixArrayType
+) -> Iterator[Tuple[int, int]]:
+    """
+    Перебирает различия отсортированных массивов за один проход слиянием:
+    (1, номер в new) для добавленных и (-1, номер в old) для удалённых префиксов.
+    """
+    if new == old:
+        return
+    new_iter, old_iter = enumerate(new), enumerate(old)
+    a, b = next(new_iter, None), next(old_iter, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a[1] < b[1]):
+            yield 1, a[0]
+            a = next(new_iter, None)
+        elif a is None or b[1] < a[1]:
+            yield -1, b[0]
+            b = next(old_iter, None)
+        else:
+            a, b = next(new_iter, None), next(old_iter, None)
+
+
+def diff_prefixes(new: PrefixArrayType, old: PrefixArrayType) -> RouteDiff:
+    """Считает добавленные и удалённые префиксы слиянием отсортированных массивов."""
+    added = removed = 0
+    for sign, _ in iter_prefix_diff(new, old):
+        if sign > 0:
+            added += 1
+        else:
+            removed += 1
+    return RouteDiff(len(new), added, removed, False)
+
+
+def same_content(filename: str, lines: Iterator[str]) -> bool:
+    """Проверяет, совпадает ли файл с перебираемыми строками."""
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in lines:
+                if f.readline() != line:
+                    return False
+            return f.readline() == ""
+    except (IOError, OSError):
+        return False
+
+
+def write_bird_routes(
+    prefixes: PrefixArrayType,
+    output_file: str,
+    action: str = DEFAULT_ROUTE_ACTION,
+    sources: Optional[Dict[str, PrefixArrayType]] = None,
+) -> RouteDiff:
+    """
+    Записывает отсортированные префиксы одного семейства без повторов в файл
+    для BIRD за один буферизованный проход. Файл с тем же содержимым
+    не перезаписывается.
+    """
+    old = read_route_prefixes(output_file).family(prefixes)
+    diff = diff_prefixes(prefixes, old)
+    # Набор тот же: файл перезаписывается, только если изменился формат строк
+    if not diff.added and not diff.removed:
+        if same_content(output_file, render_routes(prefixes, action, sources)):
+            return diff
+    write_file_atomic(
+        output_file, render_routes(prefixes, action, sources), WRITE_BUFFER_SIZE
+    )
+    return diff._replace(written=True)
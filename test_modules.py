@@ -5,62 +5,729 @@
 
 import sys
 import os
+import socket
+import tempfile
+import threading
+import time
 
 
 def test_imports():
     """Тестирует импорт всех модулей."""
-    try:
-        from core.route_collector import collect_routes
-        from core.bird_manager import apply_bird_configuration
-        from fetchers.bgp_fetcher import get_routes_from_bgptools
-        from fetchers.tor_fetcher import get_routes_from_tor
-        from fetchers.github_fetcher import get_routes_from_github
-        from fetchers.antifilter_fetcher import get_routes_from_antifilter
-        from fetchers.twitter_fetcher import get_routes_from_twitter
-        from network.processor import process_networks_in_memory
-        from utils.cache import ensure_cache_dir, get_cached_data, save_to_cache
-        from utils.file_utils import get_file_hash, read_as_list
-
-        print("✓ Все модули успешно импортированы")
-        return True
-    except ImportError as e:
-        print(f"✗ Ошибка импорта: {e}")
-        return False
+    from core.route_collector import collect_routes
+    from core.bird_manager import apply_bird_configuration
+    from core.bird_client import BirdClient
+    from core.daemon import RouteDaemon
+    from fetchers.bgp_fetcher import get_routes_from_bgptools
+    from fetchers.tor_fetcher import get_routes_from_tor
+    from fetchers.github_fetcher import get_routes_from_github
+    from fetchers.antifilter_fetcher import get_routes_from_antifilter
+    from fetchers.twitter_fetcher import get_routes_from_twitter
+    from fetchers.base import fetch_source, get_session
+    from fetchers.registry import load_sources, source_configs
+    from network.processor import process_dual_prefixes
+    from network.intervals import exclude_prefixes, range_to_prefixes
+    from network.prefix_array import DualPrefixArray, PrefixArray, PrefixArray6
+    from network.parser import parse_prefixes
+    from network.route_index import build_route_index, load_route_index
+    from network.prefix_trie import PrefixTrie
+    from network.exclude_index import ExcludeIndex, load_exclude_index
+    from network.writer import render_routes, write_bird_routes
+    from utils.cache import ensure_cache_dir, get_cached_data, save_to_cache
+    from utils.file_utils import get_file_hash, read_as_list
+    from utils.metrics import record_source, set_metric, write_metrics
+    from benchmarks.server import SourceServer
+    from benchmarks.synthetic import generate_dataset
+
+    print("✓ Все модули успешно импортированы")
 
 
 def test_basic_functionality():
     """Тестирует базовую функциональность."""
+    from utils.cache import ensure_cache_dir
+    from utils.file_utils import get_file_hash
+
+    # Тест создания кэш директории
+    ensure_cache_dir()
+    assert os.path.exists(".cache"), "кэш директория не создана"
+    print("✓ Кэш директория создана успешно")
+
+    # Тест хеширования файла
+    test_content = "test content"
+    with open("test_file.txt", "w") as f:
+        f.write(test_content)
     try:
-        from utils.cache import ensure_cache_dir
-        from utils.file_utils import get_file_hash
+        assert get_file_hash("test_file.txt"), "хеширование файла не работает"
+    finally:
+        # Очистка
+        os.remove("test_file.txt")
+    print("✓ Хеширование файла работает")
 
-        # Тест создания кэш директории
-        ensure_cache_dir()
-        if os.path.exists(".cache"):
-            print("✓ Кэш директория создана успешно")
-        else:
-            print("✗ Кэш директория не создана")
-            return False
 
-        # Тест хеширования файла
-        test_content = "test content"
-        with open("test_file.txt", "w") as f:
-            f.write(test_content)
+def test_metrics():
+    """Тестирует выгрузку метрик в формате Prometheus."""
+    from utils.metrics import render_prometheus, reset_metrics, set_metric
+
+    reset_metrics()
+    try:
+        set_metric("antibl_source_routes", 42, source="tor")
+        assert 'antibl_source_routes{source="tor"} 42\n' in render_prometheus()
+    finally:
+        reset_metrics()
+    print("✓ Выгрузка метрик работает")
+
+
+def test_prefix_cache():
+    """Тестирует двоичный кэш префиксов IPv4 и IPv6."""
+    from network.processor import read_dual_prefixes_from_list
+    from utils.cache import (
+        _prefix_cache_file,
+        conditional_headers,
+        ensure_cache_dir,
+        load_prefix_cache,
+        save_prefix_cache,
+    )
+
+    ensure_cache_dir()
+    routes = ["10.0.0.0/8", "2001:db8::/32", "1.2.3.4/32"]
+    dual = read_dual_prefixes_from_list(routes).unique()
+    save_prefix_cache("selftest", dual, {"ETag": '"v1"'})
+    try:
+        cached = load_prefix_cache("selftest")
+        assert cached and cached[0] == dual and len(dual.v6) == 1
+        # Массивы кэша - представления отображённого файла, а не копии
+        assert isinstance(cached[0].v4.addrs, memoryview)
+        del cached
+        with open(_prefix_cache_file("selftest"), "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b"\xff")
+        corrupted = load_prefix_cache("selftest")
+        # Валидаторы читаются из метаданных, без чтения префиксов
+        headers = conditional_headers("selftest")
+    finally:
+        os.unlink(_prefix_cache_file("selftest"))
+    assert corrupted is None
+    assert headers == {"If-None-Match": '"v1"'}
+    print("✓ Двоичный кэш префиксов работает")
+
+
+def test_bird_writer():
+    """Тестирует запись маршрутов BIRD с комментариями источников."""
+    from network.processor import read_prefixes_from_list
+    from network.writer import render_routes
+
+    prefixes = read_prefixes_from_list(["10.0.0.0/8", "1.2.3.4/32"]).unique()
+    sources = {"tor": prefixes, "manual": read_prefixes_from_list(["10.1.0.0/16"])}
+    assert list(render_routes(prefixes, "blackhole", sources)) == [
+        "route 1.2.3.4/32 blackhole; # tor\n",
+        "route 10.0.0.0/8 blackhole; # manual, tor\n",
+    ]
+    print("✓ Запись маршрутов BIRD работает")
+
+
+def test_route_index():
+    """
+    Тестирует индекс маршрутов (наибольшее совпадение префикса и источники)
+    и журнал изменений между снимками маршрутов.
+    """
+    from network.history import iter_route_changes
+    from network.processor import read_dual_prefixes_from_list
+    from network.route_index import (
+        build_route_index,
+        load_route_index,
+        save_route_index,
+    )
+
+    nested = read_dual_prefixes_from_list(["10.0.0.0/8", "10.1.0.0/16"]).unique()
+    save_route_index(build_route_index(nested, {"manual": nested}), "selftest.idx")
+    try:
+        index = load_route_index("selftest.idx")
+    finally:
+        os.unlink("selftest.idx")
+    assert index.lookup("10.1.2.3") == ("10.1.0.0/16", ["manual"])
+    assert index.lookup("10.2.0.0") == ("10.0.0.0/8", ["manual"])
+    assert index.lookup("11.0.0.0") is None
+    print("✓ Индекс маршрутов работает")
+
+    current = read_dual_prefixes_from_list(["10.0.0.0/8", "2001:db8::/32"])
+    changes = iter_route_changes(
+        build_route_index(current.unique(), {"tor": current}), index
+    )
+    assert list(changes) == ["- 10.1.0.0/16 manual\n", "+ 2001:db8::/32 tor\n"]
+    print("✓ Журнал изменений маршрутов работает")
+
+
+def test_prefix_trie():
+    """
+    Тестирует сжатое двоичное дерево префиксов: массовую вставку, вставку
+    по одному, исключение диапазона, покрытие, наибольшее совпадение
+    и перебор префиксов по порядку.
+    """
+    from network.prefix_array import format_prefix
+    from network.prefix_trie import NO_OWNER, PrefixTrie
+    from network.processor import read_dual_prefixes_from_list
+
+    routes = read_dual_prefixes_from_list(
+        ["10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "192.0.2.0/24", "2001:db8::/32"]
+    ).unique()
+    trie = PrefixTrie.from_sorted(routes.v4)
+    assert list(trie) == list(routes.v4)
+    assert len(trie) == 4
+    assert trie.lookup(0x0A010203) == 2
+    assert trie.lookup(0x0A020000) == 0
+    assert trie.lookup(0x0B000000) == NO_OWNER
+    assert trie.longest_match(0x0A01FF00) == (0x0A010000, 16)
+    assert trie.covering(0x0A010200, 24) == (0x0A000000, 8)
+    assert (0x0A010000, 16) in trie and (0x0A010000, 17) not in trie
+    assert list(trie.iter_uncovered()) == [(0x0A000000, 8), (0xC0000200, 24)]
+
+    # Вставка по одному даёт то же дерево, что и массовая
+    single = PrefixTrie.empty()
+    single.update(reversed(list(routes.v4)))
+    assert list(single) == list(trie)
+
+    # Исключение 10.0.0.0/9 режет /8 на части и удаляет вложенные префиксы
+    trie.exclude(0x0A000000, 9)
+    assert [format_prefix(*prefix) for prefix in trie] == [
+        "10.128.0.0/9",
+        "192.0.2.0/24",
+    ]
+    assert trie.lookup(0x0A800001) == 0
+    assert not trie.is_covered(0x0A010000, 16)
+
+    trie6 = PrefixTrie.from_sorted(routes.v6)
+    assert trie6.longest_match(0x20010DB8 << 96 | 1) == (0x20010DB8 << 96, 32)
+    assert trie6.lookup(0x20010DB9 << 96) == NO_OWNER
+    print("✓ Дерево префиксов работает")
+
+
+def _selftest_routes():
+    """Набор маршрутов /16 с вложенными и перекрывающимися префиксами."""
+    from network.processor import read_prefixes_from_list
+
+    nets = [f"{i}.{j}.0.0/16" for i in range(1, 40) for j in range(0, 256, 3)]
+    nets += ["64.0.0.0/6", "10.0.0.0/9", "10.128.0.0/9"]
+    return nets, read_prefixes_from_list(nets).unique()
+
+
+def test_sharded_processing():
+    """Тестирует параллельную обработку: результат как в одном процессе."""
+    from network.intervals import aggregate_sorted
+    from network.prefix_array import PrefixArray
+    from network.processor import (
+        apply_excludes,
+        process_sharded,
+        read_prefixes_from_list,
+    )
+
+    _, routes = _selftest_routes()
+    ex_ranges = read_prefixes_from_list(["5.0.0.0/8", "66.1.0.0/16"]).to_ranges()
+    excluded = apply_excludes(routes, ex_ranges)
+    expected = PrefixArray.from_prefixes(aggregate_sorted(excluded))
+    assert process_sharded(routes, ex_ranges, True, 2) == (len(excluded), expected)
+    assert process_sharded(routes, ex_ranges, False, 2) == (len(excluded), excluded)
+    print("✓ Параллельная обработка работает")
+
+
+def test_asn_index():
+    """
+    Тестирует индекс таблицы bgp.tools: префиксы по номерам AS; кэш маршрутов
+    перезаписывается, только если они изменились.
+    """
+    from fetchers.asn_index import build_asn_index, iter_bgptools_table
+    from fetchers.base import _resolve_index
+    from utils.cache import _prefix_cache_file, ensure_cache_dir
+
+    table = [
+        b'{"CIDR":"10.1.0.0/16","ASN":64500,"Hits":1}',
+        b'{"CIDR":"2001:db8::/32","ASN":64500,"Hits":1}',
+        b'{"CIDR":"10.0.0.0/16","ASN":64500,"Hits":1}',
+        b'{"CIDR":"192.0.2.0/24","ASN":64501,"Hits":1}',
+    ]
+    index = build_asn_index(iter_bgptools_table(table))
+    resolved = index.resolve([64500, 64502])
+    assert [cidr for family in resolved for cidr in family.to_strings()] == [
+        "10.0.0.0/16",
+        "10.1.0.0/16",
+        "2001:db8::/32",
+    ]
+
+    ensure_cache_dir()
+    cache_file = _prefix_cache_file("selftest_asn")
+    try:
+        _resolve_index("selftest_asn", index, [64500])
+        written = os.stat(cache_file).st_mtime_ns
+        os.utime(cache_file, ns=(written - 10**9, written - 10**9))
+        _resolve_index("selftest_asn", index, [64500])
+        unchanged = os.stat(cache_file).st_mtime_ns
+        _resolve_index("selftest_asn", index, [64501])
+        changed = os.stat(cache_file).st_mtime_ns
+    finally:
+        if os.path.exists(cache_file):
+            os.unlink(cache_file)
+    assert unchanged == written - 10**9, "неизменные маршруты записаны заново"
+    assert changed != unchanged, "маршруты другого списка AS не записаны"
+    print("✓ Индекс таблицы bgp.tools работает")
+
+
+def test_emitters():
+    """Тестирует вывод наборов nftables и ipset из объединённых диапазонов."""
+    from network.emitters import render_ipset, render_nft
+    from network.prefix_array import DualPrefixArray
+    from network.processor import read_dual_prefixes_from_list
+
+    adjacent = read_dual_prefixes_from_list(
+        ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24", "10.0.3.0/25"]
+    ).unique()
+    nft = list(render_nft(adjacent, "t"))
+    ipset = list(render_ipset(adjacent, "t"))
+    assert "add element inet t t4 { 10.0.0.0-10.0.3.127 }\n" in nft
+    assert [line for line in ipset if line.startswith("add ")] == [
+        "add t4-new 10.0.0.0/23\n",
+        "add t4-new 10.0.2.0/24\n",
+        "add t4-new 10.0.3.0/25\n",
+    ]
+    # Рабочий набор создаётся с одними параметрами при любом числе префиксов
+    live = [line for line in ipset if line.startswith("create t4 ")]
+    assert live == [
+        line
+        for line in render_ipset(DualPrefixArray(), "t")
+        if line.startswith("create t4 ")
+    ]
+    assert live == ["create t4 hash:net family inet maxelem 16777216 -exist\n"]
+    print("✓ Вывод наборов nftables и ipset работает")
+
+
+def test_route_budget():
+    """
+    Тестирует ограничение числа маршрутов: дешёвые надсети, исключения
+    не задеты.
+    """
+    from network.budget import limit_routes
+    from network.processor import read_prefixes_from_list
+
+    spread = read_prefixes_from_list(
+        ["10.0.0.0/24", "10.0.2.0/24", "10.0.4.0/24", "10.0.6.0/24"]
+    ).unique()
+    budget_excludes = read_prefixes_from_list(["10.0.5.0/24"]).to_ranges()
+    limited, extra = limit_routes(spread, 3, budget_excludes)
+    blocked, _ = limit_routes(spread, 1, budget_excludes)
+    assert list(limited.to_strings()) == ["10.0.0.0/22", "10.0.4.0/24", "10.0.6.0/24"]
+    assert extra == 512
+    assert blocked == limited
+    print("✓ Ограничение числа маршрутов работает")
+
+
+def test_streaming():
+    """
+    Тестирует потоковую обработку: слияние источников, сортировку частями
+    со сбросом на диск и упорядоченные части исключений.
+    """
+    import network.prefix_array as prefix_array
+    from network.intervals import iter_excluded_sorted
+    from network.prefix_array import PrefixArray
+    from network.processor import apply_excludes, read_prefixes_from_list
+
+    first = read_prefixes_from_list(["10.0.0.0/8", "192.0.2.0/24"]).unique()
+    second = read_prefixes_from_list(["10.0.0.0/8", "10.1.0.0/16"]).unique()
+    merged = PrefixArray.merge([first, second])
+    assert list(merged.to_strings()) == [
+        "10.0.0.0/8",
+        "10.1.0.0/16",
+        "192.0.2.0/24",
+    ]
+
+    nets, routes = _selftest_routes()
+    unsorted = read_prefixes_from_list(nets[::-1] * 2)
+    chunk, prefix_array.UNIQUE_CHUNK = prefix_array.UNIQUE_CHUNK, 1000
+    try:
+        spilled = unsorted.unique()
+    finally:
+        prefix_array.UNIQUE_CHUNK = chunk
+    assert spilled == unsorted.slice(0, len(unsorted)).unique()
+    assert spilled == routes
+
+    nested_routes = read_prefixes_from_list(["10.0.0.0/8", "10.0.0.0/16"]).unique()
+    holes = read_prefixes_from_list(["10.0.0.0/24"]).to_ranges()
+    parts = list(iter_excluded_sorted(nested_routes, holes))
+    assert parts == sorted(set(parts))
+    assert PrefixArray.from_prefixes(parts) == apply_excludes(nested_routes, holes)
+    print("✓ Потоковая обработка работает")
+
 
-        hash_result = get_file_hash("test_file.txt")
-        if hash_result:
-            print("✓ Хеширование файла работает")
+def test_exclude_index():
+    """Тестирует индекс исключений: двоичный поиск и кэш по хешу списка."""
+    from network.exclude_index import load_exclude_index, save_exclude_index
+    from network.processor import compile_excludes
+    from utils.cache import ensure_cache_dir
+
+    ensure_cache_dir()
+    ex_index = compile_excludes(
+        ["10.0.0.0/24", "10.0.1.0/24", "2001:db8::/32"], "selftest"
+    )
+    save_exclude_index(ex_index, ".cache/selftest.ranges.bin")
+    try:
+        reloaded = load_exclude_index("selftest", ".cache/selftest.ranges.bin")
+        stale = load_exclude_index("changed", ".cache/selftest.ranges.bin")
+    finally:
+        os.unlink(".cache/selftest.ranges.bin")
+    assert reloaded == ex_index
+    assert stale is None
+    assert ex_index.ranges[0] == [(0x0A000000, 0x0A0001FF)]
+    assert ex_index.overlaps(0x0A0001FF, 0x0A0002FF)
+    assert not ex_index.overlaps(0x0A000200, 0x0A0002FF)
+    assert ex_index.overlaps(0x20010DB8 << 96, 0x20010DB8 << 96, 128)
+    print("✓ Индекс исключений работает")
+
+
+def test_conditional_requests():
+    """
+    Тестирует условные запросы: при ответе 304 используется кэш, а валидаторы
+    без записанных данных не сохраняются.
+    """
+    from benchmarks.server import SourceServer
+    from fetchers.base import fetch_prefixes, fetch_source
+    from fetchers.registry import validate_source
+    from utils.cache import _prefix_cache_file
+
+    server = SourceServer({"/list": b"10.0.0.0/8\n1.2.3.4\n", "/empty": b""})
+    server.start()
+    try:
+        source = validate_source(
+            {
+                "name": "selftest",
+                "url": server.url("/list"),
+                "parser": "lines",
+                "cache_key": "selftest_http",
+            }
+        )
+        fetched = fetch_prefixes(source)
+        # Тот же ETag: сервер ответит 304, новое тело не будет прочитано
+        server.files["/list"] = b"192.0.2.0/24\n"
+        revalidated = fetch_prefixes(source)
+        empty_source = dict(source, url=server.url("/empty"), parser="asns")
+        fetch_source(empty_source)
+    finally:
+        server.stop()
+        if os.path.exists(_prefix_cache_file("selftest_http")):
+            os.unlink(_prefix_cache_file("selftest_http"))
+        stale_meta = os.path.exists(".cache/selftest_http.meta.json")
+        if stale_meta:
+            os.unlink(".cache/selftest_http.meta.json")
+    assert list(revalidated.v4.to_strings()) == ["1.2.3.4/32", "10.0.0.0/8"]
+    assert revalidated == fetched
+    assert not stale_meta, "валидаторы сохранены без данных"
+    print("✓ Условные запросы работают")
+
+
+def test_concurrent_fetch():
+    """
+    Тестирует параллельную загрузку: ошибка и задержка одного источника
+    не мешают остальным, вместо них используется кэш.
+    """
+    from core.route_collector import fetch_sources
+    from network.processor import read_dual_prefixes_from_list
+
+    dual = read_dual_prefixes_from_list(["10.0.0.0/8", "2001:db8::/32"]).unique()
+
+    def broken():
+        raise ValueError("broken source")
+
+    def slow():
+        time.sleep(2)
+        return dual
+
+    started = time.monotonic()
+    collected = fetch_sources(
+        [
+            ("broken", "selftest_broken", broken),
+            ("slow", "selftest_slow", slow),
+            ("ok", "selftest_ok", lambda: dual),
+        ],
+        source_timeout=0.5,
+    )
+    assert time.monotonic() - started < 1.5
+    assert [name for name, _ in collected] == ["broken", "slow", "ok"]
+    assert [len(routes) for _, routes in collected] == [0, 0, len(dual)]
+    print("✓ Параллельная загрузка источников работает")
+
+
+def test_bgptools_stream():
+    """
+    Тестирует потоковый разбор table.jsonl: поля ищутся в сырых байтах,
+    номер AS сравнивается целиком, неверные строки пропускаются.
+    """
+    import fetchers.asn_index as asn_index_module
+    from fetchers.parsers import parse_bgptools
+
+    class StreamResponse:
+        def __init__(self, lines):
+            self.lines = lines
+
+        def iter_lines(self, chunk_size=None):
+            return iter(self.lines)
+
+    table = [
+        b'{"CIDR": "198.51.100.0/24", "ASN": 64500, "Hits": 3}',
+        b'{"ASN":645001,"CIDR":"203.0.113.0/24"}',
+        b'{"CIDR":"2001:db8:1::/48","ASN":64500}',
+        b'{"CIDR":"10.0.0.300/24","ASN":64500}',
+        b'{"ASN":64500}',
+        b"",
+    ]
+    table_index, counter = parse_bgptools(StreamResponse(table), {})
+    selected = table_index.resolve([64500])
+    # Те же строки, разобранные блоками по две, дают тот же индекс
+    chunk, asn_index_module.ASN_INDEX_CHUNK = asn_index_module.ASN_INDEX_CHUNK, 2
+    try:
+        chunked, _ = parse_bgptools(StreamResponse(table * 2), {})
+    finally:
+        asn_index_module.ASN_INDEX_CHUNK = chunk
+    assert counter == [len(table)]
+    assert [cidr for family in selected for cidr in family.to_strings()] == [
+        "198.51.100.0/24",
+        "2001:db8:1::/48",
+    ]
+    assert chunked.prefixes == table_index.prefixes
+    assert list(chunked.asns) == list(table_index.asns)
+    print("✓ Потоковый разбор таблицы bgp.tools работает")
+
+
+def test_exclude_prefixes():
+    """
+    Тестирует исключение подсетей: частичное пересечение, дыра в середине
+    префикса, полное покрытие и IPv6.
+    """
+    from network.intervals import exclude_prefixes
+    from network.prefix_array import format_prefix, format_prefix6
+    from network.processor import read_dual_prefixes_from_list
+
+    def excluded_cidrs(routes, excludes):
+        routes = read_dual_prefixes_from_list(routes)
+        excludes = read_dual_prefixes_from_list(excludes)
+        return [
+            format_prefix(*prefix)
+            for prefix in exclude_prefixes(routes.v4, excludes.v4)
+        ] + [
+            format_prefix6(*prefix)
+            for prefix in exclude_prefixes(routes.v6, excludes.v6, 128)
+        ]
+
+    assert excluded_cidrs(["10.0.0.0/25"], ["10.0.0.64/26", "10.0.0.128/25"]) == [
+        "10.0.0.0/26"
+    ]
+    assert excluded_cidrs(["10.1.0.0/20"], ["10.1.8.0/24"]) == [
+        "10.1.0.0/21",
+        "10.1.9.0/24",
+        "10.1.10.0/23",
+        "10.1.12.0/22",
+    ]
+    assert excluded_cidrs(["192.168.1.0/24"], ["192.168.0.0/16"]) == []
+    assert excluded_cidrs(["2001:db8::/46"], ["2001:db8:1::/48"]) == [
+        "2001:db8::/48",
+        "2001:db8:2::/47",
+    ]
+    print("✓ Исключение подсетей работает")
+
+
+def test_aggregation():
+    """
+    Тестирует суммаризацию: соседние сети объединяются, вложенные
+    отбрасываются.
+    """
+    from network.intervals import aggregate_prefixes, aggregate_sorted
+    from network.prefix_array import PrefixArray, format_prefix
+    from network.processor import read_prefixes_from_list
+
+    to_aggregate = read_prefixes_from_list(
+        [
+            "10.0.0.0/25",
+            "10.0.0.128/25",
+            "10.0.1.0/24",
+            "10.0.1.128/25",
+            "192.0.2.0/25",
+            "192.0.2.192/26",
+        ]
+    )
+    aggregated = aggregate_prefixes(to_aggregate)
+    assert [format_prefix(*prefix) for prefix in aggregated] == [
+        "10.0.0.0/23",
+        "192.0.2.0/25",
+        "192.0.2.192/26",
+    ]
+    # Результат можно собирать прямо в массив префиксов
+    aggregated_array = aggregate_sorted(to_aggregate.sorted(), 32, PrefixArray())
+    assert aggregated_array == PrefixArray.from_prefixes(aggregated)
+    print("✓ Суммаризация сетей работает")
+
+
+def _run_fake_bird(socket_path: str, replies: dict):
+    """Запускает поддельный BIRD, отвечающий на команды заготовленным текстом."""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        with conn, conn.makefile("rwb") as stream:
+            stream.write(b"0001 BIRD 2.0.12 ready.\n")
+            stream.flush()
+            for line in stream:
+                stream.write(replies[line.decode().strip()].encode())
+                stream.flush()
+        server.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+
+
+def test_bird_client():
+    """Тестирует клиент BIRD на поддельном управляющем сокете."""
+    from core.bird_client import BirdClient, BirdError
+
+    socket_path = os.path.join(tempfile.mkdtemp(), "bird.ctl")
+    _run_fake_bird(
+        socket_path,
+        {
+            "configure": "0002-Reading configuration from /etc/bird.conf\n"
+            "0003 Reconfigured\n",
+            "show route count": "0014 42 of 42 routes for 42 networks "
+            "in table master4\n",
+            "configure check": "8002 /etc/bird.conf:3:1 syntax error\n",
+        },
+    )
+    with BirdClient(socket_path) as client:
+        assert client.configure().code == 3
+        assert client.route_count() == 42
+        try:
+            client.configure(check_only=True)
+        except BirdError as e:
+            assert e.code == 8002, f"неверный код ошибки BIRD: {e.code}"
         else:
-            print("✗ Хеширование файла не работает")
-            return False
+            raise AssertionError("клиент BIRD не сообщил об ошибке конфигурации")
+    print("✓ Клиент BIRD работает")
 
-        # Очистка
-        os.remove("test_file.txt")
-        return True
 
-    except Exception as e:
-        print(f"✗ Ошибка тестирования: {e}")
-        return False
+def test_apply_routes():
+    """
+    Тестирует применение маршрутов: BIRD перечитывает конфигурацию, только
+    если файл маршрутов изменился с последнего успешного применения.
+    """
+    from core.bird_manager import apply_routes_file
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    try:
+        with open("routes.txt", "w") as f:
+            f.write("route 10.0.0.0/8 blackhole;\n")
+        socket_path = os.path.join(workdir, "bird.ctl")
+        _run_fake_bird(
+            socket_path,
+            {
+                "configure": "0003 Reconfigured\n",
+                "show route count": "0014 1 of 1 routes for 1 networks "
+                "in table master4\n",
+            },
+        )
+        applied = apply_routes_file("routes.txt", socket_path)
+        # Без сокета BIRD применение удаётся, только если оно пропущено
+        missing = os.path.join(workdir, "missing.ctl")
+        unchanged = apply_routes_file("routes.txt", missing)
+        with open("routes.txt", "a") as f:
+            f.write("route 10.1.0.0/16 blackhole;\n")
+        changed = apply_routes_file("routes.txt", missing)
+    finally:
+        os.chdir(cwd)
+    assert applied
+    assert unchanged
+    assert not changed
+    print("✓ Применение только изменившихся маршрутов работает")
+
+
+def test_daemon_apply_retry():
+    """
+    Тестирует повтор неудавшегося применения маршрутов в фоновом режиме,
+    даже если ни один источник не изменился.
+    """
+    import core.daemon as daemon_module
+
+    calls = []
+
+    def flaky_apply(*args):
+        calls.append(args)
+        return len(calls) > 1
+
+    daemon = daemon_module.RouteDaemon("routes.txt", apply=True)
+    # Ни один источник не обновляется до конца теста
+    daemon._next_refresh = {key: float("inf") for key in daemon._next_refresh}
+    apply, daemon_module.apply_routes_file = (
+        daemon_module.apply_routes_file,
+        flaky_apply,
+    )
+    try:
+        daemon._apply_routes()
+        assert daemon._apply_retry_at is not None
+        assert daemon._next_wait() <= daemon_module.APPLY_RETRY_INTERVAL
+        assert not daemon.cycle() and len(calls) == 1, "повтор раньше срока"
+        daemon._apply_retry_at = time.monotonic()
+        assert not daemon.cycle()
+        assert daemon._apply_retry_at is None
+        daemon.cycle()
+    finally:
+        daemon_module.apply_routes_file = apply
+    assert len(calls) == 2
+    print("✓ Повтор применения маршрутов работает")
+
+
+def test_arguments():
+    """Тестирует разбор аргументов командной строки."""
+    from main import build_parser
+    from network.route_index import DEFAULT_INDEX_FILE
+
+    parser = build_parser()
+    # Общие параметры можно указать и до, и после имени подкоманды
+    for argv in (
+        ["--apply", "-o", "/tmp/x.txt", "--summarize", "daemon"],
+        ["daemon", "--apply", "-o", "/tmp/x.txt", "--summarize"],
+    ):
+        args = parser.parse_args(argv)
+        assert args.apply, f"параметры потеряны при разборе {argv}"
+        assert args.output == "/tmp/x.txt", f"параметры потеряны при разборе {argv}"
+        assert args.summarize, f"параметры потеряны при разборе {argv}"
+    for argv in (
+        ["--index", "x.idx", "lookup", "1.2.3.4"],
+        ["lookup", "--index", "x.idx", "1.2.3.4"],
+    ):
+        assert parser.parse_args(argv).index == "x.idx", f"--index потерян в {argv}"
+    assert parser.parse_args(["lookup", "1.2.3.4"]).index == DEFAULT_INDEX_FILE
+    args = parser.parse_args(["daemon"])
+    assert not args.apply and args.output == "routes.txt"
+    print("✓ Разбор аргументов работает")
+
+
+TESTS = [
+    test_imports,
+    test_basic_functionality,
+    test_metrics,
+    test_prefix_cache,
+    test_bird_writer,
+    test_route_index,
+    test_prefix_trie,
+    test_sharded_processing,
+    test_asn_index,
+    test_emitters,
+    test_route_budget,
+    test_streaming,
+    test_exclude_index,
+    test_conditional_requests,
+    test_concurrent_fetch,
+    test_bgptools_stream,
+    test_exclude_prefixes,
+    test_aggregation,
+    test_bird_client,
+    test_apply_routes,
+    test_daemon_apply_retry,
+    test_arguments,
+]
 
 
 def main():
@@ -68,17 +735,18 @@ def main():
     print("Тестирование модулей antibl...")
     print("-" * 40)
 
-    # Тест импортов
-    if not test_imports():
-        print("Тест импортов не пройден")
-        return False
-
-    # Тест базовой функциональности
-    if not test_basic_functionality():
-        print("Тест базовой функциональности не пройден")
-        return False
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+        except Exception as e:
+            print(f"✗ {test.__name__}: {type(e).__name__}: {e}")
+            failed.append(test.__name__)
 
     print("-" * 40)
+    if failed:
+        print(f"✗ Не пройдено тестов: {len(failed)} ({', '.join(failed)})")
+        return False
     print("✓ Все тесты пройдены успешно!")
     return True
 
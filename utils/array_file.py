@@ -0,0 +1,170 @@
+"""
+Модуль двоичных файлов с массивами чисел (кэш префиксов, индексы маршрутов,
+AS и исключений).
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Any, BinaryIO, Callable, Dict, List, Sequence, Tuple
+
+from utils.file_utils import (
+    extend_from_little_endian,
+    to_little_endian,
+    write_bytes_atomic,
+)
+
+# Формат файла, все числа little-endian: заголовок (сигнатура, версия, резерв,
+# время, CRC32 данных, длина метаданных), метаданные в JSON (в том числе
+# размеры массивов), выравнивание до 8 байт, затем массивы по порядку.
+# Массивы с большим размером элемента идут первыми, чтобы все были выровнены
+_HEADER = struct.Struct("<4sHHQII")
+
+
+def save_array_file(
+    filename: str,
+    magic: bytes,
+    version: int,
+    timestamp: int,
+    meta: Dict[str, Any],
+    arrays: List[array],
+):
+    """Атомарно записывает метаданные и массивы в двоичный файл."""
+    meta = dict(meta, counts=[len(data) for data in arrays])
+    meta_bytes = json.dumps(meta).encode("utf-8")
+    padding = b"\0" * (-(_HEADER.size + len(meta_bytes)) % 8)
+    sections = [meta_bytes] + [to_little_endian(data) for data in arrays]
+    crc = 0
+    for section in sections:
+        crc = zlib.crc32(section, crc)
+    header = _HEADER.pack(magic, version, 0, timestamp, crc, len(meta_bytes))
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    write_bytes_atomic(filename, [header, meta_bytes, padding] + sections[1:])
+
+
+def _read_header(
+    f: BinaryIO, magic: bytes, version: int
+) -> Tuple[int, int, bytes, Dict[str, Any]]:
+    """Читает заголовок и метаданные: время, CRC32, метаданные в байтах и JSON."""
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("file is truncated")
+    file_magic, file_version, _, timestamp, crc, meta_len = _HEADER.unpack(header)
+    if file_magic != magic or file_version != version:
+        raise ValueError("unknown format")
+    meta_bytes = f.read(meta_len)
+    if len(meta_bytes) < meta_len:
+        raise ValueError("file is truncated")
+    return timestamp, crc, meta_bytes, json.loads(meta_bytes.decode("utf-8"))
+
+
+def load_array_file_meta(
+    filename: str, magic: bytes, version: int
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Читает только время из заголовка и метаданные, не читая и не проверяя
+    массивы. Файл другого формата вызывает ValueError.
+    """
+    with open(filename, "rb") as f:
+        timestamp, _, _, meta = _read_header(f, magic, version)
+    return timestamp, meta
+
+
+def _payload_offset(meta_bytes: bytes) -> int:
+    """Смещение первого массива: заголовок и метаданные, выровненные до 8 байт."""
+    offset = _HEADER.size + len(meta_bytes)
+    return offset + (-offset % 8)
+
+
+def _split_sections(
+    data: memoryview,
+    crc: int,
+    meta_bytes: bytes,
+    meta: Dict[str, Any],
+    arrays: List[array],
+) -> List[memoryview]:
+    """
+    Делит данные после заголовка на участки массивов по их размерам
+    из метаданных и проверяет размер файла и CRC32.
+    """
+    counts = meta.get("counts", [])
+    if len(counts) != len(arrays):
+        raise ValueError("array count does not match the format")
+    checksum = zlib.crc32(meta_bytes)
+    sections = []
+    offset = 0
+    for data_array, count in zip(arrays, counts):
+        end = offset + data_array.itemsize * count
+        if end > len(data):
+            raise ValueError("file is truncated")
+        section = data[offset:end]
+        checksum = zlib.crc32(section, checksum)
+        sections.append(section)
+        offset = end
+    if offset != len(data):
+        raise ValueError("file size does not match the header")
+    if checksum != crc:
+        raise ValueError("checksum mismatch")
+    return sections
+
+
+def load_array_file(
+    filename: str,
+    magic: bytes,
+    version: int,
+    make_arrays: Callable[[Dict[str, Any]], List[array]],
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Читает двоичный файл: make_arrays по метаданным возвращает пустые массивы,
+    которые заполняются данными файла. Возвращает время из заголовка
+    и метаданные. Повреждённый файл вызывает ValueError.
+    """
+    with open(filename, "rb") as f:
+        timestamp, crc, meta_bytes, meta = _read_header(f, magic, version)
+        f.seek(_payload_offset(meta_bytes))
+        data = memoryview(f.read())
+
+    arrays = make_arrays(meta)
+    for data_array, section in zip(
+        arrays, _split_sections(data, crc, meta_bytes, meta, arrays)
+    ):
+        extend_from_little_endian(data_array, section)
+    return timestamp, meta
+
+
+def map_array_file(
+    filename: str,
+    magic: bytes,
+    version: int,
+    make_arrays: Callable[[Dict[str, Any]], List[array]],
+) -> Tuple[int, Dict[str, Any], List[Sequence[int]]]:
+    """
+    То же, что load_array_file, но без копирования: файл отображается
+    в память только для чтения, и вместо заполнения массивов, полученных
+    от make_arrays (по ним определяются типы), возвращаются представления
+    memoryview участков файла тех же типов. Отображение живёт, пока есть
+    ссылки на представления. При порядке байтов big-endian многобайтовые
+    массивы копируются. Повреждённый файл вызывает ValueError.
+    """
+    with open(filename, "rb") as f:
+        timestamp, crc, meta_bytes, meta = _read_header(f, magic, version)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    arrays = make_arrays(meta)
+    data = memoryview(mm)[_payload_offset(meta_bytes) :]
+    views = []  # type: List[Sequence[int]]
+    for data_array, section in zip(
+        arrays, _split_sections(data, crc, meta_bytes, meta, arrays)
+    ):
+        if sys.byteorder == "little" or data_array.itemsize == 1:
+            views.append(section.cast(data_array.typecode))
+        else:
+            extend_from_little_endian(data_array, section)
+            views.append(data_array)
+    return timestamp, meta, views
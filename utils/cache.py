@@ -2,9 +2,22 @@
 Модуль для работы с кэшем файлов.
 """
 
+import json
 import os
 import sys
-from typing import List
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from network.prefix_array import DualPrefixArray, PrefixArray, PrefixArray6
+from utils.array_file import load_array_file_meta, map_array_file, save_array_file
+
+# Двоичный кэш префиксов (.cache/<источник>.bin, см. utils.array_file): время
+# записи в заголовке, источник и HTTP-валидаторы в метаданных, затем
+# отсортированные массивы: старшие и младшие половины адресов IPv6 (uint64),
+# адреса IPv4 (uint32), длины IPv4 и длины IPv6 (uint8)
+PREFIX_CACHE_MAGIC = b"ABLP"
+PREFIX_CACHE_VERSION = 3
 
 
 def ensure_cache_dir():
@@ -30,17 +43,173 @@ def get_cached_data(source: str) -> List[str]:
     return []
 
 
-def save_to_cache(source: str, data: List[str]):
-    """Сохраняет данные в кэш для указанного источника."""
+def save_to_cache(source: str, data: List[str]) -> bool:
+    """
+    Сохраняет данные в кэш для указанного источника.
+    Возвращает True, если кэш записан.
+    """
     if not data:
         print(f"Warning: No data to cache for {source}", file=sys.stderr)
-        return
+        return False
 
     cache_file = os.path.join(".cache", f"{source}.txt")
+    # Пишем во временный файл и атомарно подменяем: кэш могут читать параллельно
+    tmp_file = f"{cache_file}.tmp"
     try:
-        with open(cache_file, "w", encoding="utf-8") as f:
+        with open(tmp_file, "w", encoding="utf-8") as f:
             for item in data:
                 if item.strip():
                     f.write(f"{item}\n")
+        os.replace(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        print(f"Warning: Could not write cache file {cache_file}: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def get_cache_validators(source: str) -> Dict[str, str]:
+    """Получает сохранённые HTTP-валидаторы (ETag, Last-Modified) источника."""
+    meta_file = os.path.join(".cache", f"{source}.meta.json")
+    if os.path.exists(meta_file):
+        try:
+            with open(meta_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError) as e:
+            print(
+                f"Warning: Could not read cache metadata {meta_file}: {e}",
+                file=sys.stderr,
+            )
+    return {}
+
+
+def save_cache_validators(source: str, headers):
+    """Сохраняет HTTP-валидаторы ответа рядом с кэшем источника."""
+    meta = {
+        "etag": headers.get("ETag", ""),
+        "last_modified": headers.get("Last-Modified", ""),
+        "fetched_at": int(time.time()),
+    }
+    meta_file = os.path.join(".cache", f"{source}.meta.json")
+    tmp_file = f"{meta_file}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, meta_file)
+    except (IOError, OSError) as e:
+        print(
+            f"Warning: Could not write cache metadata {meta_file}: {e}",
+            file=sys.stderr,
+        )
+
+
+def conditional_headers(source: str) -> Dict[str, str]:
+    """
+    Формирует заголовки условного запроса для источника.
+    Заголовки не отправляются, если кэша нет.
+    """
+    if os.path.exists(_prefix_cache_file(source)):
+        meta = load_prefix_cache_meta(source)
+    elif os.path.exists(os.path.join(".cache", f"{source}.txt")):
+        meta = get_cache_validators(source)
+    else:
+        return {}
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+    return headers
+
+
+def _prefix_cache_file(source: str) -> str:
+    return os.path.join(".cache", f"{source}.bin")
+
+
+def _cache_arrays(prefixes: DualPrefixArray) -> List[array]:
+    # Порядок массивов в файле: сначала uint64, чтобы все были выровнены
+    return [
+        prefixes.v6.hi,
+        prefixes.v6.lo,
+        prefixes.v4.addrs,
+        prefixes.v4.lens,
+        prefixes.v6.lens,
+    ]
+
+
+def save_prefix_cache(source: str, prefixes: DualPrefixArray, headers=None):
+    """
+    Атомарно сохраняет отсортированные префиксы источника в двоичный кэш
+    вместе с HTTP-валидаторами ответа.
+    """
+    headers = headers or {}
+    meta = {
+        "source": source,
+        "etag": headers.get("ETag", ""),
+        "last_modified": headers.get("Last-Modified", ""),
+    }
+    cache_file = _prefix_cache_file(source)
+    try:
+        save_array_file(
+            cache_file,
+            PREFIX_CACHE_MAGIC,
+            PREFIX_CACHE_VERSION,
+            int(time.time()),
+            meta,
+            _cache_arrays(prefixes),
+        )
     except (IOError, OSError) as e:
         print(f"Warning: Could not write cache file {cache_file}: {e}", file=sys.stderr)
+
+
+def load_prefix_cache(
+    source: str,
+) -> Optional[Tuple[DualPrefixArray, Dict[str, str]]]:
+    """
+    Загружает двоичный кэш через mmap без разбора строк и копирования:
+    массивы префиксов читают данные прямо из отображения файла (только для
+    чтения). Возвращает префиксы и метаданные либо None, если кэша нет
+    или он повреждён.
+    """
+    cache_file = _prefix_cache_file(source)
+    if not os.path.exists(cache_file):
+        return None
+
+    def make_arrays(meta: Dict[str, Any]) -> List[array]:
+        return _cache_arrays(DualPrefixArray())
+
+    try:
+        timestamp, meta, arrays = map_array_file(
+            cache_file, PREFIX_CACHE_MAGIC, PREFIX_CACHE_VERSION, make_arrays
+        )
+    except (IOError, OSError, ValueError) as e:
+        print(
+            f"Warning: Ignoring invalid cache file {cache_file}: {e}", file=sys.stderr
+        )
+        return None
+    hi6, lo6, addrs4, lens4, lens6 = arrays
+    prefixes = DualPrefixArray(
+        PrefixArray(addrs4, lens4), PrefixArray6(hi6, lo6, lens6)
+    )
+    meta.pop("counts", None)
+    meta["fetched_at"] = timestamp
+    return prefixes, meta
+
+
+def load_prefix_cache_meta(source: str) -> Dict[str, str]:
+    """
+    Читает только метаданные двоичного кэша (HTTP-валидаторы) без загрузки
+    префиксов. Возвращает пустой словарь, если кэш не читается.
+    """
+    cache_file = _prefix_cache_file(source)
+    try:
+        timestamp, meta = load_array_file_meta(
+            cache_file, PREFIX_CACHE_MAGIC, PREFIX_CACHE_VERSION
+        )
+    except (IOError, OSError, ValueError) as e:
+        print(
+            f"Warning: Ignoring invalid cache file {cache_file}: {e}", file=sys.stderr
+        )
+        return {}
+    meta.pop("counts", None)
+    meta["fetched_at"] = timestamp
+    return meta
@@ -5,7 +5,9 @@
 import hashlib
 import os
 import sys
-from typing import Dict
+import tempfile
+from array import array
+from typing import Callable, Dict, Iterable
 
 
 def get_file_hash(filename: str) -> str:
@@ -23,6 +25,71 @@ def get_file_hash(filename: str) -> str:
         return ""
 
 
+def _replace_atomic(filename: str, write: Callable[[int], None]):
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_file = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp"
+    )
+    try:
+        write(fd)
+        # mkstemp создаёт файл с правами 0600, сохраняем права исходного файла
+        mode = 0o644
+        if os.path.exists(filename):
+            mode = os.stat(filename).st_mode & 0o777
+        os.chmod(tmp_file, mode)
+        os.replace(tmp_file, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+def write_file_atomic(filename: str, lines: Iterable[str], buffer_size: int = -1):
+    """
+    Записывает строки во временный файл рядом с целевым и атомарно заменяет им
+    целевой файл, чтобы читатели никогда не видели файл записанным наполовину.
+    buffer_size - размер буфера записи (по умолчанию системный).
+    """
+
+    def write(fd: int):
+        with os.fdopen(fd, "w", buffer_size, encoding="utf-8") as f:
+            f.writelines(lines)
+
+    _replace_atomic(filename, write)
+
+
+def write_bytes_atomic(filename: str, chunks: Iterable[bytes]):
+    """Атомарно записывает двоичные данные по частям (см. write_file_atomic)."""
+
+    def write(fd: int):
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(chunks)
+
+    _replace_atomic(filename, write)
+
+
+def to_little_endian(data: array) -> bytes:
+    """Возвращает содержимое массива чисел в порядке байтов little-endian."""
+    if sys.byteorder == "little" or data.itemsize == 1:
+        return data.tobytes()
+    swapped = array(data.typecode, data)
+    swapped.byteswap()
+    return swapped.tobytes()
+
+
+def extend_from_little_endian(data: array, raw: bytes):
+    """Дополняет массив числами, записанными в порядке little-endian."""
+    if sys.byteorder == "little" or data.itemsize == 1:
+        data.frombytes(raw)
+        return
+    values = array(data.typecode)
+    values.frombytes(raw)
+    values.byteswap()
+    data.extend(values)
+
+
 def read_as_list(filename: str) -> Dict[int, str]:
     """Читает список AS с комментариями."""
     as_list = {}
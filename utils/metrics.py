@@ -0,0 +1,175 @@
+"""
+Модуль для сбора метрик запуска и их выгрузки в формате Prometheus и JSON.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from utils.file_utils import write_file_atomic
+
+# Описания метрик: имя -> (тип, справка)
+METRICS = {
+    "antibl_source_duration_seconds": ("gauge", "Time spent fetching the source."),
+    "antibl_source_bytes": ("gauge", "Bytes downloaded from the source (compressed)."),
+    "antibl_source_lines": ("gauge", "Lines read from the source response."),
+    "antibl_source_routes": ("gauge", "Routes taken from the source."),
+    "antibl_source_up": ("gauge", "Whether the source answered successfully."),
+    "antibl_source_cache_hit": (
+        "gauge",
+        "Whether the source data was taken from the cache.",
+    ),
+    "antibl_source_cache_fallback": (
+        "gauge",
+        "Whether the cache was used because the source failed or timed out.",
+    ),
+    "antibl_stage_duration_seconds": ("gauge", "Time spent in a processing stage."),
+    "antibl_parsed_prefixes": ("gauge", "Unique prefixes parsed from all sources."),
+    "antibl_invalid_lines": ("gauge", "Source lines rejected by the parser."),
+    "antibl_excludes_applied": ("gauge", "Merged exclude ranges applied."),
+    "antibl_routes_after_exclude": ("gauge", "Prefixes left after exclusion."),
+    "antibl_budget_extra_addresses": (
+        "gauge",
+        "Addresses added by supernets to fit --max-routes.",
+    ),
+    "antibl_routes_final": ("gauge", "Routes written to the output file."),
+    "antibl_routes_added": ("gauge", "Routes added since the previous run."),
+    "antibl_routes_removed": ("gauge", "Routes removed since the previous run."),
+    "antibl_bird_apply_success": ("gauge", "Whether BIRD accepted the configuration."),
+    "antibl_bird_apply_skipped": (
+        "gauge",
+        "Whether BIRD reconfiguration was skipped because routes were unchanged.",
+    ),
+    "antibl_bird_apply_duration_seconds": ("gauge", "Time spent reconfiguring BIRD."),
+    "antibl_bird_routes": ("gauge", "Routes reported by BIRD after reconfiguration."),
+    "antibl_run_success": ("gauge", "Whether the last run completed successfully."),
+    "antibl_run_duration_seconds": ("gauge", "Duration of the last run."),
+    "antibl_last_run_timestamp_seconds": ("gauge", "Unix time of the last run."),
+}
+
+# Результаты загрузки источника
+FETCHED = "fetched"
+NOT_MODIFIED = "not_modified"
+CACHE_FALLBACK = "cache_fallback"
+FAILED = "failed"
+
+_values = {}  # type: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]
+_lock = threading.Lock()
+
+
+def set_metric(name: str, value: float, **labels: str):
+    """Устанавливает значение метрики с указанными метками."""
+    if name not in METRICS:
+        raise KeyError(f"Unknown metric: {name}")
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _values[key] = value
+
+
+def get_metric(name: str, **labels: str) -> Optional[float]:
+    """Возвращает значение метрики или None, если оно не записано."""
+    with _lock:
+        return _values.get((name, tuple(sorted(labels.items()))))
+
+
+def reset_metrics():
+    """Удаляет все записанные значения."""
+    with _lock:
+        _values.clear()
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Замеряет время стадии обработки."""
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        set_metric(
+            "antibl_stage_duration_seconds", time.monotonic() - started, stage=stage
+        )
+
+
+def record_source(
+    source: str, result: str, routes: int = 0, bytes_read: int = 0, lines: int = 0
+):
+    """Записывает результат загрузки источника (FETCHED, NOT_MODIFIED и т.д.)."""
+    set_metric(
+        "antibl_source_up", int(result in (FETCHED, NOT_MODIFIED)), source=source
+    )
+    set_metric(
+        "antibl_source_cache_hit",
+        int(result in (NOT_MODIFIED, CACHE_FALLBACK)),
+        source=source,
+    )
+    set_metric(
+        "antibl_source_cache_fallback", int(result == CACHE_FALLBACK), source=source
+    )
+    set_metric("antibl_source_routes", routes, source=source)
+    set_metric("antibl_source_bytes", bytes_read, source=source)
+    set_metric("antibl_source_lines", lines, source=source)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and not value.is_integer():
+        return repr(round(value, 6))
+    return str(int(value))
+
+
+def _snapshot() -> List[Tuple[str, Tuple[Tuple[str, str], ...], float]]:
+    with _lock:
+        return sorted(
+            (name, labels, value) for (name, labels), value in _values.items()
+        )
+
+
+def render_prometheus() -> List[str]:
+    """Формирует строки в текстовом формате Prometheus."""
+    lines = []
+    current = None
+    for name, labels, value in _snapshot():
+        if name != current:
+            metric_type, help_text = METRICS[name]
+            lines.append(f"# HELP {name} {help_text}\n")
+            lines.append(f"# TYPE {name} {metric_type}\n")
+            current = name
+        label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels)
+        if label_text:
+            label_text = f"{{{label_text}}}"
+        lines.append(f"{name}{label_text} {_format_value(value)}\n")
+    return lines
+
+
+def render_json() -> str:
+    """Формирует метрики в виде JSON-документа."""
+    metrics = [
+        {"name": name, "labels": dict(labels), "value": value}
+        for name, labels, value in _snapshot()
+    ]
+    return json.dumps({"timestamp": int(time.time()), "metrics": metrics}, indent=2)
+
+
+def write_metrics(textfile: Optional[str] = None, json_file: Optional[str] = None):
+    """
+    Атомарно записывает метрики в textfile для node-exporter и/или в JSON.
+    Ошибки записи не прерывают работу программы.
+    """
+    outputs = []
+    if textfile:
+        outputs.append((textfile, render_prometheus()))
+    if json_file:
+        outputs.append((json_file, [render_json(), "\n"]))
+    for filename, lines in outputs:
+        try:
+            write_file_atomic(filename, lines)
+        except (IOError, OSError) as e:
+            print(
+                f"Warning: Could not write metrics to {filename}: {e}", file=sys.stderr
+            )